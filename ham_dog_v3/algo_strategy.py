@@ -1,8 +1,6 @@
 import gamelib
 import random
-import math
 from sys import maxsize
-import json
 
 
 """
@@ -15,7 +13,8 @@ Advanced strategy tips:
 
   - The GameState.map object can be manually manipulated to create hypothetical 
   board states. Though, we recommended making a copy of the map to preserve 
-  the actual current map state.
+  the actual current map state. GameState.snapshot() and GameMap.fork() make
+  cheap copies, and checkpoint()/rollback() undo changes in place.
 """
 
 
@@ -34,12 +33,13 @@ class AlgoStrategy(gamelib.AlgoCore):
         self.config = config
         global WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, MP, SP 
         
-        WALL = config["unitInformation"][0]["shorthand"]
-        SUPPORT = config["unitInformation"][1]["shorthand"]
-        TURRET = config["unitInformation"][2]["shorthand"]
-        SCOUT = config["unitInformation"][3]["shorthand"]
-        DEMOLISHER = config["unitInformation"][4]["shorthand"]
-        INTERCEPTOR = config["unitInformation"][5]["shorthand"]
+        catalog = self.unit_catalog
+        WALL = catalog.WALL
+        SUPPORT = catalog.SUPPORT
+        TURRET = catalog.TURRET
+        SCOUT = catalog.SCOUT
+        DEMOLISHER = catalog.DEMOLISHER
+        INTERCEPTOR = catalog.INTERCEPTOR
         MP = 1
         SP = 0
 
@@ -73,6 +73,13 @@ class AlgoStrategy(gamelib.AlgoCore):
         self.built_supports = []
         self.upgraded_supports = []
 
+        # Paths are keyed by structure layout, so one cache can serve the whole game
+        self.path_cache = gamelib.PathCache()
+
+        # Action frames arrive parsed, and only the sections we read are decoded
+        self.parse_action_frames = True
+        self.action_frame_sections = ["events", "p2Units"]
+
     def on_turn(self, turn_state):
         """
         This function is called every turn with the game state wrapper as
@@ -81,7 +88,7 @@ class AlgoStrategy(gamelib.AlgoCore):
         unit deployments, and transmitting your intended deployments to the
         game engine.
         """
-        game_state = gamelib.GameState(self.config, turn_state)
+        game_state = gamelib.GameState(self.config, turn_state, self.path_cache, start_time=self.turn_started)
         gamelib.debug_write(
             "Performing turn {} of your custom algo strategy".format(
                 game_state.turn_number
@@ -94,7 +101,7 @@ class AlgoStrategy(gamelib.AlgoCore):
         self.SP = resources[0]
         self.MP = resources[1]
         self.damaged_locs, self.average_x = self.get_damaged_units(
-            game_state.game_map
+            game_state
         )
         # self.detect_demolishers(game_state)
 
@@ -145,7 +152,9 @@ class AlgoStrategy(gamelib.AlgoCore):
                 least_damage_res = self.least_damage_spawn_location(game_state, deploy_possible_arr)
                 least_damage_loc = least_damage_res[0]
                 least_damage_num = least_damage_res[1]
-                if least_damage_num > 120: # then they probably have good defense in general
+                if least_damage_loc is None: # every deploy location is blocked, keep the MP
+                    pass
+                elif least_damage_num > 120: # then they probably have good defense in general
                     if game_state.turn_number >= 10:
                         # go for the corners
                         # but first, do they have walls on the edges?
@@ -221,26 +230,18 @@ class AlgoStrategy(gamelib.AlgoCore):
                 arr += [[x, 13-x], [27-x, 13-x]]
         return arr
 
-    def get_damaged_units(self, game_map):
+    def get_damaged_units(self, game_state):
         """
         gets the locations of all damaged units on player's side
-        :input game_map: GameMap object
+        :input game_state: GameState object
         """
 
-        # TODO: debug
-        my_units = []
-        for coords in HOME_FIELD:
-            units_at_location = game_map[coords[0], coords[1]]
-            my_units += units_at_location
-        
         damaged_list = []
         average_x = 0
         # check if each unit is < 75% health
-        for unit in my_units:
-            if (unit.stationary and unit.max_health * 0.75 > unit.health and
-                    unit.pending_removal is False):
-                damaged_list.append([unit.x, unit.y])
-                average_x += unit.x
+        for unit in game_state.damaged_structures(0.75):
+            damaged_list.append([unit.x, unit.y])
+            average_x += unit.x
         if len(damaged_list) > 0:
             average_x /= len(damaged_list)
         
@@ -284,25 +285,14 @@ class AlgoStrategy(gamelib.AlgoCore):
 
 
 
-    def spawn_and_update(self, game_state, unit_type, locations):
-        """
-        Wrapper function that attempts spawning the units and then 
-        updates the SP variable
-        """
-        return_value = game_state.attempt_spawn(unit_type, locations)
-        resources = game_state.get_resources()
-        self.SP = resources[0]
-        return return_value
-
-    def upgrade_and_update(self, game_state, locations):
+    def execute_and_update(self, game_state, plan):
         """
-        Wrapper function that attempts upgrading the units and then 
+        Wrapper function that carries out a build plan and then
         updates the SP variable
         """
-        return_value = game_state.attempt_upgrade(locations)
-        resources = game_state.get_resources()
-        self.SP = resources[0]
-        return return_value
+        report = game_state.execute_plan(plan)
+        self.SP -= report.spent[0]
+        return report
 
     def build_defences(self, game_state):
         """
@@ -316,11 +306,11 @@ class AlgoStrategy(gamelib.AlgoCore):
         turret_locations_corner = [[23, 11], [4, 11]]
         turret_locations_mid = [[9, 7], [17, 7]]
         turret_locations = turret_locations_corner + turret_locations_mid
-        self.spawn_and_update(game_state, TURRET, turret_locations_corner +
-                              turret_locations_mid)
+        plan = gamelib.BuildPlan()
+        plan.spawn(TURRET, turret_locations_corner + turret_locations_mid)
 
         # upgrade turrets after they attack
-        self.upgrade_and_update(game_state, turret_locations)
+        plan.upgrade(turret_locations)
 
         wall_locations = []
 
@@ -332,12 +322,13 @@ class AlgoStrategy(gamelib.AlgoCore):
         for turret in turret_locations:
             wall_locations.append([turret[0], turret[1] + 1])
 
-        self.spawn_and_update(game_state, WALL, wall_locations)
+        plan.spawn(WALL, wall_locations)
         
         extra_front_walls = []
         # reinforced front line, which side to attempt to add
         if game_state.turn_number > 1:
-            extra_front_walls = self.reinforce_front(game_state)
+            extra_front_walls = self.reinforce_front(game_state, plan)
+        self.execute_and_update(game_state, plan)
 
         # wall upgrade logic
         front_line = wall_locations[:-4] + extra_front_walls
@@ -345,8 +336,10 @@ class AlgoStrategy(gamelib.AlgoCore):
         if game_state.turn_number > 7 and self.SP > 3: # 10, 7 was randomly derived, maybe room for improvement?
             # upgrade frontline walls first
             # upgrade the walls by front turrets
-            self.upgrade_and_update(game_state, front_line)
-            self.upgrade_and_update(game_state, turret_walls)
+            plan = gamelib.BuildPlan()
+            plan.upgrade(front_line)
+            plan.upgrade(turret_walls)
+            self.execute_and_update(game_state, plan)
 
         # begin the wings after turn 4
         if game_state.turn_number > 3:
@@ -356,9 +349,9 @@ class AlgoStrategy(gamelib.AlgoCore):
         if game_state.turn_number > 4:
             self.reinforce_mid(game_state)
 
-    def reinforce_front(self, game_state):
+    def reinforce_front(self, game_state, plan):
         """
-        adds two walls off the front side
+        adds two walls off the front side to the build plan
         decide if we want reinforce left or right first
         """
         right_corner = [[24, 13], [23, 13], [26, 12], [25, 12]]
@@ -373,7 +366,7 @@ class AlgoStrategy(gamelib.AlgoCore):
                 new_locations = right_corner + left_corner
             else:
                 new_locations = left_corner + right_corner
-        self.spawn_and_update(game_state, WALL, new_locations)
+        plan.spawn(WALL, new_locations)
         
         return new_locations
 
@@ -400,12 +393,13 @@ class AlgoStrategy(gamelib.AlgoCore):
             [18, 8]
         ]
 
+        plan = gamelib.BuildPlan()
         # if no resource constraint
         if self.SP > 9:
             both_wings = left_wing[:3] + right_wing[:3]
-            self.spawn_and_update(game_state, WALL, both_wings)
+            plan.spawn(WALL, both_wings)
             turret_wings = left_wing[3:] + right_wing[3:]
-            self.spawn_and_update(game_state, TURRET, turret_wings)
+            plan.spawn(TURRET, turret_wings)
         else:
             # check where opponent is breaching
             avg_x = 0
@@ -416,15 +410,14 @@ class AlgoStrategy(gamelib.AlgoCore):
                 avg_x /= len(self.scored_on_locations)
 
             if avg_x > 13.5:
-                self.spawn_and_update(game_state, TURRET, right_wing[3:])
-                self.spawn_and_update(game_state, TURRET, right_wing[3:])
-                self.spawn_and_update(game_state, WALL, left_wing[:3])
-                self.spawn_and_update(game_state, WALL, left_wing[:3])
+                plan.spawn(TURRET, right_wing[3:])
+                plan.spawn(WALL, left_wing[:3])
             else:
-                self.spawn_and_update(game_state, TURRET, left_wing[3:])
-                self.spawn_and_update(game_state, TURRET, right_wing[3:])
-                self.spawn_and_update(game_state, WALL, right_wing[:3])
-                self.spawn_and_update(game_state, WALL, left_wing[:3])
+                plan.spawn(TURRET, left_wing[3:])
+                plan.spawn(TURRET, right_wing[3:])
+                plan.spawn(WALL, right_wing[:3])
+                plan.spawn(WALL, left_wing[:3])
+        self.execute_and_update(game_state, plan)
 
     def reinforce_mid(self, game_state):
         """
@@ -441,7 +434,9 @@ class AlgoStrategy(gamelib.AlgoCore):
         for i in range(11, 16):
             middle_wall.append([i, 9])
         
-        self.spawn_and_update(game_state, WALL, middle_wall)
+        plan = gamelib.BuildPlan()
+        plan.spawn(WALL, middle_wall)
+        self.execute_and_update(game_state, plan)
 
         # add turrets if resource allows and we are damaged or REINFORCE flag 
         # is on
@@ -449,9 +444,11 @@ class AlgoStrategy(gamelib.AlgoCore):
             self.REINFORCE_MID = True
             walls = [[11, 11], [15, 11]]
             turrets = [[11, 10], [15, 10]]
-            self.spawn_and_update(game_state, TURRET, turrets)
-            self.upgrade_and_update(game_state, turrets)
-            self.spawn_and_update(game_state, WALL, walls)
+            plan = gamelib.BuildPlan()
+            plan.spawn(TURRET, turrets)
+            plan.upgrade(turrets)
+            plan.spawn(WALL, walls)
+            self.execute_and_update(game_state, plan)
 
     def build_support(self, game_state):
         """
@@ -477,24 +474,28 @@ class AlgoStrategy(gamelib.AlgoCore):
         
         # wall_number = built_number if built_number < 9 else 8
         wall_number = built_number if built_number < 6 else 5
-        for i in range(wall_number // 3 + 1):
-            self.spawn_and_update(game_state, WALL, support_wall_locations[i])
+        plan = gamelib.BuildPlan()
+        plan.spawn(WALL, support_wall_locations[:wall_number // 3 + 1])
 
         if built_number < locations: 
-            for i in range(built_number, locations):
-                test = self.spawn_and_update(game_state, SUPPORT,
-                                             self.support_locations[i])
-                if test == 0:
+            self.execute_and_update(game_state, plan)
+            # supports are built in order, stop at the first one that could not be built
+            for location in self.support_locations[built_number:]:
+                plan = gamelib.BuildPlan()
+                plan.spawn(SUPPORT, location)
+                if self.execute_and_update(game_state, plan).skipped:
                     break
-                else:
-                    self.built_supports.append(self.support_locations[i])
+                self.built_supports.append(location)
         else:
             self.built_supports = self.support_locations
-            self.spawn_and_update(game_state, SUPPORT, self.support_locations)
+            plan.spawn(SUPPORT, self.support_locations)
+            self.execute_and_update(game_state, plan)
         
         # upgrade after
         if len(self.built_supports) > 0 and self.SP > 10:
-            self.upgrade_and_update(game_state, self.built_supports)
+            plan = gamelib.BuildPlan()
+            plan.upgrade(self.built_supports)
+            self.execute_and_update(game_state, plan)
     
     def refund_damaged_units(self, game_state):
         """
@@ -518,25 +519,32 @@ class AlgoStrategy(gamelib.AlgoCore):
     def least_damage_spawn_location(self, game_state, location_options):
         """
         This function will help us guess which location is the safest to spawn moving units from.
-        It gets the path the unit will take then checks locations on that path to 
-        estimate the path's damage risk.
+        It plays the scout stack we can afford out along the path from every location
+        and returns the location whose units lose the least health. The damage returned
+        with it is the lowest defense score over all locations: 20 for every turret in
+        range of each location on the path, plus the health of a structure at its end.
+        Returns [None, 0] if no location has a path.
         """
+        stack = max(1, int(game_state.get_resource(MP)))
+        evaluator = gamelib.AttackEvaluator(game_state)
+        estimates = evaluator.evaluate([(location, SCOUT, stack) for location in location_options])
+        estimates = [estimate for estimate in estimates if estimate.path is not None]
+        if not estimates:
+            return [None, 0]
+        safest = min(estimates, key=lambda estimate: (estimate.hp_lost, -estimate.breaches))
+
+        # The corner attack in on_turn is tuned for this score, not for hp_lost
         damages = []
-        # Get the damage estimate each path will take
-        for location in location_options:
-            path = game_state.find_path_to_edge(location)
-            damage = 0
-            for path_location in path:
-                damage += len(game_state.get_attackers(path_location, 0)) * 20 # maybe a problem here because it assumes all turrets are not upgraded
-            if game_state.contains_stationary_unit(path[-1]):
-                damage += game_state.game_map[path[-1][0], path[-1][1]].health
+        for estimate in estimates:
+            damage = game_state.path_exposure(estimate.path).total_attackers * 20
+            blocker = game_state.contains_stationary_unit(estimate.path[-1])
+            if blocker:
+                damage += blocker.health
             damages.append(damage)
-        
-        # Now just return the location that takes the least damage
         gamelib.debug_write("lowest damage = " + str(min(damages)))
-        return [location_options[damages.index(min(damages))], min(damages)]
+        return [safest.location, min(damages)]
 
-    def on_action_frame(self, turn_string):
+    def on_action_frame(self, state):
         """
         This is the action frame of the game. This function could be called
         hundreds of times per turn and could slow the algo down so avoid putting
@@ -544,13 +552,12 @@ class AlgoStrategy(gamelib.AlgoCore):
         suggest it if you have time and experience.  Full doc on format of a
         game frame at in json-docs.html in the root of the Starterkit.
         """
-        # Read in string as json
-        state = json.loads(turn_string)
-        
+        # AlgoCore has parsed the frame already, see parse_action_frames
         if self.BEGIN:
             gamelib.util.debug_write(state)
             self.enemy_units = state['p2Units'] 
             self.BEGIN = False
+            self.action_frame_sections = ["events"]
 
         # Let's record at what position we get scored on
         events = state["events"]
@@ -8,7 +8,8 @@ The GameMap class in game_map.py represents the current game map. It can be used
 Investigating it is useful for any player that wants to access more information about the current state of the game. \n
 
 The GameUnit class in unit.py represetns a single unit. 
-Investigating it is useful for any player that wants to access information about units. \n
+Investigating it is useful for any player that wants to access information about units. 
+The UnitCatalog class in unit.py holds the unit types, costs and stats of the config, AlgoCore builds it once per game. \n
 
 The AlgoCore class in algocore.py handles communication with the game engine, and forms the bones of an algo. AlgoStrategy inherits from it. 
 Investigating it is useful for advanced players interested in getting data from the action phase or communicating directly with the game engine. \n
@@ -16,14 +17,46 @@ Investigating it is useful for advanced players interested in getting data from
 The Navigation class in navigation.py contains functions related to pathfinding, which are used by GameState in pathing related functions. 
 Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. \n 
 
-util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write().
+The ThreatMap class in threat_map.py holds the damage per frame structures deal on every location. 
+GameState.get_threat_map() builds one for the current turn and keeps it up to date as you build, GameState.path_exposure() reads a whole path from it. \n
+
+The ShieldMap class in shield_map.py holds the shield supports give on every location, GameState.path_shield() reads a whole path from it. \n
+
+The UnitRegistry class in unit_registry.py indexes the units of every player by type, see GameState.units() and GameState.damaged_structures(). \n
+
+The Simulator class in simulator.py plays out the action phase in python, so you can compare attacks without the game engine. \n
+
+The AttackEvaluator class in evaluator.py scores many (location, unit type, count) attack options against the board in one call. \n
+
+The BackgroundTasks class in background.py runs work between turns, AlgoCore hands its results to the next on_turn. \n
+
+The BuildPlan class in build_plan.py queues many spawns, upgrades and removals for GameState.execute_plan() to carry out in one pass. \n
+
+targeting.py resolves which unit an attacker targets with a single priority key, GameState.get_target() uses it. \n
+
+The TimeBudget class in time_budget.py runs anytime searches against the turn time limit, see GameState.time_budget(). \n
+
+timeline.py expands paths into the frames a mobile unit spends on each location, see GameState.frame_timelines(). \n
+
+util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write(), and leveled, buffered logging with log().
 """
 
 from .algocore import AlgoCore
 from .util import debug_write
 from .game_state import GameState
-from .unit import GameUnit
+from .unit import GameUnit, UnitCatalog, SelfDestruct
 from .game_map import GameMap
-
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+from .navigation import PathCache
+from .threat_map import ThreatMap, PathExposure
+from .shield_map import ShieldMap, PathShield
+from .simulator import Simulator, SimulationResult
+from .evaluator import AttackEvaluator, AttackEstimate
+from .time_budget import TimeBudget, TimeBudgetExceeded
+from .background import BackgroundTasks
+from .build_plan import BuildPlan, BuildReport, SkippedAction
+from .unit_registry import UnitRegistry
+from .targeting import target_key, pick_target
+from .timeline import FrameTimeline, get_frame_timeline
+
+__all__ = ["algocore", "background", "build_plan", "evaluator", "game_state", "game_map", "navigation", "shield_map", "simulator", "targeting", "threat_map", "time_budget", "timeline", "unit", "unit_registry", "util"]
  
\ No newline at end of file
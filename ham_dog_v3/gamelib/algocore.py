@@ -1,7 +1,9 @@
-import json
+import time
 
 from .game_state import GameState
-from .util import get_command, debug_write, BANNER_TEXT, send_command
+from .background import BackgroundTasks
+from .unit import get_unit_catalog
+from .util import get_command, debug_write, decode_json, decode_sections, log, set_log_buffering, BANNER_TEXT, send_command, WARNING
 
 class AlgoCore(object):
     """
@@ -10,10 +12,34 @@ class AlgoCore(object):
 
     Attributes :
         * config (JSON): json object containing information about the game
+        * unit_catalog (:obj: UnitCatalog): The unit types, costs and stats of the config, built before on_game_start is called.
+          Every GameState made from the same config shares it.
+        * turn_started (float): The time.perf_counter() value at which the current turn was received, pass it to GameState
+        * turn_times (list): A (turn number, seconds) pair for every turn played, the time on_turn took to return
+        * time_limit (float): The seconds a turn can take before it costs health, waitTimeBotSoft in the config
+        * time_warning (float): Turns taking more than this fraction of time_limit are reported with debug_write
+        * background (:obj: BackgroundTasks): Work to run between turns, submit tasks to it at the end of on_turn
+        * background_results (dict): The results of the background tasks that finished before the current turn, by key
+        * background_wait (float): The seconds a new turn waits for unfinished background tasks
+        * parse_action_frames (bool): If True, on_action_frame is passed the frame parsed into a dict instead of the string
+        * action_frame_sections (list): With parse_action_frames, only decode these top level sections of each frame,
+          for example ["events"]. turnInfo is always included. Every section is decoded if None.
+        * buffer_output (bool): If True, debug output is kept in memory and written once per turn and action phase, see util.set_log_buffering
 
     """
     def __init__(self):
         self.config = None
+        self.unit_catalog = None
+        self.turn_started = None
+        self.turn_times = []
+        self.time_limit = 10.0
+        self.time_warning = 0.5
+        self.background = BackgroundTasks()
+        self.background_results = {}
+        self.background_wait = 0.2
+        self.parse_action_frames = False
+        self.action_frame_sections = None
+        self.buffer_output = True
 
     def on_game_start(self, config):
         """
@@ -39,11 +65,44 @@ class AlgoCore(object):
         After each deploy phase, the game engine will run the action phase of the round.
         The action phase is made up of a sequence of distinct frames. 
         Each of these frames is sent to the algo in order. 
-        They can be handled in this function. 
+        They can be handled in this function. \n
+        The frame is a string, or a dict if parse_action_frames is set.
         """
         pass
 
 
+    def decode_action_frame(self, action_frame_string, turn_info=None):
+        """Gets what on_action_frame is passed for a frame, following parse_action_frames and action_frame_sections
+
+        Args:
+            action_frame_string: The action frame as sent by the engine
+            turn_info: The already decoded turnInfo of the frame, if any
+
+        Returns:
+            The string itself, the parsed frame, or a dict with only turnInfo and the selected sections
+
+        """
+        if not self.parse_action_frames:
+            return action_frame_string
+        if self.action_frame_sections is None:
+            return decode_json(action_frame_string)
+        frame = decode_sections(action_frame_string, self.action_frame_sections)
+        frame["turnInfo"] = turn_info if turn_info is not None else decode_sections(action_frame_string, ["turnInfo"]).get("turnInfo")
+        return frame
+
+    def record_turn_time(self, turn_number, seconds):
+        """Records the time a turn took, reporting turns that come close to time_limit.
+        Called by start after every on_turn.
+
+        Args:
+            turn_number: The turn that was played
+            seconds: The time on_turn took
+
+        """
+        self.turn_times.append((turn_number, seconds))
+        if seconds > self.time_limit * self.time_warning:
+            log(WARNING, "Turn {} took {:.2f}s of the {:.2f}s time limit", turn_number, seconds, self.time_limit)
+
     def start(self):
         """ 
         Start the parsing loop.
@@ -52,6 +111,7 @@ class AlgoCore(object):
         The algo continues this loop until it recieves the "End" turn message from the game.
         """
         debug_write(BANNER_TEXT)
+        set_log_buffering(self.buffer_output)
 
         while True:
             # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
@@ -61,27 +121,37 @@ class AlgoCore(object):
                 """
                 This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
                 """
-                parsed_config = json.loads(game_state_string)
+                parsed_config = decode_json(game_state_string)
+                self.time_limit = parsed_config.get("timingAndReplay", {}).get("waitTimeBotSoft", 10000) / 1000
+                self.unit_catalog = get_unit_catalog(parsed_config)
                 self.on_game_start(parsed_config)
             elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
-                stateType = int(state.get("turnInfo")[0])
+                received = time.perf_counter()
+                # Only turnInfo is needed to dispatch, action frames are decoded as the strategy asks
+                turn_info = decode_sections(game_state_string, ["turnInfo"]).get("turnInfo")
+                if turn_info is None:
+                    turn_info = decode_json(game_state_string).get("turnInfo")
+                stateType = int(turn_info[0])
                 if stateType == 0:
                     """
                     This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
                     deploy phase. Printing is handled by the provided functions.
                     """
+                    self.turn_started = received
+                    self.background_results = self.background.collect(self.background_wait)
                     self.on_turn(game_state_string)
+                    self.record_turn_time(int(turn_info[1]), time.perf_counter() - received)
                 elif stateType == 1:
                     """
                     If stateType == 1, this game_state_string string represents a single frame of an action phase
                     """
-                    self.on_action_frame(game_state_string)
+                    self.on_action_frame(self.decode_action_frame(game_state_string, turn_info))
                 elif stateType == 2:
                     """
                     This is the end game message. This means the game is over so break and finish the program.
                     """
                     debug_write("Got end state, game over. Stopping algo.")
+                    self.background.shutdown()
                     break
                 else:
                     """
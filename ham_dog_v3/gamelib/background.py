@@ -0,0 +1,94 @@
+import concurrent.futures
+
+from .util import log, ERROR
+
+
+class BackgroundTasks:
+    """Runs speculative work while the algo would otherwise wait, for example during the action phase.
+
+    Tasks run one at a time on a worker thread, or in a worker process if use_processes is True, in the order they
+    were submitted. AlgoCore collects the finished results when the next turn arrives and hands them to on_turn
+    through AlgoCore.background_results.
+
+    Tasks run alongside the main thread, so they must not change objects the main thread uses. Pass them a
+    GameState.snapshot() and return new objects instead. With use_processes the function, its arguments and its
+    result must be picklable.
+
+    Attributes :
+        * use_processes (bool): If tasks run in a worker process instead of a worker thread
+        * failures (int): The number of tasks that raised an exception
+
+    """
+    def __init__(self, use_processes=False):
+        """Sets up the task queue, the worker is started by the first submit
+
+        Args:
+            use_processes: Run tasks in a worker process. Avoids sharing the interpreter with the main thread,
+                but every task has to be pickled.
+
+        """
+        self.use_processes = use_processes
+        self.failures = 0
+        self._executor = None
+        self._tasks = {}
+
+    def submit(self, key, function, *args, **kwargs):
+        """Queues function(*args, **kwargs). A queued task with the same key that has not started yet is replaced.
+
+        Args:
+            key: The key the result is collected under
+            function: The work to run
+
+        """
+        previous = self._tasks.pop(key, None)
+        if previous is not None:
+            previous.cancel()
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._tasks[key] = self._executor.submit(function, *args, **kwargs)
+
+    def pending(self):
+        """Gets the number of tasks that have not finished yet
+        """
+        return len([task for task in self._tasks.values() if not task.done()])
+
+    def collect(self, timeout=0):
+        """Gets the results of the finished tasks and forgets every task.
+        Tasks that have not started by then are cancelled, a task still running is left to finish and its result dropped.
+
+        Args:
+            timeout: The seconds to wait for unfinished tasks
+
+        Returns:
+            A dict mapping the key of every task that finished to its result. Tasks that raised are left out.
+
+        """
+        tasks = self._tasks
+        self._tasks = {}
+        if tasks and timeout > 0:
+            concurrent.futures.wait(tasks.values(), timeout)
+        results = {}
+        for key, task in tasks.items():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                error = task.exception()
+                if error is None:
+                    results[key] = task.result()
+                else:
+                    self.failures += 1
+                    log(ERROR, "Background task {} failed: {!r}", key, error)
+        return results
+
+    def shutdown(self):
+        """Cancels the tasks that have not started and stops the worker
+        """
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks = {}
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
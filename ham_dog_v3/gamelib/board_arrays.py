@@ -0,0 +1,128 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .unit import get_unit_catalog
+
+
+class BoardArrays:
+    """An array backed view of the structures on a GameMap, for fast masked reductions. Requires numpy.
+
+    Every array has shape (ARENA_SIZE, ARENA_SIZE) and is indexed [x, y] like game_map[x, y].
+    The view follows the GameMap through its listeners, so it stays in sync with units spawned, upgraded or
+    removed through the map. Use GameMap.mark_changed after changing units in place.
+
+    Attributes :
+        * game_map (:obj: GameMap): The map this view follows
+        * unit_type (int8 array): Index into config["unitInformation"] of the structure at each location, -1 if there is none
+        * owner (int8 array): The player index owning the structure at each location, -1 if there is none
+        * health (float array): The current health of the structure at each location
+        * max_health (float array): The starting health of the structure at each location
+        * upgraded (bool array): If the structure at each location is upgraded
+        * pending_removal (bool array): If the structure at each location is marked for removal by its owner
+
+    """
+    def __init__(self, game_map):
+        """Fills the arrays from the map and starts listening for changes
+
+        Args:
+            game_map: The GameMap to follow
+
+        """
+        self.game_map = game_map
+        size = game_map.ARENA_SIZE
+        self._type_indexes = get_unit_catalog(game_map.config).type_index
+        self.unit_type = np.full((size, size), -1, dtype=np.int8)
+        self.owner = np.full((size, size), -1, dtype=np.int8)
+        self.health = np.zeros((size, size), dtype=np.float64)
+        self.max_health = np.zeros((size, size), dtype=np.float64)
+        self.upgraded = np.zeros((size, size), dtype=bool)
+        self.pending_removal = np.zeros((size, size), dtype=bool)
+        for index in range(size * size):
+            if game_map.structure_occupancy[index]:
+                self.refresh(index % size, index // size)
+        game_map.add_listener(self.refresh)
+
+    def refresh(self, x, y):
+        """Re-reads a single location. Called by the GameMap whenever a location changes.
+
+        Args:
+            x: The x coordinate of the changed location
+            y: The y coordinate of the changed location
+
+        """
+        for unit in self.game_map._peek(x, y):
+            if unit.stationary:
+                self.unit_type[x, y] = self._type_indexes[unit.unit_type]
+                self.owner[x, y] = unit.player_index
+                self.health[x, y] = unit.health
+                self.max_health[x, y] = unit.max_health
+                self.upgraded[x, y] = unit.upgraded
+                self.pending_removal[x, y] = unit.pending_removal
+                return
+        self.unit_type[x, y] = -1
+        self.owner[x, y] = -1
+        self.health[x, y] = 0
+        self.max_health[x, y] = 0
+        self.upgraded[x, y] = False
+        self.pending_removal[x, y] = False
+
+    def detach(self):
+        """Stops following changes to the GameMap
+        """
+        self.game_map.remove_listener(self.refresh)
+
+    def type_index(self, unit_type):
+        """Gets the value unit_type holds for a given unit type
+
+        Args:
+            unit_type: A unit type shorthand, WALL, TURRET, etc.
+
+        Returns:
+            The index of the unit type in config["unitInformation"]
+
+        """
+        return self._type_indexes[unit_type]
+
+    def mask(self, player_index=None, unit_type=None):
+        """Gets a boolean array selecting structures
+
+        Args:
+            player_index: Only select structures of this player, 0 for you 1 for the enemy. Any player if None.
+            unit_type: Only select structures of this type. Any structure if None.
+
+        Returns:
+            A boolean array, True where a selected structure stands
+
+        """
+        selected = self.unit_type >= 0
+        if player_index is not None:
+            selected &= self.owner == player_index
+        if unit_type is not None:
+            selected &= self.unit_type == self._type_indexes[unit_type]
+        return selected
+
+    def count(self, player_index=None, unit_type=None):
+        """The number of structures matching the filters of mask()
+        """
+        return int(np.count_nonzero(self.mask(player_index, unit_type)))
+
+    def total_health(self, player_index=None, unit_type=None):
+        """The summed health of the structures matching the filters of mask()
+        """
+        return float(self.health[self.mask(player_index, unit_type)].sum())
+
+    def damaged_locations(self, player_index=0, threshold=1.0):
+        """Gets the locations of structures below a fraction of their starting health, skipping those pending removal
+
+        Args:
+            player_index: The player whose structures are checked
+            threshold: Structures with health < threshold * max_health are damaged
+
+        Returns:
+            A list of [x, y] locations
+
+        """
+        damaged = self.mask(player_index) & (self.health < self.max_health * threshold) & ~self.pending_removal
+        return [[int(x), int(y)] for x, y in zip(*np.nonzero(damaged))]
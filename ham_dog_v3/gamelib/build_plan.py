@@ -0,0 +1,117 @@
+from collections import namedtuple
+
+# A plan entry that was not carried out, and why
+SkippedAction = namedtuple("SkippedAction", ["action", "unit_type", "location", "reason"])
+
+# The reasons an entry is skipped
+INVALID_UNIT = "Invalid unit type"
+OUT_OF_BOUNDS = "Location invalid"
+ENEMY_TERRITORY = "Location in enemy territory"
+NOT_ON_EDGE = "Information units must be deployed on the edge"
+BLOCKED = "Location is blocked"
+NOT_AFFORDABLE = "Not enough resources"
+NO_STRUCTURE = "Location has no structures"
+ALREADY_UPGRADED = "Structure is already upgraded"
+NOT_UPGRADABLE = "Structure has no upgrade"
+ALREADY_REMOVED = "Structure is already flagged for removal"
+
+
+class BuildPlan:
+    """A list of spawns, upgrades and removals to carry out together with GameState.execute_plan.
+
+    Strategies queue everything they would like to build this turn, each with a priority, and the GameState then
+    resolves the whole plan in a single pass: entries with a higher priority go first, entries with the same priority
+    in the order they were queued. Entries that can not be carried out, for example because the resources ran out,
+    are skipped and listed in the BuildReport instead of warned about.
+
+    Attributes :
+        * SPAWN (str): The action of a spawn entry
+        * UPGRADE (str): The action of an upgrade entry
+        * REMOVE (str): The action of a removal entry
+
+    """
+    SPAWN = "spawn"
+    UPGRADE = "upgrade"
+    REMOVE = "remove"
+
+    def __init__(self):
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __add(self, action, unit_type, locations, num, priority):
+        if locations and type(locations[0]) == int:
+            locations = [locations]
+        for location in locations:
+            self._entries.append((-priority, len(self._entries), action, unit_type, [int(location[0]), int(location[1])], num))
+
+    def spawn(self, unit_type, locations, num=1, priority=0):
+        """Queues units to spawn
+
+        Args:
+            unit_type: The type of unit to spawn
+            locations: A single location or list of locations to spawn units at
+            num: The number of units to spawn on each location, mobile units only
+            priority: Entries with a higher priority are resolved first
+
+        """
+        self.__add(self.SPAWN, unit_type, locations, num, priority)
+
+    def upgrade(self, locations, priority=0):
+        """Queues structures to upgrade, including structures spawned earlier in the plan
+
+        Args:
+            locations: A single location or list of locations to upgrade structures at
+            priority: Entries with a higher priority are resolved first
+
+        """
+        self.__add(self.UPGRADE, None, locations, 1, priority)
+
+    def remove(self, locations, priority=0):
+        """Queues structures to remove
+
+        Args:
+            locations: A single location or list of locations to remove structures from
+            priority: Entries with a higher priority are resolved first
+
+        """
+        self.__add(self.REMOVE, None, locations, 1, priority)
+
+    def entries(self):
+        """Gets the queued entries in the order they are resolved
+
+        Returns:
+            A list of (action, unit_type, location, num) tuples. unit_type is None for upgrades and removals.
+
+        """
+        return [entry[2:] for entry in sorted(self._entries)]
+
+
+class BuildReport:
+    """What GameState.execute_plan did with a BuildPlan
+
+    Attributes :
+        * spawned (list): (unit_type, location, count) for every spawn entry carried out, count is less than asked when the resources ran out
+          and the shortfall is also listed in skipped
+        * upgraded (list): The locations of the structures upgraded
+        * removed (list): The locations of the structures flagged for removal
+        * skipped (list): A SkippedAction for every entry that was not carried out
+        * spent (list): The [SP, MP] the plan cost
+
+    """
+    def __init__(self):
+        self.spawned = []
+        self.upgraded = []
+        self.removed = []
+        self.skipped = []
+        self.spent = [0, 0]
+
+    def spawned_at(self, location):
+        """Gets the number of units the plan spawned on a location
+        """
+        return sum(count for _, spawn_location, count in self.spawned if spawn_location == [location[0], location[1]])
+
+    def __repr__(self):
+        return "BuildReport({} spawned, {} upgraded, {} removed, {} skipped, {} spent)".format(
+            sum(count for _, _, count in self.spawned), len(self.upgraded), len(self.removed), len(self.skipped), self.spent)
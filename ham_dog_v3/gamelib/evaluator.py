@@ -0,0 +1,261 @@
+import math
+from collections import namedtuple
+
+from .simulator import Simulator
+from .timeline import get_frame_timeline
+
+# The expected outcome of one attack option
+AttackEstimate = namedtuple("AttackEstimate", ["location", "unit_type", "count", "path", "damage_dealt", "hp_lost", "breaches"])
+
+
+class _PathProfile:
+    """What a mobile unit meets on every step of a path, shared by every option spawning on the same location"""
+    __slots__ = ("path", "attackers", "shields", "targets", "ends_on_edge")
+
+
+class AttackEvaluator:
+    """Scores many candidate attacks against the same board in one call.
+
+    Options spawning on the same location share a single path and a single profile of the turrets, supports and
+    enemy structures met on every step of it, so most of the work is done once per location rather than once per option.
+    Each option is then played out on its profile with simple arithmetic: turrets focus one unit at a time, units
+    shield as they walk past supports and the whole group attacks the closest enemy structures in range. Turrets destroyed
+    on the way stop attacking, but paths are not recomputed. Use exact=True to play every option out with the Simulator instead.
+
+    The structures are read once from the GameState. Make a new evaluator after building.
+
+    Attributes :
+        * game_state (:obj: GameState): The GameState the options are evaluated on
+        * player_index (int): The player sending the units, 0 for you 1 for the enemy
+        * ARENA_SIZE (int): The size of the arena
+
+    """
+    def __init__(self, game_state, player_index=0):
+        """Reads the structures on the board of a GameState
+
+        Args:
+            game_state: The GameState to evaluate attacks on
+            player_index: The player sending the units, 0 for you 1 for the enemy
+
+        """
+        self.game_state = game_state
+        self.player_index = player_index
+        self.ARENA_SIZE = game_state.ARENA_SIZE
+        game_map = game_state.game_map
+        size = self.ARENA_SIZE
+
+        self._edges = [set(y * size + x for x, y in edge) for edge in game_map.get_edges()]
+        self._profiles = {}
+        self._in_range = {}
+        self._simulator = None
+
+        # Enemy structures by location index, the turret attacks landing on each location and the supports of the attacker
+        self._structure_health = {}
+        self._attackers = {}
+        self._supports = []
+        for x in range(size):
+            for y in range(size):
+                index = y * size + x
+                if not game_map.structure_occupancy[index]:
+                    continue
+                for unit in game_map._peek(x, y):
+                    if unit.stationary:
+                        self.__add_structure(unit, index)
+                        break
+
+    def __add_structure(self, unit, index):
+        if unit.player_index == self.player_index:
+            if unit.shieldPerUnit > 0 or unit.shieldRange > 0:
+                reach = set(target_index for target_index, _ in self.__tiles_in_range(index, unit.shieldRange))
+                self._supports.append((reach, unit.shield_amount(self.ARENA_SIZE)))
+            return
+        self._structure_health[index] = unit.health
+        if unit.damage_i > 0:
+            # Structures attack mobile units within their range, without the hit radius, like ThreatMap
+            for target_index, distance in self.__tiles_in_range(index, unit.attackRange):
+                if distance <= unit.attackRange:
+                    self._attackers.setdefault(target_index, []).append((index, unit.damage_i))
+
+    def __tiles_in_range(self, index, radius):
+        """Yields (index, distance) for every arena location in range of a location
+        """
+        size = self.ARENA_SIZE
+        x, y = index % size, index // size
+        mask = self.game_state.game_map._arena_mask
+        for dx, dy in self.game_state.game_map.get_range_offsets(radius):
+            i = x + dx
+            j = y + dy
+            if 0 <= i < size and 0 <= j < size and mask[j * size + i]:
+                yield j * size + i, math.sqrt(dx ** 2 + dy ** 2)
+
+    def simulator(self):
+        """The Simulator used by evaluate(exact=True), built the first time it is needed
+        """
+        if self._simulator is None:
+            self._simulator = Simulator(self.game_state)
+        return self._simulator
+
+    def evaluate(self, options, exact=False):
+        """Estimates the outcome of every option, as if each was the only attack this turn
+
+        Args:
+            options: A list of (location, unit_type, count) options
+            exact: If True, play every option out with the Simulator. Slower, but follows repathing and self destructs exactly.
+
+        Returns:
+            A list with an AttackEstimate for each option, in the same order. Options on blocked locations get a path of None
+            and no outcome.
+
+        """
+        self.__profile_locations([option[0] for option in options])
+        estimates = []
+        for location, unit_type, count in options:
+            profile = self._profiles[location[0], location[1]]
+            if profile is None:
+                estimates.append(AttackEstimate(location, unit_type, count, None, 0.0, 0.0, 0))
+            elif exact:
+                result = self.simulator().simulate([(unit_type, location, count, self.player_index)])
+                estimates.append(AttackEstimate(location, unit_type, count, profile.path, result.structure_damage[self.player_index],
+                                                result.hp_lost[self.player_index], result.breaches[self.player_index]))
+            else:
+                estimates.append(self.__estimate(profile, location, unit_type, count))
+        return estimates
+
+    def best(self, options, key=None, exact=False):
+        """Evaluates the options and returns the best estimate
+
+        Args:
+            options: A list of (location, unit_type, count) options
+            key: Scores an AttackEstimate, higher is better. Defaults to breaches, then damage dealt, then the least hp lost.
+            exact: Passed on to evaluate
+
+        Returns:
+            The AttackEstimate with the highest score, None if there are no options
+
+        """
+        if key is None:
+            key = lambda estimate: (estimate.breaches, estimate.damage_dealt, -estimate.hp_lost)
+        estimates = [estimate for estimate in self.evaluate(options, exact) if estimate.path is not None]
+        return max(estimates, key=key) if estimates else None
+
+    def __profile_locations(self, locations):
+        """Builds the profile of every location not seen yet, finding all of their paths together
+        """
+        missing = []
+        for location in locations:
+            key = (location[0], location[1])
+            if key not in self._profiles:
+                self._profiles[key] = None
+                missing.append([location[0], location[1]])
+        if not missing:
+            return
+        size = self.ARENA_SIZE
+        game_map = self.game_state.game_map
+        unblocked = [location for location in missing if game_map.in_arena_bounds(location)
+                     and not game_map.structure_occupancy[location[1] * size + location[0]]]
+        for location, path in zip(unblocked, self.game_state.find_paths_to_edges(unblocked)):
+            if not path:
+                continue
+            profile = _PathProfile()
+            profile.path = path
+            profile.attackers = []
+            profile.shields = []
+            profile.targets = {}
+            shielded = set()
+            for x, y in path:
+                index = y * size + x
+                profile.attackers.append(self._attackers.get(index, ()))
+                shield = 0
+                for support, (reach, amount) in enumerate(self._supports):
+                    if support not in shielded and index in reach:
+                        shielded.add(support)
+                        shield += amount
+                profile.shields.append(shield)
+            end = path[-1]
+            profile.ends_on_edge = end[1] * size + end[0] in self._edges[self.game_state.get_target_edge(location)]
+            self._profiles[location[0], location[1]] = profile
+
+    def __structures_in_range(self, index, radius):
+        """The enemy structures a unit at a location can attack, closest first
+        """
+        key = (index, radius)
+        structures = self._in_range.get(key)
+        if structures is None:
+            in_range = [(distance, target_index) for target_index, distance in self.__tiles_in_range(index, radius)
+                        if target_index in self._structure_health]
+            structures = [target_index for _, target_index in sorted(in_range)]
+            self._in_range[key] = structures
+        return structures
+
+    def __targets(self, profile, radius):
+        targets = profile.targets.get(radius)
+        if targets is None:
+            size = self.ARENA_SIZE
+            targets = [self.__structures_in_range(y * size + x, radius) for x, y in profile.path]
+            profile.targets[radius] = targets
+        return targets
+
+    def __estimate(self, profile, location, unit_type, count):
+        """Plays a group of units out along a profiled path
+        """
+        template = self.game_state.unit_templates[unit_type, False]
+        if template.stationary:
+            self.game_state.warn("Could not evaluate {}, it is not a mobile unit", unit_type)
+            return AttackEstimate(location, unit_type, count, profile.path, 0.0, 0.0, 0)
+        self_destruct = self.game_state.unit_catalog.self_destruct[unit_type]
+        frames = get_frame_timeline(profile.path, template.speed).frames
+        targets = self.__targets(profile, template.attackRange) if template.damage_f > 0 else None
+        structure_health = self._structure_health
+        health_left = {}
+
+        alive = count
+        # Turrets focus one unit at a time, the others keep the health they had before it was targeted
+        full_health = template.max_health
+        front_health = full_health
+        hp_lost = 0.0
+        damage_dealt = 0.0
+        for step in range(len(profile.path)):
+            if not alive:
+                break
+            shield = profile.shields[step]
+            full_health += shield
+            front_health += shield
+            # The units are attacked on every frame they spend on a location, starting with the frame they arrive on
+            for _ in range(frames[step]):
+                if targets is not None:
+                    damage = alive * template.damage_f
+                    for index in targets[step]:
+                        health = health_left.get(index, structure_health[index])
+                        if health <= 0:
+                            continue
+                        dealt = min(damage, health)
+                        health_left[index] = health - dealt
+                        damage_dealt += dealt
+                        damage -= dealt
+                        if damage <= 0:
+                            break
+                # Every turret hits a single unit, damage beyond its health is lost
+                for index, turret_damage in profile.attackers[step]:
+                    if not alive:
+                        break
+                    if health_left.get(index, structure_health[index]) <= 0:
+                        continue
+                    hit = min(turret_damage, front_health)
+                    front_health -= hit
+                    hp_lost += hit
+                    if front_health <= 0:
+                        alive -= 1
+                        front_health = full_health
+
+        breaches = 0
+        if profile.ends_on_edge:
+            breaches = alive
+        elif alive and len(profile.path) - 1 >= self_destruct.steps_required:
+            end = profile.path[-1]
+            damage = self_destruct.damage_f
+            for index in self.__structures_in_range(end[1] * self.ARENA_SIZE + end[0], self_destruct.radius):
+                health = health_left.get(index, structure_health[index])
+                dealt = min(alive * damage, max(health, 0))
+                health_left[index] = health - dealt
+                damage_dealt += dealt
+        return AttackEstimate(location, unit_type, count, profile.path, damage_dealt, hp_lost, breaches)
@@ -1,6 +1,20 @@
+import copy
 import math
-from .unit import GameUnit
-from .util import debug_write
+import random
+from .unit import GameUnit, get_unit_catalog
+from .util import log, WARNING
+from . import board_arrays
+
+# One random 64 bit key per location, xor-ed together for every blocked location to fingerprint a structure layout
+_layout_random = random.Random(0x5eed)
+_LAYOUT_KEYS = [_layout_random.getrandbits(64) for _ in range(28 * 28)]
+
+# Lookup tables shared by every GameMap, they only depend on the arena size and the ranges in the config
+_ARENA_MASKS = {}
+_EDGES = {}
+_DEPLOY_MASKS = {}
+_TERRITORY_MASKS = {}
+_RANGE_OFFSETS = {}
 
 class GameMap:
     """Holds data about the current game map and provides functions
@@ -18,6 +32,12 @@ class GameMap:
         * TOP_LEFT (int): A constant that represents the top left edge
         * BOTTOM_LEFT (int): Hidden challenge! Can you guess what this constant represents???
         * BOTTOM_RIGHT (int): A constant that represents the bottom right edge
+        * structure_occupancy (bytearray): 1 at index y * ARENA_SIZE + x for every location holding a structure.
+          Kept up to date by add_unit, remove_unit and game_map[x, y] = units. Call mark_changed after editing units in place.
+        * structure_hash (int): A fingerprint of structure_occupancy, equal for equal structure layouts
+
+    Use fork() to get a copy to try out hypothetical builds on, or checkpoint() and rollback() to undo them
+    in place. Both only copy the locations that are actually accessed through game_map[x, y] or changed.
 
     """
     def __init__(self, config):
@@ -36,17 +56,42 @@ class GameMap:
         self.BOTTOM_LEFT = 2
         self.BOTTOM_RIGHT = 3
         self.__map = self.__empty_grid()
+        self.__pending = {}
+        # None while every tile belongs to this map alone, else the tiles that may be modified in place
+        self.__owned = None
+        # (x, y, units) for each tile replaced since the first checkpoint, newest last
+        self.__journal = None
         self.__start = [13,0]
+        self.structure_occupancy = bytearray(self.ARENA_SIZE * self.ARENA_SIZE)
+        self.structure_hash = 0
+        self._listeners = []
+        self._arrays = None
+        catalog = get_unit_catalog(config)
+        self._hit_radius = catalog.hit_radius
+        if self.ARENA_SIZE not in _ARENA_MASKS:
+            _ARENA_MASKS[self.ARENA_SIZE] = self.__build_arena_mask()
+        self._arena_mask = _ARENA_MASKS[self.ARENA_SIZE]
+        if self.ARENA_SIZE not in _EDGES:
+            self.__build_edge_tables()
+        # Indexed [player_index][y * ARENA_SIZE + x], 1 on the edges a player deploys from and on the half a player builds on
+        self._deploy_masks = _DEPLOY_MASKS[self.ARENA_SIZE]
+        self._territory_masks = _TERRITORY_MASKS[self.ARENA_SIZE]
+        for radius in catalog.ranges:
+            self.get_range_offsets(radius)
     
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
             x,y = location
+            if self.__pending:
+                self.__materialize(x, y)
+            if self.__owned is not None and (x, y) not in self.__owned:
+                self.__own(x, y)
             return self.__map[x][y]
         self._invalid_coordinates(location)
 
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
-            self.__map[location[0]][location[1]] = val
+            self.__replace_tile(location[0], location[1], val)
             return
         self._invalid_coordinates(location)
 
@@ -67,6 +112,113 @@ class GameMap:
         self.__start = new_location
         return location 
 
+    def _defer_unit(self, location, unit_type, player_index, health):
+        """Records a unit to create the first time its location is accessed, used by lazy state parsing.
+        The unit type may also be "pending_removal" or "upgrade" to flag the structure at the location.
+        """
+        x, y = location
+        self.__pending.setdefault((x, y), []).append((unit_type, player_index, health))
+
+    def __materialize(self, x, y):
+        """Creates the GameUnits recorded with _defer_unit at a location
+        """
+        deferred = self.__pending.pop((x, y), None)
+        if deferred is None:
+            return
+        units = self.__map[x][y]
+        for unit_type, player_index, health in deferred:
+            if unit_type == "pending_removal" or unit_type == "upgrade":
+                if any(unit.stationary for unit in units):
+                    if unit_type == "pending_removal":
+                        units[0].pending_removal = True
+                    else:
+                        units[0].upgrade()
+            else:
+                units.append(GameUnit(unit_type, self.config, player_index, health, x, y))
+
+    def _peek(self, x, y):
+        """Gets the units at a location for reading only.
+        Unlike game_map[x, y] this never copies a tile shared with a fork or saved by a checkpoint, so the units must not be modified.
+        """
+        if self.__pending:
+            self.__materialize(x, y)
+        return self.__map[x][y]
+
+    def __own(self, x, y):
+        """Replaces a shared tile with a private copy, journaling the original, before it is handed out for modification
+        """
+        units = self.__map[x][y]
+        if self.__journal is not None:
+            self.__journal.append((x, y, units))
+        self.__map[x][y] = [unit.clone() for unit in units]
+        self.__owned.add((x, y))
+
+    def __replace_tile(self, x, y, units):
+        if self.__journal is not None:
+            self.__materialize(x, y)
+            self.__journal.append((x, y, self.__map[x][y]))
+        else:
+            self.__pending.pop((x, y), None)
+        self.__map[x][y] = units
+        if self.__owned is not None:
+            self.__owned.add((x, y))
+        self._tile_changed(x, y)
+
+    def fork(self):
+        """Makes an independent copy of this map to try out hypothetical builds on.
+
+        The copy starts out sharing every tile with this map, and a tile is only copied when either map
+        accesses it through game_map[x, y] or changes it, so forking costs O(ARENA_SIZE) and not O(units).
+        Listeners, BoardArrays and checkpoints are not carried over to the copy.
+
+        Returns:
+            A new GameMap with the same units as this one
+
+        """
+        for x, y in list(self.__pending):
+            self.__materialize(x, y)
+        forked = copy.copy(self)
+        forked.__map = [column[:] for column in self.__map]
+        forked.__pending = {}
+        forked.__owned = set()
+        forked.__journal = None
+        forked.__start = [13,0]
+        forked.structure_occupancy = bytearray(self.structure_occupancy)
+        forked._listeners = []
+        forked._arrays = None
+        self.__owned = set()
+        return forked
+
+    def checkpoint(self):
+        """Starts recording changes to the map so they can be undone with rollback.
+        Checkpoints can be nested, rolling back to one also undoes every later one.
+
+        Returns:
+            A checkpoint to pass to rollback
+
+        """
+        if self.__journal is None:
+            self.__journal = []
+        self.__owned = set()
+        return len(self.__journal)
+
+    def rollback(self, checkpoint):
+        """Restores every tile changed or accessed through game_map[x, y] since a checkpoint.
+        Costs O(changed tiles), structure_occupancy and the listeners are updated for each of them.
+
+        Args:
+            checkpoint: A value returned by checkpoint
+
+        """
+        changed = set()
+        while len(self.__journal) > checkpoint:
+            x, y, units = self.__journal.pop()
+            self.__map[x][y] = units
+            changed.add((x, y))
+        self.__owned = set()
+        for x, y in changed:
+            self._tile_changed(x, y)
+
     def __empty_grid(self):
         grid = []
         for x in range(0, self.ARENA_SIZE):
@@ -75,8 +227,96 @@ class GameMap:
                 grid[x].append([])
         return grid
 
+    def __build_arena_mask(self):
+        mask = bytearray(self.ARENA_SIZE * self.ARENA_SIZE)
+        for y in range(self.ARENA_SIZE):
+            for x in range(self.ARENA_SIZE):
+                mask[y * self.ARENA_SIZE + x] = self.__diamond_check(x, y)
+        return bytes(mask)
+
+    def __build_edge_tables(self):
+        size = self.ARENA_SIZE
+        half = self.HALF_ARENA
+        top_right = tuple((half + num, size - 1 - num) for num in range(half))
+        top_left = tuple((half - 1 - num, size - 1 - num) for num in range(half))
+        bottom_left = tuple((half - 1 - num, num) for num in range(half))
+        bottom_right = tuple((half + num, num) for num in range(half))
+        _EDGES[size] = (top_right, top_left, bottom_left, bottom_right)
+
+        deploy_masks = [bytearray(size * size), bytearray(size * size)]
+        for player_index, edges in [(0, bottom_left + bottom_right), (1, top_right + top_left)]:
+            for x, y in edges:
+                deploy_masks[player_index][y * size + x] = 1
+        territory_masks = [bytearray(size * size), bytearray(size * size)]
+        for index in range(size * size):
+            if _ARENA_MASKS[size][index]:
+                territory_masks[0 if index // size < half else 1][index] = 1
+        _DEPLOY_MASKS[size] = [bytes(mask) for mask in deploy_masks]
+        _TERRITORY_MASKS[size] = [bytes(mask) for mask in territory_masks]
+
+    def add_listener(self, listener):
+        """Registers a function to be called as listener(x, y) after the units at a location change
+
+        Args:
+            listener: A function taking the x and y coordinates of the changed location
+
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Stops calling a function registered with add_listener
+        """
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def get_arrays(self):
+        """Gets a numpy backed view of the structures on this map, built the first time it is requested.
+        See BoardArrays in board_arrays.py.
+
+        Returns:
+            A BoardArrays kept in sync with this map, or None if numpy is not installed
+
+        """
+        if self._arrays is None:
+            if board_arrays.np is None:
+                self.warn("get_arrays requires numpy, which is not installed")
+                return None
+            self._arrays = board_arrays.BoardArrays(self)
+        return self._arrays
+
+    def mark_changed(self, location):
+        """Tells the map the units at a location were changed in place, for example by appending to game_map[x, y]
+        or upgrading a unit, so structure_occupancy and the map listeners stay up to date.
+
+        Args:
+            location: The location that changed
+
+        """
+        x, y = location
+        self._tile_changed(x, y)
+
+    def _tile_changed(self, x, y):
+        """Updates structure_occupancy for a location after its units changed and notifies the listeners
+        """
+        occupied = 0
+        for unit in self._peek(x, y):
+            if unit.stationary:
+                occupied = 1
+                break
+        self._set_occupancy(x, y, occupied)
+        for listener in self._listeners:
+            listener(x, y)
+
+    def _set_occupancy(self, x, y, occupied):
+        """Marks a location as blocked (1) or free (0), keeping structure_hash in step
+        """
+        index = y * self.ARENA_SIZE + x
+        if self.structure_occupancy[index] != occupied:
+            self.structure_occupancy[index] = occupied
+            self.structure_hash ^= _LAYOUT_KEYS[index]
+
     def _invalid_coordinates(self, location):
-        self.warn("{} is out of bounds.".format(str(location)))
+        self.warn("{} is out of bounds.", str(location))
 
     def in_arena_bounds(self, location):
         """Checks if the given location is inside the diamond shaped game board.
@@ -89,6 +329,47 @@ class GameMap:
         
         """
         x, y = location
+        if type(x) is int and type(y) is int:
+            return 0 <= x < self.ARENA_SIZE and 0 <= y < self.ARENA_SIZE and self._arena_mask[y * self.ARENA_SIZE + x] == 1
+        return self.__diamond_check(x, y)
+
+    def on_deploy_edge(self, location, player_index=0):
+        """Checks if a player can deploy mobile units at a location, that is if it is on one of their two edges
+
+        Args:
+            location: A map location
+            player_index: The player deploying, 0 for you 1 for the enemy
+
+        Returns:
+            True if the location is on one of the player's edges
+
+        """
+        x, y = location
+        if type(x) is not int or type(y) is not int:
+            if not self.in_arena_bounds(location):
+                return False
+            x, y = int(x), int(y)
+        return 0 <= x < self.ARENA_SIZE and 0 <= y < self.ARENA_SIZE and self._deploy_masks[player_index][y * self.ARENA_SIZE + x] == 1
+
+    def in_territory(self, location, player_index=0):
+        """Checks if a location is on the half of the arena a player builds on
+
+        Args:
+            location: A map location
+            player_index: The player, 0 for you 1 for the enemy
+
+        Returns:
+            True if the location is in the arena and on the player's half
+
+        """
+        x, y = location
+        if type(x) is not int or type(y) is not int:
+            if not self.in_arena_bounds(location):
+                return False
+            x, y = int(x), int(y)
+        return 0 <= x < self.ARENA_SIZE and 0 <= y < self.ARENA_SIZE and self._territory_masks[player_index][y * self.ARENA_SIZE + x] == 1
+
+    def __diamond_check(self, x, y):
         half_board = self.HALF_ARENA
 
         row_size = y + 1
@@ -114,11 +395,10 @@ class GameMap:
 
         """
         if not quadrant_description in [self.TOP_LEFT, self.TOP_RIGHT, self.BOTTOM_LEFT, self.BOTTOM_RIGHT]:
-            self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.".format(quadrant_description))
+            self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.", quadrant_description)
             return
 
-        edges = self.get_edges()
-        return edges[quadrant_description]
+        return [[x, y] for x, y in _EDGES[self.ARENA_SIZE][quadrant_description]]
 
     def get_edges(self):
         """Gets all of the edges and their edge locations
@@ -127,27 +407,7 @@ class GameMap:
             A list with four lists inside of it of locations corresponding to the four edges.
             [0] = top_right, [1] = top_left, [2] = bottom_left, [3] = bottom_right.
         """
-        top_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = self.ARENA_SIZE - 1 - num
-            top_right.append([int(x), int(y)])
-        top_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = self.ARENA_SIZE - 1 - num
-            top_left.append([int(x), int(y)])
-        bottom_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = num
-            bottom_left.append([int(x), int(y)])
-        bottom_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = num
-            bottom_right.append([int(x), int(y)])
-        return [top_right, top_left, bottom_left, bottom_right]
+        return [[[x, y] for x, y in edge] for edge in _EDGES[self.ARENA_SIZE]]
     
     def add_unit(self, unit_type, location, player_index=0):
         """Add a single GameUnit to the map at the given location.
@@ -164,14 +424,15 @@ class GameMap:
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
         if player_index < 0 or player_index > 1:
-            self.warn("Player index {} is invalid. Player index should be 0 or 1.".format(player_index))
+            self.warn("Player index {} is invalid. Player index should be 0 or 1.", player_index)
 
         x, y = location
         new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
         if not new_unit.stationary:
-            self.__map[x][y].append(new_unit)
+            self[x, y].append(new_unit)
+            self._tile_changed(x, y)
         else:
-            self.__map[x][y] = [new_unit]
+            self.__replace_tile(x, y, [new_unit])
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -186,7 +447,7 @@ class GameMap:
             self._invalid_coordinates(location)
         
         x, y = location
-        self.__map[x][y] = []
+        self.__replace_tile(x, y, [])
 
     def get_locations_in_range(self, location, radius):
         """Gets locations in a circular area around a location
@@ -200,19 +461,61 @@ class GameMap:
 
         """
         if radius < 0 or radius > self.ARENA_SIZE:
-            self.warn("Radius {} was passed to get_locations_in_range. Expected integer between 0 and {}".format(radius, self.ARENA_SIZE))
+            self.warn("Radius {} was passed to get_locations_in_range. Expected integer between 0 and {}", radius, self.ARENA_SIZE)
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
 
+        x, y = location
+        if not (type(x) is int and type(y) is int):
+            return self.__scan_locations_in_range(location, radius)
+
+        size = self.ARENA_SIZE
+        mask = self._arena_mask
+        locations = []
+        for dx, dy in self.get_range_offsets(radius):
+            i = x + dx
+            j = y + dy
+            if 0 <= i < size and 0 <= j < size and mask[j * size + i]:
+                locations.append([i, j])
+        return locations
+
+    def get_range_offsets(self, radius):
+        """Gets the relative offsets of the locations in a circular area around any location
+
+        Offsets are computed once per radius and shared between every GameMap, the ranges
+        in the config are precomputed when the first GameMap is made.
+
+        Args:
+            radius: The radius of our search area
+
+        Returns:
+            A tuple of (dx, dy) offsets, in the same order get_locations_in_range returns locations
+
+        """
+        key = (radius, self._hit_radius)
+        offsets = _RANGE_OFFSETS.get(key)
+        if offsets is None:
+            search_radius = int(math.ceil(radius))
+            offsets = []
+            for dx in range(-search_radius, search_radius + 1):
+                for dy in range(-search_radius, search_radius + 1):
+                    # A unit with a given range affects all locations who's centers are within that range + get hit radius
+                    if math.sqrt(dx ** 2 + dy ** 2) < radius + self._hit_radius:
+                        offsets.append((dx, dy))
+            offsets = tuple(offsets)
+            _RANGE_OFFSETS[key] = offsets
+        return offsets
+
+    def __scan_locations_in_range(self, location, radius):
+        """get_locations_in_range for locations that are not integer coordinates
+        """
         x, y = location
         locations = []
         search_radius = math.ceil(radius)
-        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
         for i in range(int(x - search_radius), int(x + search_radius + 1)):
             for j in range(int(y - search_radius), int(y + search_radius + 1)):
                 new_location = [i, j]
-                # A unit with a given range affects all locations who's centers are within that range + get hit radius
-                if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + getHitRadius:
+                if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + self._hit_radius:
                     locations.append(new_location)
         return locations
 
@@ -232,9 +535,10 @@ class GameMap:
 
         return math.sqrt((x1 - x2)**2 + (y1 - y2)**2)
 
-    def warn(self, message):
+    def warn(self, message, *args):
         """
-        Used internally by game_map to print out default messaging
+        Used internally by game_map to print out default messaging.
+        The message is formatted with args only if warnings are enabled.
         """
         if(self.enable_warnings):
-            debug_write(message)
+            log(WARNING, message, *args)
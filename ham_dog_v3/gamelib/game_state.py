@@ -1,37 +1,32 @@
+import copy
 import math
 import json
-import sys
+import time
 
-from .navigation import ShortestPathFinder
-from .util import send_command, debug_write
-from .unit import GameUnit
+from .navigation import ShortestPathFinder, FlatShortestPathFinder, PathCache
+from .util import send_command, decode_json, flush_log, log, log_enabled, WARNING
+from .unit import GameUnit, get_unit_catalog
 from .game_map import GameMap
-
-def is_stationary(unit_type):
-    """
-        Args:
-            unit_type: A unit type
-        
-        Returns: 
-            Boolean, True if the unit is stationary, False otherwise.
-    """
-    return unit_type in STRUCTURE_TYPES
+from .threat_map import ThreatMap
+from .shield_map import ShieldMap
+from .unit_registry import UnitRegistry
+from .time_budget import TimeBudget
+from .build_plan import BuildPlan, BuildReport, SkippedAction
+from .targeting import pick_target
+from .timeline import get_frame_timeline
+from . import build_plan
+
+# The resource indexes, SP first like in [SP, MP] resource lists
+SP = 0
+MP = 1
 
 class GameState:
     """Represents the entire gamestate for a given turn
     Provides methods related to resources and unit deployment
 
     Attributes :
-        * UNIT_TYPE_TO_INDEX (dict): Maps a unit to a corresponding index
-        * WALL (str): A constant representing the wall unit
-        * SUPPORT (str): A constant representing the support unit
-        * TURRET (str): A constant representing the turret unit
-        * SCOUT (str): A constant representing the scout unit
-        * DEMOLISHER (str): A constant representing the demolisher unit
-        * INTERCEPTOR (str): A constant representing the interceptor unit
-        * REMOVE (str): A constant representing removing your own unit
-        * UPGRADE (str): A constant representing upgrading a unit
-        * STRUCTURE_TYPES (list): A list of the structure units
+        * unit_catalog (:obj: UnitCatalog): The unit types of the config, such as unit_catalog.TURRET, with their costs and stats.
+          Shared by every GameState of the game.
 
         * ARENA_SIZE (int): The size of the arena
         * HALF_ARENA (int): Half the size of the arena
@@ -44,53 +39,50 @@ class GameState:
         * my_time (int): The time you took to submit your previous turn
         * enemy_health (int): Your opponents current remaining health
         * enemy_time (int): Your opponents current remaining time
+        * path_cache (:obj: PathCache): Caches the results of find_path_to_edge and find_paths_to_edges
+        * unit_templates (mapping): Maps (unit_type, upgraded) to the UnitTemplate holding that unit's starting stats, unit_catalog.templates
+        * start_time (float): The time.perf_counter() value at which this turn started
+        * time_limit (float): The seconds a turn can take before it costs health, waitTimeBotSoft in the config
+        * time_margin (float): The seconds time_remaining and time_budget keep in hand for submitting the turn
 
     """
 
-    def __init__(self, config, serialized_string):
+    def __init__(self, config, serialized_string, path_cache=None, lazy=False, start_time=None):
         """ Setup a turns variables using arguments passed
 
         Args:
             * config (JSON): A json object containing information about the game
             * serialized_string (string): A string containing information about the game state at the start of this turn
+            * path_cache (:obj: PathCache): A cache to share with other GameStates, for example every turn of a game. A new one is made if None.
+            * lazy (bool): If True, GameUnits are only created when their location is first read from game_map.
+              Structure occupancy, and so pathing, is available right away.
+            * start_time (float): The time.perf_counter() value at which the turn was received, AlgoCore.turn_started.
+              The time this GameState is made if None.
 
         """
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.time_limit = config.get("timingAndReplay", {}).get("waitTimeBotSoft", 10000) / 1000
+        self.time_margin = 1.0
         self.serialized_string = serialized_string
         self.config = config
         self.enable_warnings = True
+        self.path_cache = path_cache if path_cache is not None else PathCache()
+        self.lazy = lazy
 
-        global WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
-        UNIT_TYPE_TO_INDEX = {}
-        WALL = config["unitInformation"][0]["shorthand"]
-        UNIT_TYPE_TO_INDEX[WALL] = 0
-        SUPPORT = config["unitInformation"][1]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SUPPORT] = 1
-        TURRET = config["unitInformation"][2]["shorthand"]
-        UNIT_TYPE_TO_INDEX[TURRET] = 2
-        SCOUT = config["unitInformation"][3]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SCOUT] = 3
-        DEMOLISHER = config["unitInformation"][4]["shorthand"]
-        UNIT_TYPE_TO_INDEX[DEMOLISHER] = 4
-        INTERCEPTOR = config["unitInformation"][5]["shorthand"]
-        UNIT_TYPE_TO_INDEX[INTERCEPTOR] = 5
-        REMOVE = config["unitInformation"][6]["shorthand"]
-        UNIT_TYPE_TO_INDEX[REMOVE] = 6
-        UPGRADE = config["unitInformation"][7]["shorthand"]
-        UNIT_TYPE_TO_INDEX[UPGRADE] = 7
-
-        ALL_UNITS = [SCOUT, DEMOLISHER, INTERCEPTOR, WALL, SUPPORT, TURRET]
-        STRUCTURE_TYPES = [WALL, SUPPORT, TURRET]
+        # Built once per config and shared by every GameState and GameUnit created from it
+        self.unit_catalog = get_unit_catalog(config)
+        self.unit_templates = self.unit_catalog.templates
 
         self.ARENA_SIZE = 28
         self.HALF_ARENA = int(self.ARENA_SIZE / 2)
-        self.MP = 1
-        self.SP = 0
-        global MP, SP
-        MP = self.MP
-        SP = self.SP
+        self.MP = MP
+        self.SP = SP
 
         self.game_map = GameMap(self.config)
-        self._shortest_path_finder = ShortestPathFinder()
+        self._shortest_path_finder = FlatShortestPathFinder(self.ARENA_SIZE)
+        self._threat_map = None
+        self._shield_map = None
+        self._unit_registry = UnitRegistry(self.game_map, scan=False)
         self._build_stack = []
         self._deploy_stack = []
         self._player_resources = [
@@ -103,7 +95,7 @@ class GameState:
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
         state_line is the game state as a json string.
         """
-        state = json.loads(state_line)
+        state = decode_json(state_line)
 
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
@@ -130,27 +122,57 @@ class GameState:
         """
         Helper function for __parse_state to add units to the map.
         """
-        typedef = self.config.get("unitInformation")
+        types = self.unit_catalog.types
+        if self.lazy:
+            self.__defer_parsed_units(units, player_number, types)
+            return
+        catalog = self.unit_catalog
         for i, unit_types in enumerate(units):
             for uinfo in unit_types:
-                unit_type = typedef[i].get("shorthand")
+                unit_type = types[i]
                 sx, sy, shp = uinfo[:3]
                 x, y = map(int, [sx, sy])
                 hp = float(shp)
                 # This depends on RM and UP always being the last types to be processed
-                if unit_type == REMOVE:
+                if unit_type == catalog.REMOVE:
                     # Quick fix will deploy engine fix soon
                     if self.contains_stationary_unit([x,y]):
                         self.game_map[x,y][0].pending_removal = True
-                elif unit_type == UPGRADE:
+                elif unit_type == catalog.UPGRADE:
                     if self.contains_stationary_unit([x,y]):
                         self.game_map[x,y][0].upgrade()
                 else:
                     unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
                     self.game_map[x,y].append(unit)
+                    self._unit_registry.add(x, y, unit_type, player_number)
+                    if unit.stationary:
+                        self.game_map._set_occupancy(x, y, 1)
+
+    def __defer_parsed_units(self, units, player_number, types):
+        """
+        Lazy version of __create_parsed_units, records the raw units on the map instead of building GameUnits.
+        """
+        templates = self.unit_templates
+        game_map = self.game_map
+        registry = self._unit_registry
+        catalog = self.unit_catalog
+        for i, unit_types in enumerate(units):
+            unit_type = types[i]
+            if unit_type == catalog.REMOVE:
+                unit_type = "pending_removal"
+            elif unit_type == catalog.UPGRADE:
+                unit_type = "upgrade"
+            stationary = (unit_type, False) in templates and templates[unit_type, False].stationary
+            for uinfo in unit_types:
+                x, y = int(uinfo[0]), int(uinfo[1])
+                game_map._defer_unit((x, y), unit_type, player_number, float(uinfo[2]))
+                if stationary:
+                    game_map._set_occupancy(x, y, 1)
+                if unit_type != "pending_removal" and unit_type != "upgrade":
+                    registry.add(x, y, unit_type, player_number)
 
     def __resource_required(self, unit_type):
-        return self.SP if is_stationary(unit_type) else self.MP
+        return self.SP if self.unit_catalog.is_stationary(unit_type) else self.MP
 
     def __set_resource(self, resource_type, amount, player_index=0):
         """
@@ -166,10 +188,10 @@ class GameState:
         self._player_resources[player_index][resource_key] = held_resource + amount
 
     def _invalid_player_index(self, index):
-        self.warn("Invalid player index {} passed, player index should always be 0 (yourself) or 1 (your opponent)".format(index))
+        self.warn("Invalid player index {} passed, player index should always be 0 (yourself) or 1 (your opponent)", index)
     
     def _invalid_unit(self, unit):
-        self.warn("Invalid unit {}".format(unit))
+        self.warn("Invalid unit {}", unit)
 
     def submit_turn(self):
         """Submit and end your turn.
@@ -177,9 +199,45 @@ class GameState:
         """
         build_string = json.dumps(self._build_stack)
         deploy_string = json.dumps(self._deploy_stack)
+        # Write out this turn's buffered messages before the engine starts the action phase
+        flush_log()
         send_command(build_string)
         send_command(deploy_string)
 
+    def elapsed_time(self):
+        """Gets the seconds since the turn started
+        """
+        return time.perf_counter() - self.start_time
+
+    def time_remaining(self):
+        """Gets the seconds left before the turn should be submitted, time_limit less time_margin less elapsed_time.
+        Negative once that point has passed.
+        """
+        return self.time_limit - self.time_margin - self.elapsed_time()
+
+    def time_budget(self, seconds=None, submit=False, apply=None):
+        """Gets a TimeBudget for an anytime search, ending at the latest time_remaining() from now
+
+        Args:
+            seconds: Give the search at most this many seconds. It gets all the time remaining if None.
+            submit: If True, submit_turn is called when the with block of the budget ends
+            apply: Called with the best candidate when the with block ends, before the turn is submitted.
+                Use it to queue the result, code after a check() that ran out of time is skipped.
+
+        Returns:
+            A TimeBudget. For example:
+
+                with game_state.time_budget(submit=True, apply=game_state.execute_plan) as budget:
+                    for plan in budget.iterate(plans):
+                        budget.offer(plan, score(plan))
+                        budget.check()
+
+        """
+        deadline = self.start_time + self.time_limit - self.time_margin
+        if seconds is not None:
+            deadline = min(deadline, time.perf_counter() + seconds)
+        return TimeBudget(deadline, (lambda budget: self.submit_turn()) if submit else None, apply)
+
     def get_resource(self, resource_type, player_index = 0):
         """Gets a players resources
 
@@ -195,7 +253,7 @@ class GameState:
             self._invalid_player_index(player_index)
             return
         if not resource_type == self.MP and not resource_type == self.SP:
-            self.warn("Invalid resource_type '{}'. Please use MP (0) or SP (1)".format(resource_type))
+            self.warn("Invalid resource_type '{}'. Please use MP (0) or SP (1)", resource_type)
             return
 
         if resource_type == self.MP:
@@ -234,11 +292,12 @@ class GameState:
             The number of units affordable of the given unit_type.
 
         """
-        if unit_type not in ALL_UNITS:
+        catalog = self.unit_catalog
+        if unit_type not in catalog.all_units:
             self._invalid_unit(unit_type)
             return
 
-        costs = self.type_cost(unit_type)
+        costs = catalog.costs[unit_type, False]
         player_held = self.get_resources()
         if costs[MP] > 0 and costs[SP] > 0:
             return min(math.floor(player_held[SP] / costs[SP]), math.floor(player_held[MP] / costs[MP]))
@@ -264,11 +323,11 @@ class GameState:
         """
 
         if turns_in_future < 1 or turns_in_future > 99:
-            self.warn("Invalid turns in future used ({}). Turns in future should be between 1 and 99".format(turns_in_future))
+            self.warn("Invalid turns in future used ({}). Turns in future should be between 1 and 99", turns_in_future)
         if not player_index == 1 and not player_index == 0:
             self._invalid_player_index(player_index)
         if type(current_MP) == int and current_MP < 0:
-            self.warn("Invalid current MP ({}). Current MP cannot be negative.".format(current_MP))
+            self.warn("Invalid current MP ({}). Current MP cannot be negative.", current_MP)
 
         MP = self.get_resource(self.MP, player_index) if not current_MP else current_MP
         for increment in range(1, turns_in_future + 1):
@@ -292,16 +351,11 @@ class GameState:
             The units costs as a list [SP, MP]
 
         """
-        if unit_type == REMOVE:
+        if unit_type == self.unit_catalog.REMOVE:
             self._invalid_unit(unit_type)
             return
         
-        unit_def = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[unit_type]]
-        cost_base = [unit_def.get('cost1', 0), unit_def.get('cost2', 0)]
-        if upgrade:
-            return [unit_def.get('upgrade', {}).get('cost1', cost_base[SP]), unit_def.get('upgrade', {}).get('cost2', cost_base[MP])]
-
-        return cost_base
+        return list(self.unit_catalog.costs[unit_type, upgrade])
 
 
     def can_spawn(self, unit_type, location, num=1):
@@ -320,22 +374,23 @@ class GameState:
             True if we can spawn the unit(s)
 
         """
-        if unit_type not in ALL_UNITS:
+        if unit_type not in self.unit_catalog.all_units:
             self._invalid_unit(unit_type)
             return
         
         if not self.game_map.in_arena_bounds(location):
-            if self.enable_warnings:
-                self.warn("Could not spawn {} at location {}. Location invalid.".format(unit_type, location))
+            if self.enable_warnings and log_enabled(WARNING):
+                self.warn("Could not spawn {} at location {}. Location invalid.", unit_type, location)
             return False
 
         affordable = self.number_affordable(unit_type) >= num
-        stationary = is_stationary(unit_type)
-        blocked = self.contains_stationary_unit(location) or (stationary and len(self.game_map[location[0],location[1]]) > 0)
-        correct_territory = location[1] < self.HALF_ARENA
-        on_edge = location in (self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT) + self.game_map.get_edge_locations(self.game_map.BOTTOM_RIGHT))
+        stationary = self.unit_catalog.is_stationary(unit_type)
+        x, y = map(int, location)
+        blocked = self.game_map.structure_occupancy[y * self.ARENA_SIZE + x] == 1 or (stationary and len(self.game_map._peek(x, y)) > 0)
+        correct_territory = self.game_map.in_territory([x, y], 0)
+        on_edge = self.game_map.on_deploy_edge([x, y], 0)
 
-        if self.enable_warnings:
+        if self.enable_warnings and log_enabled(WARNING):
             fail_reason = ""
             if not affordable:
                 fail_reason = fail_reason + " Not enough resources."
@@ -346,7 +401,7 @@ class GameState:
             if not (stationary or on_edge):
                 fail_reason = fail_reason + " Information units must be deployed on the edge."
             if len(fail_reason) > 0:
-                self.warn("Could not spawn {} at location {}.{}".format(unit_type, location, fail_reason))
+                self.warn("Could not spawn {} at location {}.{}", unit_type, location, fail_reason)
 
         return (affordable and correct_territory and not blocked and
                 (stationary or on_edge) and
@@ -364,31 +419,34 @@ class GameState:
             The number of units successfully spawned
 
         """
-        if unit_type not in ALL_UNITS:
+        if unit_type not in self.unit_catalog.all_units:
             self._invalid_unit(unit_type)
             return
         if num < 1:
-            self.warn("Attempted to spawn fewer than one units! ({})".format(num))
+            self.warn("Attempted to spawn fewer than one units! ({})", num)
             return
       
         if type(locations[0]) == int:
             locations = [locations]
+        costs = self.type_cost(unit_type)
+        stationary = self.unit_catalog.is_stationary(unit_type)
+        stack = self._build_stack if stationary else self._deploy_stack
         spawned_units = 0
         for location in locations:
-            for i in range(num):
-                if self.can_spawn(unit_type, location, 1):
-                    x, y = map(int, location)
-                    costs = self.type_cost(unit_type)
-                    self.__set_resource(SP, 0 - costs[SP])
-                    self.__set_resource(MP, 0 - costs[MP])
-                    self.game_map.add_unit(unit_type, location, 0)
-                    if is_stationary(unit_type):
-                        self._build_stack.append((unit_type, x, y))
-                    else:
-                        self._deploy_stack.append((unit_type, x, y))
-                    spawned_units += 1
-                else:
-                    break
+            # Spawn as many of the num units as we can afford with a single check, structures only once per location
+            wanted = 1 if stationary else num
+            count = min(wanted, self.number_affordable(unit_type))
+            if not self.can_spawn(unit_type, location, max(count, 1)):
+                continue
+            if count < wanted:
+                self.warn("Could not spawn {} at location {}. Not enough resources.", unit_type, location)
+            x, y = map(int, location)
+            self.__set_resource(SP, 0 - costs[SP] * count)
+            self.__set_resource(MP, 0 - costs[MP] * count)
+            for _ in range(count):
+                self.game_map.add_unit(unit_type, [x, y], 0)
+                stack.append((unit_type, x, y))
+            spawned_units += count
         return spawned_units
 
     def attempt_remove(self, locations):
@@ -407,10 +465,10 @@ class GameState:
         for location in locations:
             if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
                 x, y = map(int, location)
-                self._build_stack.append((REMOVE, x, y))
+                self._build_stack.append((self.unit_catalog.REMOVE, x, y))
                 removed_units += 1
             else:
-                self.warn("Could not remove a unit from {}. Location has no structures or is enemy territory.".format(location))
+                self.warn("Could not remove a unit from {}. Location has no structures or is enemy territory.", location)
         return removed_units
 
     def attempt_upgrade(self, locations):
@@ -435,19 +493,113 @@ class GameState:
                     if unit.stationary:
                         existing_unit = unit
 
-                if not existing_unit.upgraded and self.config["unitInformation"][UNIT_TYPE_TO_INDEX[existing_unit.unit_type]].get("upgrade", None) is not None:
+                if not existing_unit.upgraded and existing_unit.unit_type in self.unit_catalog.upgradable:
                     costs = self.type_cost(existing_unit.unit_type, True)
                     resources = self.get_resources()
                     if resources[SP] >= costs[SP] and resources[MP] >= costs[MP]:
                         self.__set_resource(SP, 0 - costs[SP])
                         self.__set_resource(MP, 0 - costs[MP])
                         existing_unit.upgrade()
-                        self._build_stack.append((UPGRADE, x, y))
+                        self.game_map.mark_changed([x, y])
+                        self._build_stack.append((self.unit_catalog.UPGRADE, x, y))
                         spawned_units += 1
             else:
-                self.warn("Could not upgrade a unit from {}. Location has no structures or is enemy territory.".format(location))
+                self.warn("Could not upgrade a unit from {}. Location has no structures or is enemy territory.", location)
         return spawned_units
 
+    def execute_plan(self, plan):
+        """Carries out a BuildPlan in a single pass, like calling attempt_spawn, attempt_upgrade and attempt_remove
+        for every entry in priority order, but checking each entry against a running total of the resources left
+        and the structures placed so far instead of querying the GameState again.
+
+        Args:
+            plan: The BuildPlan to carry out
+
+        Returns:
+            A BuildReport of what was spawned, upgraded and removed and of every entry skipped and why
+
+        """
+        report = BuildReport()
+        game_map = self.game_map
+        size = self.ARENA_SIZE
+        occupancy = game_map.structure_occupancy
+        held = self.get_resources()
+        ledger = list(held)
+        removed = set()
+
+        for action, unit_type, location, num in plan.entries():
+            x, y = location
+            in_bounds = game_map.in_arena_bounds(location)
+            if action == BuildPlan.SPAWN:
+                if unit_type not in self.unit_catalog.all_units:
+                    reason = build_plan.INVALID_UNIT
+                elif not in_bounds:
+                    reason = build_plan.OUT_OF_BOUNDS
+                elif not game_map.in_territory(location, 0):
+                    reason = build_plan.ENEMY_TERRITORY
+                else:
+                    stationary = self.unit_catalog.is_stationary(unit_type)
+                    wanted = 1 if stationary else num
+                    costs = self.type_cost(unit_type)
+                    if occupancy[y * size + x] or (stationary and len(game_map._peek(x, y)) > 0):
+                        reason = build_plan.BLOCKED
+                    elif not (stationary or game_map.on_deploy_edge(location, 0)):
+                        reason = build_plan.NOT_ON_EDGE
+                    else:
+                        count = wanted
+                        for resource in (SP, MP):
+                            if costs[resource] > 0:
+                                count = min(count, int(math.floor(ledger[resource] / costs[resource])))
+                        if count > 0:
+                            ledger[SP] -= costs[SP] * count
+                            ledger[MP] -= costs[MP] * count
+                            stack = self._build_stack if stationary else self._deploy_stack
+                            for _ in range(count):
+                                game_map.add_unit(unit_type, [x, y], 0)
+                                stack.append((unit_type, x, y))
+                            report.spawned.append((unit_type, location, count))
+                        reason = build_plan.NOT_AFFORDABLE if count < wanted else None
+            else:
+                existing_unit = None
+                if in_bounds and y < self.HALF_ARENA and occupancy[y * size + x]:
+                    for unit in game_map[x, y]:
+                        if unit.stationary:
+                            existing_unit = unit
+                if existing_unit is None:
+                    reason = build_plan.NO_STRUCTURE
+                elif action == BuildPlan.REMOVE:
+                    if (x, y) in removed:
+                        reason = build_plan.ALREADY_REMOVED
+                    else:
+                        removed.add((x, y))
+                        self._build_stack.append((self.unit_catalog.REMOVE, x, y))
+                        report.removed.append(location)
+                        reason = None
+                elif existing_unit.upgraded:
+                    reason = build_plan.ALREADY_UPGRADED
+                elif existing_unit.unit_type not in self.unit_catalog.upgradable:
+                    reason = build_plan.NOT_UPGRADABLE
+                else:
+                    costs = self.type_cost(existing_unit.unit_type, True)
+                    if ledger[SP] >= costs[SP] and ledger[MP] >= costs[MP]:
+                        ledger[SP] -= costs[SP]
+                        ledger[MP] -= costs[MP]
+                        existing_unit.upgrade()
+                        game_map.mark_changed([x, y])
+                        self._build_stack.append((self.unit_catalog.UPGRADE, x, y))
+                        report.upgraded.append(location)
+                        reason = None
+                    else:
+                        reason = build_plan.NOT_AFFORDABLE
+                unit_type = existing_unit.unit_type if existing_unit is not None else None
+            if reason is not None:
+                report.skipped.append(SkippedAction(action, unit_type, location, reason))
+
+        report.spent = [held[SP] - ledger[SP], held[MP] - ledger[MP]]
+        self.__set_resource(SP, 0 - report.spent[SP])
+        self.__set_resource(MP, 0 - report.spent[MP])
+        return report
+
     def get_target_edge(self, start_location):
         """Gets the target edge given a starting location
 
@@ -481,18 +633,78 @@ class GameState:
 
         Returns:
             A list of locations corresponding to the path the unit would take 
-            to get from it's starting location to the best available end location
+            to get from it's starting location to the best available end location.
+            Paths are cached in path_cache until the structures on the map change.
 
         """
         if self.contains_stationary_unit(start_location):
-            self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+            self.warn("Attempted to perform pathing from blocked starting location {}", start_location)
             return
 
         if target_edge is None:
             target_edge = self.get_target_edge(start_location)
 
-        end_points = self.game_map.get_edge_locations(target_edge)
-        return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
+        key = (start_location[0], start_location[1], target_edge, self.game_map.structure_hash)
+        path = self.path_cache.get(key)
+        if path is None:
+            end_points = self.game_map.get_edge_locations(target_edge)
+            path = self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
+            if path is not None:
+                self.path_cache.put(key, path)
+        return path
+
+    def find_paths_to_edges(self, start_locations, target_edge=None):
+        """Gets the paths units at many locations would take, sharing the pathfinding work between them.
+        Gives the same paths as calling find_path_to_edge for each location.
+
+        Args:
+            start_locations: A list of locations of hypothetical units
+            target_edge: The edge the units want to reach. game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc. Induced from each start location if None.
+
+        Returns:
+            A list with the path for each start location, in the same order.
+            None for start locations that are blocked.
+            Paths found in path_cache are reused, the others are computed together and cached.
+
+        """
+        paths = [None] * len(start_locations)
+        edge_groups = {}
+        for position, start_location in enumerate(start_locations):
+            if self.contains_stationary_unit(start_location):
+                self.warn("Attempted to perform pathing from blocked starting location {}", start_location)
+                continue
+            edge = self.get_target_edge(start_location) if target_edge is None else target_edge
+            paths[position] = self.path_cache.get((start_location[0], start_location[1], edge, self.game_map.structure_hash))
+            if paths[position] is None:
+                edge_groups.setdefault(edge, []).append(position)
+
+        for edge, positions in edge_groups.items():
+            end_points = self.game_map.get_edge_locations(edge)
+            starts = [start_locations[position] for position in positions]
+            if isinstance(self._shortest_path_finder, FlatShortestPathFinder):
+                edge_paths = self._shortest_path_finder.navigate_many(starts, end_points, self)
+            else:
+                edge_paths = [self._shortest_path_finder.navigate_multiple_endpoints(start, end_points, self) for start in starts]
+            for position, path in zip(positions, edge_paths):
+                paths[position] = path
+                if path is not None:
+                    self.path_cache.put((path[0][0], path[0][1], edge, self.game_map.structure_hash), path)
+        return paths
+
+    def use_legacy_pathfinder(self, legacy):
+        """Choose which pathfinder find_path_to_edge uses
+
+        Both return identical paths. The flat array pathfinder is the default,
+        the original Node grid pathfinder is kept as a reference implementation.
+
+        Args:
+            legacy: If true, use ShortestPathFinder. If false, use FlatShortestPathFinder.
+
+        """
+        if legacy:
+            self._shortest_path_finder = ShortestPathFinder()
+        else:
+            self._shortest_path_finder = FlatShortestPathFinder(self.ARENA_SIZE)
 
     def contains_stationary_unit(self, location):
         """Check if a location is blocked, return structures unit if it is
@@ -508,17 +720,20 @@ class GameState:
             self.warn('Checked for stationary unit outside of arena bounds')
             return False
         x, y = map(int, location)
+        if not self.game_map.structure_occupancy[y * self.ARENA_SIZE + x]:
+            return False
         for unit in self.game_map[x,y]:
             if unit.stationary:
                 return unit
         return False
 
-    def warn(self, message):
-        """ Used internally by game_state to print warnings
+    def warn(self, message, *args):
+        """ Used internally by game_state to print warnings.
+        The message is formatted with args only if warnings are enabled.
         """
 
         if(self.enable_warnings):
-            debug_write(message)
+            log(WARNING, message, *args)
 
     def suppress_warnings(self, suppress):
         """Suppress all warnings
@@ -537,6 +752,7 @@ class GameState:
 
         Their targeting priority is as follows:
             Infantry > Nearest Unit > Lowest Health > Lowest Y position > Closest to edge (Highest distance of X from the boards center, 13.5)
+        It is resolved with the single key of targeting.target_key, see targeting.pick_target.
 
         Args:
             attacking_unit: A GameUnit
@@ -547,68 +763,224 @@ class GameState:
         """
 
         if not isinstance(attacking_unit, GameUnit):
-            self.warn("Passed a {} to get_target as attacking_unit. Expected a GameUnit.".format(type(attacking_unit)))
+            self.warn("Passed a {} to get_target as attacking_unit. Expected a GameUnit.", type(attacking_unit))
             return
 
-        attacker_location = [attacking_unit.x, attacking_unit.y]
-        possible_locations = self.game_map.get_locations_in_range(attacker_location, attacking_unit.attackRange)
-        target = None
-        target_stationary = True
-        target_distance = sys.maxsize
-        target_health = sys.maxsize
-        target_y = self.ARENA_SIZE
-        target_x_distance = 0
-
-        for location in possible_locations:
-            for unit in self.game_map[location]:
-                if unit.player_index == attacking_unit.player_index or (attacking_unit.damage_f == 0 and is_stationary(unit.unit_type)) or (attacking_unit.damage_i == 0 and not(is_stationary(unit.unit_type))):
+        attacker_x = attacking_unit.x
+        attacker_y = attacking_unit.y
+        player_index = attacking_unit.player_index
+        center = self.HALF_ARENA - 0.5
+        game_map = self.game_map
+        # Candidate columns, in the order get_locations_in_range returns locations so ties go to the first one found
+        candidates = []
+        stationary = []
+        distance = []
+        health = []
+        y = []
+        x_distance = []
+        for location in game_map.get_locations_in_range([attacker_x, attacker_y], attacking_unit.attackRange):
+            units = game_map._peek(location[0], location[1])
+            if not units:
+                continue
+            unit_distance = math.sqrt((location[0] - attacker_x) ** 2 + (location[1] - attacker_y) ** 2)
+            for unit in units:
+                if unit.player_index == player_index or (attacking_unit.damage_f == 0 and unit.stationary) or (attacking_unit.damage_i == 0 and not unit.stationary):
                     continue
+                candidates.append(unit)
+                stationary.append(unit.stationary)
+                distance.append(unit_distance)
+                health.append(unit.health)
+                y.append(unit.y)
+                x_distance.append(abs(center - unit.x))
 
-                new_target = False
-                unit_stationary = unit.stationary
-                unit_distance = self.game_map.distance_between_locations(location, [attacking_unit.x, attacking_unit.y])
-                unit_health = unit.health
-                unit_y = unit.y
-                unit_x_distance = abs(self.HALF_ARENA - 0.5 - unit.x)
+        chosen = pick_target(stationary, distance, health, y, x_distance, player_index)
+        return None if chosen is None else candidates[chosen]
 
-                if target_stationary and not unit_stationary:
-                    new_target = True
-                elif not target_stationary and unit_stationary:
-                    continue
-                
-                if target_distance > unit_distance:
-                    new_target = True
-                elif target_distance < unit_distance and not new_target:
-                    continue
+    def snapshot(self):
+        """Gets an independent copy of this GameState to try out hypothetical turns on.
 
-                if target_health > unit_health:
-                    new_target = True
-                elif target_health < unit_health and not new_target:
-                    continue
+        The copy forks game_map (see GameMap.fork), so it is cheap and shares unchanged tiles with this state.
+        Spawns, upgrades and removals on the copy never reach this state or the commands sent by submit_turn.
+        The path cache is shared, it is keyed by structure layout so this is safe.
 
-                # Compare height heuristic relative to attacking unit's player index
-                if attacking_unit.player_index == 0:
-                    if target_y > unit_y:
-                        new_target = True
-                    elif target_y < unit_y and not new_target:
-                        continue
-                else:
-                    if target_y < unit_y:
-                        new_target = True
-                    elif target_y > unit_y and not new_target:
-                        continue
-
-                if target_x_distance < unit_x_distance:
-                    new_target = True
-                
-                if new_target:
-                    target = unit
-                    target_stationary = unit_stationary
-                    target_distance = unit_distance
-                    target_health = unit_health
-                    target_y = unit_y
-                    target_x_distance = unit_x_distance
-        return target
+        Returns:
+            A new GameState
+
+        """
+        state = copy.copy(self)
+        state.game_map = self.game_map.fork()
+        state._player_resources = [dict(resources) for resources in self._player_resources]
+        state._build_stack = list(self._build_stack)
+        state._deploy_stack = list(self._deploy_stack)
+        state._threat_map = None
+        state._shield_map = None
+        state._unit_registry = None
+        state.use_legacy_pathfinder(isinstance(self._shortest_path_finder, ShortestPathFinder))
+        return state
+
+    def checkpoint(self):
+        """Saves the map, resources and queued commands so they can be restored with rollback
+
+        Returns:
+            A checkpoint to pass to rollback
+
+        """
+        return (self.game_map.checkpoint(), [dict(resources) for resources in self._player_resources],
+                len(self._build_stack), len(self._deploy_stack))
+
+    def rollback(self, checkpoint):
+        """Undoes every spawn, upgrade, removal and map change made since a checkpoint, in O(changed tiles)
+
+        Args:
+            checkpoint: A value returned by checkpoint
+
+        """
+        map_checkpoint, resources, build_count, deploy_count = checkpoint
+        self.game_map.rollback(map_checkpoint)
+        self._player_resources = [dict(player_resources) for player_resources in resources]
+        del self._build_stack[build_count:]
+        del self._deploy_stack[deploy_count:]
+
+    def get_threat_map(self):
+        """Gets the ThreatMap of the current map, building it the first time it is requested.
+        It follows structures spawned, upgraded or removed afterwards, so it stays valid for the whole turn.
+
+        Returns:
+            A ThreatMap with the per location damage per frame for both players
+
+        """
+        if self._threat_map is None:
+            self._threat_map = ThreatMap(self.game_map)
+        return self._threat_map
+
+    def path_exposure(self, path, player_index=0, unit_type=None):
+        """Gets the enemy structures a mobile unit walking a path is exposed to, per location and in total.
+        Uses the coverage index of get_threat_map() instead of calling get_attackers on every location.
+
+        Args:
+            path: A list of locations, for example from find_path_to_edge
+            player_index: The player controlling the mobile unit, 0 for you 1 for the enemy
+            unit_type: The type of the mobile unit. Totals count the frames it spends on each location, see frame_timelines.
+                One frame per location if None.
+
+        Returns:
+            A PathExposure with the attackers and damage per frame on each location, their totals and
+            the damage each contributing structure deals over the path, see ThreatMap.path_exposure
+
+        """
+        if not player_index == 1 and not player_index == 0:
+            self._invalid_player_index(player_index)
+            return
+        frames = None
+        if unit_type is not None:
+            timelines = self.frame_timelines([path], unit_type)
+            if timelines is None:
+                return
+            frames = timelines[0].frames if timelines[0] is not None else None
+        return self.get_threat_map().path_exposure(path, player_index, frames)
+
+    def get_shield_map(self):
+        """Gets the ShieldMap of the current map, building it the first time it is requested.
+        It follows supports spawned, upgraded or removed afterwards, so it stays valid for the whole turn.
+
+        Returns:
+            A ShieldMap with the per location shield of the supports of both players
+
+        """
+        if self._shield_map is None:
+            self._shield_map = ShieldMap(self.game_map)
+        return self._shield_map
+
+    def path_shield(self, path, player_index=0):
+        """Gets the shield each mobile unit walking a path picks up from the friendly supports it passes.
+        Every support shields a unit once, so supports reaching several locations of the path are only counted once.
+
+        Args:
+            path: A list of locations, for example from find_path_to_edge
+            player_index: The player controlling the mobile units, 0 for you 1 for the enemy
+
+        Returns:
+            A PathShield with the shield picked up on each location, the total and the shield each support gives,
+            see ShieldMap.path_shield
+
+        """
+        if not player_index == 1 and not player_index == 0:
+            self._invalid_player_index(player_index)
+            return
+        return self.get_shield_map().path_shield(path, player_index)
+
+    def frame_timelines(self, paths, unit_type):
+        """Expands paths into the frames a mobile unit of a type spends on each location, from the speed in the config.
+        Timelines are cached per path and speed, so paths from find_path_to_edge are only expanded once per game.
+
+        Args:
+            paths: A list of paths, for example from find_paths_to_edges
+            unit_type: The type of mobile unit walking the paths
+
+        Returns:
+            A list with the FrameTimeline of each path, in the same order. None for paths that are None or empty.
+
+        """
+        catalog = self.unit_catalog
+        if unit_type not in catalog.all_units:
+            self._invalid_unit(unit_type)
+            return
+        if catalog.is_stationary(unit_type):
+            self.warn("Could not expand paths for {}, it is not a mobile unit", unit_type)
+            return
+        speed = catalog.templates[unit_type, False].speed
+        return [get_frame_timeline(path, speed) if path else None for path in paths]
+
+    def get_unit_registry(self):
+        """Gets the UnitRegistry indexing the units of the current map by player and type.
+        It is filled in while parsing and follows units spawned, upgraded or removed afterwards.
+
+        Returns:
+            A UnitRegistry of the current map
+
+        """
+        if self._unit_registry is None:
+            self._unit_registry = UnitRegistry(self.game_map)
+        return self._unit_registry
+
+    def units(self, player_index=0, unit_type=None):
+        """Gets the units a player has on the map, without scanning every location
+
+        Args:
+            player_index: The player controlling the units, 0 for you 1 for the enemy
+            unit_type: Only return units of this type, for example TURRET. Any type if None.
+
+        Returns:
+            A list of GameUnits ordered by location, for reading only
+
+        """
+        if not player_index == 1 and not player_index == 0:
+            self._invalid_player_index(player_index)
+            return
+        return self.get_unit_registry().units(player_index, unit_type)
+
+    def damaged_structures(self, threshold=0.75, player_index=0):
+        """Gets the structures of a player below a fraction of their max health, leaving out those flagged for removal
+
+        Args:
+            threshold: The fraction of max health a structure has to be below
+            player_index: The player controlling the structures, 0 for you 1 for the enemy
+
+        Returns:
+            A list of the damaged structures (GameUnits) ordered by location, for reading only
+
+        """
+        if not player_index == 1 and not player_index == 0:
+            self._invalid_player_index(player_index)
+            return
+        registry = self.get_unit_registry()
+        damaged = []
+        for unit_type in self.unit_catalog.structure_types:
+            for unit in registry.units(player_index, unit_type):
+                if unit.max_health * threshold > unit.health and not unit.pending_removal:
+                    damaged.append(unit)
+        damaged.sort(key=lambda unit: (unit.y, unit.x))
+        return damaged
 
     def get_attackers(self, location, player_index):
         """Gets the stationary units threatening a given location
@@ -625,19 +997,15 @@ class GameState:
         if not player_index == 0 and not player_index == 1:
             self._invalid_player_index(player_index)
         if not self.game_map.in_arena_bounds(location):
-            self.warn("Location {} is not in the arena bounds.".format(location))
+            self.warn("Location {} is not in the arena bounds.", location)
 
         attackers = []
         """
         Get locations in the range of TURRET units
         """
-        max_range = 0
-        for unit in self.config["unitInformation"]:
-            if unit.get('attackRange', 0) >= max_range:
-                max_range = unit.get('attackRange', 0)
-        possible_locations= self.game_map.get_locations_in_range(location, max_range)
+        possible_locations= self.game_map.get_locations_in_range(location, self.unit_catalog.max_attack_range)
         for location_unit in possible_locations:
-            for unit in self.game_map[location_unit]:
+            for unit in self.game_map._peek(location_unit[0], location_unit[1]):
                 if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
                     attackers.append(unit)
         return attackers
@@ -2,6 +2,7 @@ import heapq
 import math
 import sys
 import queue
+from collections import deque, OrderedDict
 from .util import debug_write
 
 class Node:
@@ -314,3 +315,438 @@ class ShortestPathFinder:
             sys.stderr.write(" ")
         sys.stderr.write(str(number))
         sys.stderr.write(" ")
+
+
+class FlatShortestPathFinder:
+    """Handles pathfinding using preallocated flat arrays
+
+    Returns exactly the same paths as ShortestPathFinder, but instead of building a fresh
+    grid of Nodes for every query it keeps its working arrays between calls. Every array
+    is indexed by y * ARENA_SIZE + x, and visited flags are stamps so nothing has to be
+    cleared between searches.
+
+    Attributes :
+        * HORIZONTAL (int): A constant representing a horizontal movement
+        * VERTICAL (int): A constant representing a vertical movement
+        * ARENA_SIZE (int): The size of the arena
+        * HALF_ARENA (int): Half the size of the arena
+        * in_bounds (bytes): 1 for every index inside the diamond shaped board
+        * blocked (bytearray): 1 for every index holding a structure during the last query
+        * pathlength (list): The distance between each index and the target, valid where visited_validate is current
+
+    """
+    _static_tables = {}
+
+    def __init__(self, arena_size=28):
+        self.HORIZONTAL = 1
+        self.VERTICAL = 2
+        self.ARENA_SIZE = arena_size
+        self.HALF_ARENA = int(arena_size / 2)
+        self.initialized = False
+
+        cells = arena_size * arena_size
+        if arena_size not in FlatShortestPathFinder._static_tables:
+            FlatShortestPathFinder._static_tables[arena_size] = self._build_static_tables()
+        (self._xs, self._ys, self.in_bounds, self.arena_cells,
+            self.neighbors, self._idealness_tables) = FlatShortestPathFinder._static_tables[arena_size]
+
+        self.blocked = bytearray(cells)
+        self.pathlength = [-1] * cells
+        self.visited_idealness = [0] * cells
+        self.visited_validate = [0] * cells
+        self._stamp = 0
+        self._validate_stamp = 0
+
+    def _build_static_tables(self):
+        """Builds the lookup tables that only depend on the arena size, shared by every instance
+        """
+        size = self.ARENA_SIZE
+        cells = size * size
+        self._xs = [index % size for index in range(cells)]
+        self._ys = [index // size for index in range(cells)]
+        self.in_bounds = bytearray(cells)
+        for index in range(cells):
+            self.in_bounds[index] = self._in_arena_bounds(self._xs[index], self._ys[index])
+        arena_cells = [index for index in range(cells) if self.in_bounds[index]]
+        neighbors = [self._build_neighbors(index) for index in range(cells)]
+        idealness_tables = {}
+        for direction in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
+            idealness_tables[direction] = [self._base_idealness(index, direction) for index in range(cells)]
+        return (self._xs, self._ys, bytes(self.in_bounds), arena_cells, neighbors, idealness_tables)
+
+    def _in_arena_bounds(self, x, y):
+        """Same diamond test as GameMap.in_arena_bounds, for raw coordinates
+        """
+        half_board = self.HALF_ARENA
+        if y < half_board:
+            row_size = y + 1
+        else:
+            row_size = self.ARENA_SIZE - y
+        startx = half_board - row_size
+        endx = startx + (2 * row_size) - 1
+        return 1 if startx <= x <= endx else 0
+
+    def _build_neighbors(self, index):
+        """In bounds neighbors of an index, in the same up, down, right, left order as ShortestPathFinder._get_neighbors
+        """
+        if not self.in_bounds[index]:
+            return ()
+        size = self.ARENA_SIZE
+        x, y = self._xs[index], self._ys[index]
+        neighbors = []
+        for nx, ny in [[x, y + 1], [x, y - 1], [x + 1, y], [x - 1, y]]:
+            if 0 <= nx < size and 0 <= ny < size and self.in_bounds[ny * size + nx]:
+                neighbors.append(ny * size + nx)
+        return tuple(neighbors)
+
+    def _base_idealness(self, index, direction):
+        """Idealness of an index that is not one of the end points, see ShortestPathFinder._get_idealness
+        """
+        x, y = self._xs[index], self._ys[index]
+        idealness = 0
+        if direction[1] == 1:
+            idealness += 28 * y
+        else:
+            idealness += 28 * (27 - y)
+        if direction[0] == 1:
+            idealness += x
+        else:
+            idealness += (27 - x)
+        return idealness
+
+    def _get_direction_from_endpoints(self, end_points):
+        """A direction (x, y) representing the edge. For example, (1, 1) for the top right and (-1, 1) for the top left
+        """
+        x, y = end_points[0]
+        return (-1 if x < self.HALF_ARENA else 1, -1 if y < self.HALF_ARENA else 1)
+
+    def initialize_map(self, game_state):
+        """Copies the structure occupancy GameMap maintains into the blocked array
+
+        Args:
+            game_state: A GameState object representing the gamestate we want to traverse
+        """
+        self.initialized = True
+        self.game_state = game_state
+        self.blocked[:] = game_state.game_map.structure_occupancy
+
+    def navigate_multiple_endpoints(self, start_point, end_points, game_state, previous_move_direction=0):
+        """Finds the path a unit would take to reach a set of endpoints
+
+        Args:
+            * start_point: The starting location of the unit
+            * end_points: The end points of the unit, should be a list of edge locations
+            * game_state: The current game state
+            * previous_move_direction: HORIZONTAL or VERTICAL if the unit is already moving, for example when it
+              repaths after a structure is destroyed. 0 for a newly spawned unit.
+
+        Returns:
+            The path a unit at start_point would take when trying to reach end_points given the current game state.
+            Note that this path can change if a tower is destroyed during pathing, or if you or your enemy places structures.
+
+        """
+        if game_state.contains_stationary_unit(start_point):
+            return
+        if not game_state.game_map.in_arena_bounds(start_point):
+            return
+
+        self.initialize_map(game_state)
+        end_set = set(y * self.ARENA_SIZE + x for x, y in end_points)
+        direction = self._get_direction_from_endpoints(end_points)
+        start = start_point[1] * self.ARENA_SIZE + start_point[0]
+
+        ideal_endpoint = self._idealness_search(start, end_set, direction)
+        self._validate(ideal_endpoint, end_points, end_set)
+        return self._get_path(start_point, start, direction, previous_move_direction)
+
+    def navigate_many(self, start_points, end_points, game_state):
+        """Finds the paths units at several start points would take to reach the same set of endpoints
+
+        The pathlengths only depend on the blocked tiles and the most ideal tile of a start point's pocket,
+        so they are computed once per pocket (or once in total for every pocket that can reach the edge)
+        and only the final walk is done per start point.
+
+        Args:
+            * start_points: A list of starting locations
+            * end_points: The end points of the units, should be a list of edge locations
+            * game_state: The current game state
+
+        Returns:
+            A list with the path for each start point, in the same order. None for start points that are blocked.
+
+        """
+        size = self.ARENA_SIZE
+        self.initialize_map(game_state)
+        end_set = set(y * size + x for x, y in end_points)
+        direction = self._get_direction_from_endpoints(end_points)
+
+        # Find the most ideal tile once per pocket, starts already reached by an earlier search share its result
+        first_stamp = self._stamp + 1
+        pocket_ideal = {}
+        fields = {}
+        for position, start_point in enumerate(start_points):
+            if not game_state.game_map.in_arena_bounds(start_point):
+                continue
+            start = start_point[1] * size + start_point[0]
+            if self.blocked[start]:
+                continue
+            pocket = self.visited_idealness[start]
+            if pocket < first_stamp:
+                ideal = self._idealness_search(start, end_set, direction)
+                pocket_ideal[self._stamp] = ideal
+            else:
+                ideal = pocket_ideal[pocket]
+            # Every pocket that reaches the edge is validated from all of the end points, so they share one field
+            field = -1 if ideal in end_set else ideal
+            if field not in fields:
+                fields[field] = (ideal, [])
+            fields[field][1].append((position, start_point, start))
+
+        paths = [None] * len(start_points)
+        for ideal, starts in fields.values():
+            self._validate(ideal, end_points, end_set)
+            for position, start_point, start in starts:
+                paths[position] = self._get_path(start_point, start, direction)
+        return paths
+
+    def _idealness_search(self, start, end_set, direction):
+        """
+        Finds the most ideal index in our 'pocket' of pathable space.
+        The edge if it is available, or the best self destruct location otherwise
+        """
+        blocked = self.blocked
+        neighbors = self.neighbors
+        visited = self.visited_idealness
+        table = self._idealness_tables[direction]
+        self._stamp += 1
+        stamp = self._stamp
+
+        visited[start] = stamp
+        best_idealness = sys.maxsize if start in end_set else table[start]
+        most_ideal = start
+
+        # A tile can only become the most ideal the first time it is reached, so each tile is scored once
+        current = deque([start])
+        while current:
+            for neighbor in neighbors[current.popleft()]:
+                if blocked[neighbor] or visited[neighbor] == stamp:
+                    continue
+                visited[neighbor] = stamp
+                current_idealness = sys.maxsize if neighbor in end_set else table[neighbor]
+                if current_idealness > best_idealness:
+                    best_idealness = current_idealness
+                    most_ideal = neighbor
+                current.append(neighbor)
+
+        return most_ideal
+
+    def _validate(self, ideal_tile, end_points, end_set):
+        """Breadth first search of the grid, setting the pathlengths of each index
+
+        """
+        size = self.ARENA_SIZE
+        blocked = self.blocked
+        neighbors = self.neighbors
+        visited = self.visited_validate
+        pathlength = self.pathlength
+        self._stamp += 1
+        stamp = self._stamp
+        self._validate_stamp = stamp
+
+        current = deque()
+        if ideal_tile in end_set:
+            for x, y in end_points:
+                index = y * size + x
+                current.append(index)
+                pathlength[index] = 0
+                visited[index] = stamp
+        else:
+            current.append(ideal_tile)
+            pathlength[ideal_tile] = 0
+            visited[ideal_tile] = stamp
+
+        while current:
+            index = current.popleft()
+            # Blocked end points are seeded but never expanded
+            if blocked[index]:
+                continue
+            next_pathlength = pathlength[index] + 1
+            for neighbor in neighbors[index]:
+                if blocked[neighbor] or visited[neighbor] == stamp:
+                    continue
+                pathlength[neighbor] = next_pathlength
+                visited[neighbor] = stamp
+                current.append(neighbor)
+
+    def _get_pathlength(self, index):
+        """The validated pathlength of an index, or -1 if the last validation did not reach it
+        """
+        if self.visited_validate[index] == self._validate_stamp:
+            return self.pathlength[index]
+        return -1
+
+    def _get_path(self, start_point, start, direction, move_direction=0):
+        """Once all indexes are validated, and a target is found, the unit can path to its target
+
+        """
+        xs, ys = self._xs, self._ys
+        path = [start_point]
+        current = start
+
+        while not self._get_pathlength(current) == 0:
+            next_move = self._choose_next_move(current, move_direction, direction)
+
+            if xs[current] == xs[next_move]:
+                move_direction = self.VERTICAL
+            else:
+                move_direction = self.HORIZONTAL
+            path.append([xs[next_move], ys[next_move]])
+            current = next_move
+
+        return path
+
+    def _choose_next_move(self, current_point, previous_move_direction, direction):
+        """Given the current index and adjacent indexes, return the best 'next step' for a given unit to take
+        """
+        blocked = self.blocked
+        ideal_neighbor = current_point
+        best_pathlength = self._get_pathlength(current_point)
+        for neighbor in self.neighbors[current_point]:
+            if blocked[neighbor]:
+                continue
+
+            current_pathlength = self._get_pathlength(neighbor)
+            if current_pathlength > best_pathlength:
+                continue
+            if current_pathlength == best_pathlength and not self._better_direction(current_point, neighbor, ideal_neighbor, previous_move_direction, direction):
+                continue
+
+            ideal_neighbor = neighbor
+            best_pathlength = current_pathlength
+
+        return ideal_neighbor
+
+    def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, direction):
+        """Compare two indexes and return True if the unit would rather move to the new one, see ShortestPathFinder._better_direction
+
+        """
+        xs, ys = self._xs, self._ys
+        prev_x, prev_y = xs[prev_tile], ys[prev_tile]
+        new_x, new_y = xs[new_tile], ys[new_tile]
+        best_x, best_y = xs[prev_best], ys[prev_best]
+
+        if previous_move_direction == self.HORIZONTAL and not new_x == best_x:
+            return not prev_y == new_y
+        if previous_move_direction == self.VERTICAL and not new_y == best_y:
+            return not prev_x == new_x
+        if previous_move_direction == 0:
+            return not prev_y == new_y
+
+        if new_y == best_y:
+            if direction[0] == 1 and new_x > best_x:
+                return True
+            if direction[0] == -1 and new_x < best_x:
+                return True
+            return False
+        if new_x == best_x:
+            if direction[1] == 1 and new_y > best_y:
+                return True
+            if direction[1] == -1 and new_y < best_y:
+                return True
+            return False
+        return True
+
+    def print_map(self):
+        """Prints an ASCII version of the last validated pathlengths for debug purposes
+
+        """
+        if not self.initialized:
+            debug_write("Attempted to print_map before pathfinder initialization. Use 'this_object.initialize_map(game_state)' to initialize the map first")
+            return
+
+        size = self.ARENA_SIZE
+        for y in range(size):
+            for x in range(size):
+                index = (size - y - 1) * size + x
+                pathlength = self._get_pathlength(index)
+                if not self.blocked[index] and not pathlength == -1:
+                    self._print_justified(pathlength)
+                else:
+                    sys.stderr.write("   ")
+            debug_write("")
+
+    def _print_justified(self, number):
+        """Prints a number between 100 and -10 in 3 spaces
+
+        """
+        if number < 10 and number > -1:
+            sys.stderr.write(" ")
+        sys.stderr.write(str(number))
+        sys.stderr.write(" ")
+
+
+class PathCache:
+    """A least recently used cache of paths
+
+    Paths are keyed by start location, target edge and the GameMap.structure_hash of the board they were
+    computed on, so a cached path is never reused once structures are spawned or removed. Sharing one cache
+    between the GameStates of a game lets unchanged boards reuse the paths of earlier turns.
+
+    Attributes :
+        * maxsize (int): The most paths kept before the least recently used are dropped
+        * hits (int): The number of lookups that found a path
+        * misses (int): The number of lookups that did not
+
+    """
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._paths = OrderedDict()
+
+    def get(self, key):
+        """Looks up a path
+
+        Args:
+            key: A (x, y, target_edge, structure_hash) tuple
+
+        Returns:
+            A fresh copy of the cached path, or None if there is no cached path for the key
+
+        """
+        path = self._paths.get(key)
+        if path is None:
+            self.misses += 1
+            return None
+        self._paths.move_to_end(key)
+        self.hits += 1
+        return [list(location) for location in path]
+
+    def put(self, key, path):
+        """Stores a copy of a path, dropping the least recently used path if the cache is full
+        """
+        self._paths[key] = tuple(tuple(location) for location in path)
+        self._paths.move_to_end(key)
+        if len(self._paths) > self.maxsize:
+            self._paths.popitem(last=False)
+
+    def update(self, other):
+        """Copies every path of another PathCache into this one, for example one filled by a background task
+        """
+        for key, path in other._paths.items():
+            self.put(key, path)
+
+    def clear(self):
+        """Drops every cached path, the hit and miss counters are kept
+        """
+        self._paths.clear()
+
+    def stats(self):
+        """Returns a dict with the hits, misses, hit_rate and current size of the cache
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "size": len(self._paths)}
+
+    def __len__(self):
+        return len(self._paths)
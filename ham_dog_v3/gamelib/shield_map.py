@@ -0,0 +1,131 @@
+from collections import namedtuple
+
+# The shield a mobile unit picks up walking a path. gained is the shield picked up on each location of the path,
+# supports maps the (x, y) of every friendly support reaching the path to the shield it gives
+PathShield = namedtuple("PathShield", ["gained", "total", "supports"])
+
+
+class ShieldMap:
+    """Holds the shield the supports on a GameMap give to friendly mobile units on each location.
+
+    Like ThreatMap it is built once from the map and then kept up to date as supports are spawned, upgraded or
+    removed through the GameMap. Every support shields a mobile unit once, on the first location of its path
+    within the support's shieldRange, so the shield picked up along a path is the sum over the union of the
+    supports reaching it rather than the sum of the raster over the path. Locations are indexed y * ARENA_SIZE + x.
+
+    Attributes :
+        * game_map (:obj: GameMap): The map the shields are computed from
+        * ARENA_SIZE (int): The size of the arena
+        * shield (list): shield[player_index][index] is the summed shield of the supports of player_index reaching index
+        * coverage (list): coverage[player_index] maps an index to the indexes of the supports of player_index reaching it
+
+    """
+    def __init__(self, game_map):
+        """Rasterizes every support on the map and starts listening for changes
+
+        Args:
+            game_map: The GameMap to compute shields for
+
+        """
+        self.game_map = game_map
+        self.ARENA_SIZE = game_map.ARENA_SIZE
+        cells = self.ARENA_SIZE * self.ARENA_SIZE
+        self.shield = [[0.0] * cells, [0.0] * cells]
+        self.coverage = [{}, {}]
+        self._contributions = {}
+        for index in range(cells):
+            if game_map.structure_occupancy[index]:
+                self._add_contribution(index % self.ARENA_SIZE, index // self.ARENA_SIZE)
+        game_map.add_listener(self.refresh)
+
+    def _add_contribution(self, x, y):
+        """Adds the support at a location to the raster, remembering exactly what it added
+        """
+        for unit in self.game_map._peek(x, y):
+            if not unit.stationary or (unit.shieldPerUnit <= 0 and unit.shieldRange <= 0):
+                continue
+            size = self.ARENA_SIZE
+            mask = self.game_map._arena_mask
+            # Supports reach every location the hit radius touches, like the Simulator
+            indexes = []
+            for dx, dy in self.game_map.get_range_offsets(unit.shieldRange):
+                i = x + dx
+                j = y + dy
+                if 0 <= i < size and 0 <= j < size and mask[j * size + i]:
+                    indexes.append(j * size + i)
+            amount = unit.shield_amount(size)
+            shield = self.shield[unit.player_index]
+            coverage = self.coverage[unit.player_index]
+            support_index = y * size + x
+            for index in indexes:
+                shield[index] += amount
+                coverage.setdefault(index, []).append(support_index)
+            self._contributions[support_index] = (unit.player_index, amount, indexes)
+            break
+
+    def _remove_contribution(self, x, y):
+        support_index = y * self.ARENA_SIZE + x
+        contribution = self._contributions.pop(support_index, None)
+        if contribution is None:
+            return
+        player_index, amount, indexes = contribution
+        shield = self.shield[player_index]
+        coverage = self.coverage[player_index]
+        for index in indexes:
+            shield[index] -= amount
+            coverage[index].remove(support_index)
+
+    def refresh(self, x, y):
+        """Recomputes the contribution of a single location. Called by the GameMap whenever a location changes.
+
+        Args:
+            x: The x coordinate of the changed location
+            y: The y coordinate of the changed location
+
+        """
+        self._remove_contribution(x, y)
+        self._add_contribution(x, y)
+
+    def detach(self):
+        """Stops following changes to the GameMap
+        """
+        self.game_map.remove_listener(self.refresh)
+
+    def shield_at(self, location, player_index):
+        """Gets the shield the supports reaching a location would give a mobile unit standing there
+
+        Args:
+            location: The location of a hypothetical mobile unit
+            player_index: The player controlling the mobile unit, 0 for you 1 for the enemy
+
+        Returns:
+            The summed shield of the friendly supports in range
+
+        """
+        return self.shield[player_index][location[1] * self.ARENA_SIZE + location[0]]
+
+    def path_shield(self, path, player_index):
+        """Gets the shield every mobile unit walking a path picks up, counting each support once
+
+        Args:
+            path: A list of locations, for example from GameState.find_path_to_edge
+            player_index: The player controlling the mobile units walking the path
+
+        Returns:
+            A PathShield with the shield picked up on each location, the total and the shield each support gives
+
+        """
+        size = self.ARENA_SIZE
+        coverage = self.coverage[player_index]
+        contributions = self._contributions
+        gained = []
+        supports = {}
+        for x, y in path:
+            step_shield = 0
+            for support_index in coverage.get(y * size + x, ()):
+                location = (support_index % size, support_index // size)
+                if location not in supports:
+                    supports[location] = contributions[support_index][1]
+                    step_shield += supports[location]
+            gained.append(step_shield)
+        return PathShield(gained, sum(gained), supports)
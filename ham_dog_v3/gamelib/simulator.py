@@ -0,0 +1,473 @@
+import math
+from collections import namedtuple
+
+from .navigation import FlatShortestPathFinder
+from .targeting import target_key
+
+# What happened during a single frame, each field holds one value per player index
+FrameOutcome = namedtuple("FrameOutcome", ["frame", "breaches", "self_destructs", "deaths", "structure_damage", "mobile_damage"])
+
+
+class SimulationResult:
+    """The outcome of a simulated action phase. Every list holds one value per player index, 0 for you 1 for the enemy.
+
+    Attributes :
+        * frames (int): The number of frames simulated
+        * breaches (list): The number of mobile units of each player that scored
+        * health_damage (list): The player health each player's units took from the opponent by scoring
+        * structure_damage (list): The damage each player's units dealt to enemy structures, self destructs included
+        * mobile_damage (list): The damage each player's units dealt to enemy mobile units
+        * hp_lost (list): The health, shields included, each player's mobile units lost
+        * units_lost (list): The number of mobile units of each player destroyed before scoring
+        * self_destructs (list): The number of mobile units of each player that self destructed
+        * structures_destroyed (list): The locations of each player's structures that were destroyed
+        * timeline (list): A FrameOutcome per frame, only filled in if record_frames was True
+
+    """
+    def __init__(self):
+        self.frames = 0
+        self.breaches = [0, 0]
+        self.health_damage = [0, 0]
+        self.structure_damage = [0.0, 0.0]
+        self.mobile_damage = [0.0, 0.0]
+        self.hp_lost = [0.0, 0.0]
+        self.units_lost = [0, 0]
+        self.self_destructs = [0, 0]
+        self.structures_destroyed = [[], []]
+        self.timeline = []
+
+    def __repr__(self):
+        return "SimulationResult(frames={}, breaches={}, structure_damage={}, hp_lost={}, structures_destroyed={})".format(
+            self.frames, self.breaches, self.structure_damage, self.hp_lost, [len(locations) for locations in self.structures_destroyed])
+
+
+class _Mobile:
+    """A mobile unit during a simulation"""
+    __slots__ = ("player_index", "unit_type", "health", "start_health", "index", "path", "step", "moves", "direction", "target_edge",
+                 "speed", "damage_f", "damage_i", "attack_range", "shielded_by")
+
+
+class Simulator:
+    """Plays out the action phase of a turn in python, without the game engine.
+
+    Every frame follows the order of the engine: supports shield the mobile units in range that they have not shielded yet,
+    mobile units move one step along their path whenever their speed allows it, every unit attacks the target
+    GameState.get_target would pick, and destroyed units are removed. A unit that cannot move any further scores
+    if it stands on its target edge, or self destructs otherwise. Paths come from GameState.find_path_to_edge and are
+    recomputed, keeping each unit's last move direction, whenever a structure is destroyed.
+
+    The structures are read once from the GameState, so a Simulator can run many waves against the same board.
+    Later changes to the GameState are not seen.
+
+    It runs on plain python lists and dicts, not an array backend. A wave takes roughly 0.6 to 2 ms depending on the
+    board, so it plays out hundreds up to about 1,500 waves a second, not thousands. To rank many attack options
+    inside on_turn, estimate them with AttackEvaluator and simulate only the best few, for example with evaluate(exact=True).
+
+    Attributes :
+        * game_state (:obj: GameState): A snapshot of the GameState the simulator was built from, used for pathing
+        * ARENA_SIZE (int): The size of the arena
+
+    """
+    def __init__(self, game_state):
+        """Reads the structures on the board of a GameState
+
+        Args:
+            game_state: The GameState to simulate the action phase of
+
+        """
+        self.game_state = game_state.snapshot()
+        self.game_state.suppress_warnings(True)
+        self.config = game_state.config
+        self.ARENA_SIZE = game_state.ARENA_SIZE
+        game_map = self.game_state.game_map
+        self._hit_radius = game_map._hit_radius
+        size = self.ARENA_SIZE
+
+        self._catalog = game_state.unit_catalog
+
+        self._edge_locations = game_map.get_edges()
+        self._edges = [set(y * size + x for x, y in edge) for edge in self._edge_locations]
+        self._pathfinder = FlatShortestPathFinder(size)
+
+        # Filled in as they are needed, and kept for every later simulation since the board does not change
+        self._in_range_structures = {}
+        self._range_offsets = {}
+        self._repaths = {}
+
+        # Structures by id. The id is their position in these lists, in x-major order like get_locations_in_range
+        self._structure_index = []
+        self._structure_owner = []
+        self._structure_health = []
+        self._structure_damage_f = []
+        self._structure_damage_i = []
+        self._structure_id = {}
+        self._turrets = []
+        self._supports = []
+        for x in range(size):
+            for y in range(size):
+                index = y * size + x
+                if not game_map.structure_occupancy[index]:
+                    continue
+                for unit in game_map._peek(x, y):
+                    if unit.stationary:
+                        self.__add_structure(unit, index)
+                        break
+
+    def __add_structure(self, unit, index):
+        structure_id = len(self._structure_index)
+        self._structure_id[index] = structure_id
+        self._structure_index.append(index)
+        self._structure_owner.append(unit.player_index)
+        self._structure_health.append(unit.health)
+        self._structure_damage_f.append(unit.damage_f)
+        self._structure_damage_i.append(unit.damage_i)
+        if unit.damage_i > 0 or unit.damage_f > 0:
+            reach = {}
+            for target_index, distance in self.__tiles_in_range(index, unit.attackRange):
+                reach[target_index] = distance
+            self._turrets.append((structure_id, reach))
+        if unit.shieldPerUnit > 0 or unit.shieldRange > 0:
+            shield = unit.shield_amount(self.ARENA_SIZE)
+            reach = set(target_index for target_index, _ in self.__tiles_in_range(index, unit.shieldRange))
+            self._supports.append((structure_id, reach, shield))
+
+    def __tiles_in_range(self, index, radius):
+        """Yields (index, distance) for every arena location in range of a location, in x-major order
+        """
+        size = self.ARENA_SIZE
+        x, y = index % size, index // size
+        mask = self.game_state.game_map._arena_mask
+        offsets = self._range_offsets.get(radius)
+        if offsets is None:
+            offsets = [(dx, dy, math.sqrt(dx ** 2 + dy ** 2)) for dx, dy in self.game_state.game_map.get_range_offsets(radius)]
+            self._range_offsets[radius] = offsets
+        for dx, dy, distance in offsets:
+            i = x + dx
+            j = y + dy
+            if 0 <= i < size and 0 <= j < size and mask[j * size + i]:
+                yield j * size + i, distance
+
+    def __structures_in_range(self, index, radius, player_index):
+        """The enemy structures a mobile unit at a location could attack, as (structure id, distance) in x-major order
+        """
+        key = (index, radius, player_index)
+        structures = self._in_range_structures.get(key)
+        if structures is None:
+            structures = []
+            for target_index, distance in self.__tiles_in_range(index, radius):
+                structure_id = self._structure_id.get(target_index)
+                if structure_id is not None and self._structure_owner[structure_id] != player_index:
+                    structures.append((structure_id, distance))
+            self._in_range_structures[key] = structures
+        return structures
+
+    def simulate(self, spawns, max_frames=500, record_frames=False):
+        """Plays out the action phase with the given mobile units spawned on the first frame
+
+        Args:
+            spawns: A list of (unit_type, location, count) or (unit_type, location, count, player_index) tuples.
+                Units are yours (player index 0) unless a player index is given.
+            max_frames: Stop after this many frames even if units are still alive
+            record_frames: If True, fill in SimulationResult.timeline
+
+        Returns:
+            A SimulationResult
+
+        """
+        result = SimulationResult()
+        game_map = self.game_state.game_map
+        structure_health = list(self._structure_health)
+        checkpoint = game_map.checkpoint()
+
+        mobiles = self.__spawn(spawns)
+        self.__assign_paths(mobiles)
+        frame = 0
+        while mobiles and frame < max_frames:
+            outcome = FrameOutcome(frame, [0, 0], [0, 0], [0, 0], [0.0, 0.0], [0.0, 0.0])
+            self.__shield(mobiles, structure_health)
+            mobiles, stuck = self.__move(mobiles, frame, outcome, result)
+            # Self destructing units can no longer be targeted, but still attack this frame
+            for unit in stuck:
+                outcome.self_destructs[unit.player_index] += 1
+                self_destruct = self._catalog.self_destruct[unit.unit_type]
+                if unit.moves >= self_destruct.steps_required:
+                    self.__self_destruct(unit, self_destruct, mobiles, structure_health, outcome)
+                unit.health = 0
+            self.__attack(mobiles, structure_health, outcome)
+
+            alive = []
+            for unit in mobiles:
+                if unit.health > 0:
+                    alive.append(unit)
+                elif unit not in stuck:
+                    outcome.deaths[unit.player_index] += 1
+            mobiles = alive
+            if self.__remove_destroyed(structure_health, result):
+                self.__assign_paths(mobiles)
+
+            for player_index in range(2):
+                result.breaches[player_index] += outcome.breaches[player_index]
+                result.self_destructs[player_index] += outcome.self_destructs[player_index]
+                result.units_lost[player_index] += outcome.deaths[player_index]
+                result.structure_damage[player_index] += outcome.structure_damage[player_index]
+                result.mobile_damage[player_index] += outcome.mobile_damage[player_index]
+                result.hp_lost[1 - player_index] += outcome.mobile_damage[player_index]
+            if record_frames:
+                result.timeline.append(outcome)
+            frame += 1
+
+        result.frames = frame
+        game_map.rollback(checkpoint)
+        return result
+
+    def __spawn(self, spawns):
+        """Creates the units of every spawn that is on an open arena location
+        """
+        size = self.ARENA_SIZE
+        game_state = self.game_state
+        mobiles = []
+        for spawn in spawns:
+            unit_type, location, count = spawn[:3]
+            player_index = spawn[3] if len(spawn) > 3 else 0
+            x, y = location
+            if not game_state.game_map.in_arena_bounds(location) or game_state.game_map.structure_occupancy[y * size + x]:
+                game_state.warn("Could not simulate {} at {}, the location is blocked or out of bounds", unit_type, location)
+                continue
+            template = game_state.unit_templates[unit_type, False]
+            target_edge = game_state.get_target_edge(location)
+            for _ in range(count):
+                unit = _Mobile()
+                unit.player_index = player_index
+                unit.unit_type = unit_type
+                unit.health = template.max_health
+                unit.start_health = template.max_health
+                unit.index = y * size + x
+                unit.path = None
+                unit.step = 0
+                unit.moves = 0
+                unit.direction = 0
+                unit.target_edge = target_edge
+                unit.speed = template.speed
+                unit.damage_f = template.damage_f
+                unit.damage_i = template.damage_i
+                unit.attack_range = template.attackRange
+                unit.shielded_by = set()
+                mobiles.append(unit)
+        return mobiles
+
+    def __assign_paths(self, mobiles):
+        """Gives every unit the path from its current location, sharing paths between units on the same location
+        """
+        size = self.ARENA_SIZE
+        paths = {}
+        for unit in mobiles:
+            key = (unit.index, unit.target_edge, unit.direction)
+            path = paths.get(key)
+            if path is None:
+                location = [unit.index % size, unit.index // size]
+                if unit.direction == 0:
+                    path = self.game_state.find_path_to_edge(location, unit.target_edge)
+                else:
+                    path = self.__repath(location, unit.target_edge, unit.direction)
+                paths[key] = path
+            unit.path = path
+            unit.step = 0
+
+    def __repath(self, location, target_edge, direction):
+        """The path of a unit already on the move, cached for every later simulation that destroys the same structures
+        """
+        key = (location[0], location[1], target_edge, direction, self.game_state.game_map.structure_hash)
+        path = self._repaths.get(key)
+        if path is None:
+            if len(self._repaths) > 4096:
+                self._repaths.clear()
+            path = self._pathfinder.navigate_multiple_endpoints(location, self._edge_locations[target_edge], self.game_state, direction)
+            self._repaths[key] = path
+        return path
+
+    def __occupied(self, mobiles):
+        """Groups the units by player and location, keeping their order
+        """
+        occupied = [{}, {}]
+        for unit in mobiles:
+            units = occupied[unit.player_index].get(unit.index)
+            if units is None:
+                occupied[unit.player_index][unit.index] = [unit]
+            else:
+                units.append(unit)
+        return occupied
+
+    def __shield(self, mobiles, structure_health):
+        """Every living support shields the friendly units in range it has not shielded yet
+        """
+        occupied = self.__occupied(mobiles)
+        for structure_id, reach, shield in self._supports:
+            if structure_health[structure_id] <= 0:
+                continue
+            for index, units in occupied[self._structure_owner[structure_id]].items():
+                if index in reach:
+                    for unit in units:
+                        if structure_id not in unit.shielded_by:
+                            unit.shielded_by.add(structure_id)
+                            unit.health += shield
+
+    def __move(self, mobiles, frame, outcome, result):
+        """Moves every unit whose speed allows it this frame. Units that cannot move any further score if they are on their
+        target edge, and are otherwise returned to self destruct.
+
+        Returns:
+            The units still on the board, and the units about to self destruct
+
+        """
+        size = self.ARENA_SIZE
+        remaining = []
+        stuck = []
+        for unit in mobiles:
+            if int((frame + 1) * unit.speed) > int(frame * unit.speed):
+                if unit.step + 1 < len(unit.path):
+                    unit.step += 1
+                    unit.moves += 1
+                    x, y = unit.path[unit.step]
+                    unit.direction = self._pathfinder.VERTICAL if x == unit.index % size else self._pathfinder.HORIZONTAL
+                    unit.index = y * size + x
+                elif unit.index in self._edges[unit.target_edge]:
+                    outcome.breaches[unit.player_index] += 1
+                    result.health_damage[unit.player_index] += self._catalog.breach_damage[unit.unit_type]
+                    continue
+                else:
+                    stuck.append(unit)
+            remaining.append(unit)
+        return remaining, stuck
+
+    def __self_destruct(self, unit, self_destruct, mobiles, structure_health, outcome):
+        """Deals a unit's self destruct damage to the enemy units and structures around it
+        """
+        player_index = unit.player_index
+        radius = self_destruct.radius
+        damage_i = self_destruct.damage_i
+        damage_f = self_destruct.damage_f
+        in_range = set(index for index, _ in self.__tiles_in_range(unit.index, radius))
+        for other in mobiles:
+            if other.player_index != player_index and other.index in in_range and other.health > 0:
+                damage = min(damage_i, other.health)
+                other.health -= damage
+                outcome.mobile_damage[player_index] += damage
+        for structure_id, _ in self.__structures_in_range(unit.index, radius, player_index):
+            if structure_health[structure_id] > 0:
+                damage = min(damage_f, structure_health[structure_id])
+                structure_health[structure_id] -= damage
+                outcome.structure_damage[player_index] += damage
+
+    def __attack(self, mobiles, structure_health, outcome):
+        """Every structure, then every mobile unit in spawn order, attacks the target GameState.get_target would pick
+        """
+        size = self.ARENA_SIZE
+        occupied = self.__occupied(mobiles)
+        for structure_id, reach in self._turrets:
+            if structure_health[structure_id] <= 0:
+                continue
+            player_index = self._structure_owner[structure_id]
+            if self._structure_damage_i[structure_id] > 0:
+                target = self.__pick_mobile(occupied[1 - player_index], reach, player_index)
+                if target is not None:
+                    damage = min(self._structure_damage_i[structure_id], target.health)
+                    target.health -= damage
+                    outcome.mobile_damage[player_index] += damage
+                    continue
+            if self._structure_damage_f[structure_id] > 0:
+                candidates = [(target_id, reach[self._structure_index[target_id]]) for target_id in range(len(structure_health))
+                              if self._structure_index[target_id] in reach and self._structure_owner[target_id] != player_index]
+                target_id = self.__pick_structure(candidates, structure_health, player_index)
+                if target_id is not None:
+                    damage = min(self._structure_damage_f[structure_id], structure_health[target_id])
+                    structure_health[target_id] -= damage
+                    outcome.structure_damage[player_index] += damage
+
+        for unit in mobiles:
+            player_index = unit.player_index
+            if unit.damage_i > 0 and occupied[1 - player_index]:
+                x, y = unit.index % size, unit.index // size
+                reach = {}
+                limit = unit.attack_range + self._hit_radius
+                for index in occupied[1 - player_index]:
+                    distance = math.sqrt((index % size - x) ** 2 + (index // size - y) ** 2)
+                    if distance < limit:
+                        reach[index] = distance
+                target = self.__pick_mobile(occupied[1 - player_index], reach, player_index)
+                if target is not None:
+                    damage = min(unit.damage_i, target.health)
+                    target.health -= damage
+                    outcome.mobile_damage[player_index] += damage
+                    continue
+            if unit.damage_f > 0:
+                candidates = self.__structures_in_range(unit.index, unit.attack_range, player_index)
+                target_id = self.__pick_structure(candidates, structure_health, player_index)
+                if target_id is not None:
+                    damage = min(unit.damage_f, structure_health[target_id])
+                    structure_health[target_id] -= damage
+                    outcome.structure_damage[player_index] += damage
+
+    def __pick_mobile(self, enemies, reach, player_index):
+        """Picks the enemy mobile unit get_target would choose among those on locations in reach, by targeting.target_key
+
+        Args:
+            enemies: The living enemy units by location
+            reach: Maps each location in range to its distance from the attacker
+            player_index: The attacking player
+
+        """
+        size = self.ARENA_SIZE
+        candidates = [index for index in enemies if index in reach]
+        if len(candidates) > 1:
+            candidates.sort(key=lambda index: (index % size, index // size))
+        target = None
+        best_key = None
+        for index in candidates:
+            y = index // size
+            x_distance = abs(self.ARENA_SIZE / 2 - 0.5 - index % size)
+            distance = reach[index]
+            for unit in enemies[index]:
+                if unit.health <= 0:
+                    continue
+                key = target_key(False, distance, unit.health, y, x_distance, player_index)
+                if target is None or key < best_key:
+                    target = unit
+                    best_key = key
+        return target
+
+    def __pick_structure(self, candidates, structure_health, player_index):
+        """Picks the enemy structure get_target would choose among (structure id, distance) candidates in x-major order, by targeting.target_key
+        """
+        size = self.ARENA_SIZE
+        target = None
+        best_key = None
+        for structure_id, distance in candidates:
+            health = structure_health[structure_id]
+            if health <= 0:
+                continue
+            index = self._structure_index[structure_id]
+            key = target_key(True, distance, health, index // size, abs(size / 2 - 0.5 - index % size), player_index)
+            if target is None or key < best_key:
+                target = structure_id
+                best_key = key
+        return target
+
+    def __remove_destroyed(self, structure_health, result):
+        """Takes structures destroyed this frame off the pathing board
+
+        Returns:
+            True if any structure was destroyed this frame
+
+        """
+        destroyed = [structure_id for structure_id, health in enumerate(structure_health) if health <= 0]
+        if len(destroyed) == len(result.structures_destroyed[0]) + len(result.structures_destroyed[1]):
+            return False
+        size = self.ARENA_SIZE
+        game_map = self.game_state.game_map
+        for structure_id in destroyed:
+            index = self._structure_index[structure_id]
+            if game_map.structure_occupancy[index]:
+                location = [index % size, index // size]
+                game_map.remove_unit(location)
+                result.structures_destroyed[self._structure_owner[structure_id]].append(location)
+        return True
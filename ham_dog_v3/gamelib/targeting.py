@@ -0,0 +1,57 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def target_key(stationary, distance, health, y, x_distance, player_index):
+    """The targeting priority of a candidate as a single key, the candidate with the lowest key is attacked.
+
+    Units attack mobile units before structures, then the nearest, the lowest health, the one closest to the
+    attacker's side of the arena and finally the one furthest from the center column. Among candidates with equal
+    keys the first one found is attacked, so pick the minimum in the order get_locations_in_range returns locations.
+
+    Args:
+        stationary: If the candidate is a structure
+        distance: The distance between the attacker and the candidate
+        health: The current health of the candidate
+        y: The y coordinate of the candidate
+        x_distance: abs(13.5 - x), the distance of the candidate from the center column
+        player_index: The player controlling the attacker, 0 for you 1 for the enemy
+
+    Returns:
+        A tuple to compare with the keys of other candidates. Given numpy columns, a tuple of key columns.
+
+    """
+    return (stationary, distance, health, y if player_index == 0 else -y, -x_distance)
+
+
+def pick_target(stationary, distance, health, y, x_distance, player_index):
+    """Picks the candidate GameState.get_target would attack from columns holding the stats of every candidate
+
+    The columns are lists or, when numpy is installed, numpy arrays. numpy arrays are reduced one priority
+    level at a time, which beats comparing keys once there are many candidates, for example every mobile unit
+    in range of a turret.
+
+    Args:
+        stationary: If each candidate is a structure
+        distance: The distance between the attacker and each candidate
+        health: The current health of each candidate
+        y: The y coordinate of each candidate
+        x_distance: abs(13.5 - x) for each candidate
+        player_index: The player controlling the attacker, 0 for you 1 for the enemy
+
+    Returns:
+        The index of the candidate to attack, None if there are no candidates
+
+    """
+    count = len(distance)
+    if count <= 1:
+        return 0 if count else None
+    if np is not None and isinstance(distance, np.ndarray):
+        # target_key works on whole columns too, each of its levels narrows the remaining candidates
+        remaining = np.ones(count, dtype=bool)
+        for key in target_key(stationary, distance, health, y, x_distance, player_index):
+            remaining &= key == key[remaining].min()
+        return int(np.argmax(remaining))
+    return min(range(count), key=lambda i: target_key(stationary[i], distance[i], health[i], y[i], x_distance[i], player_index))
@@ -1,7 +1,75 @@
 import unittest
 import json
+import os
+import glob
+import random
+import time
+import io
+import contextlib
+import itertools
+import threading
+from .algocore import AlgoCore
+from .background import BackgroundTasks
+from .build_plan import BuildPlan, NOT_AFFORDABLE, BLOCKED, ENEMY_TERRITORY, NO_STRUCTURE, ALREADY_UPGRADED, ALREADY_REMOVED
+from .util import decode_sections, decode_json, set_json_decoder, debug_write, log, set_log_level, set_log_buffering, flush_log, DEBUG, INFO, WARNING, SILENT
 from .game_state import GameState
-from .unit import GameUnit
+from .unit import GameUnit, get_unit_catalog
+from .threat_map import ThreatMap
+from .shield_map import ShieldMap
+from .simulator import Simulator
+from .evaluator import AttackEvaluator
+from .targeting import pick_target
+from .board_arrays import np
+
+REPLAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "replays")
+
+def replay_states(step=1, state_types=(0,)):
+    """Yields (config, state string) for every step-th frame of the given types in the shipped replays
+    """
+    for replay_file in sorted(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay"))):
+        with open(replay_file) as replay:
+            lines = [line for line in replay if line.strip()]
+        config = json.loads(lines[0])
+        frames = [line for line in lines[1:] if json.loads(line)["turnInfo"][0] in state_types]
+        for line in frames[::step]:
+            yield config, line
+
+def replay_action_phases():
+    """Yields (config, board, spawns, frames) for every action phase of the shipped replays in which mobile units were spawned.
+    board is the state string of the first action frame without its mobile units, spawns are (unit_type, location, 1, player_index)
+    as taken by Simulator.simulate and frames are the parsed action frames.
+    """
+    for replay_file in sorted(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay"))):
+        with open(replay_file) as replay:
+            lines = [line for line in replay if line.strip()]
+        config = json.loads(lines[0])
+        shorthands = [unit_information.get("shorthand") for unit_information in config["unitInformation"]]
+        mobile_types = [index for index, unit_information in enumerate(config["unitInformation"]) if unit_information.get("unitCategory") == 1]
+        phases = {}
+        for line in lines[1:]:
+            frame = json.loads(line)
+            if frame["turnInfo"][0] == 1:
+                phases.setdefault(frame["turnInfo"][1], []).append(frame)
+        for turn in sorted(phases):
+            frames = phases[turn]
+            spawns = [(shorthands[event[1]], event[0], 1, event[3] - 1) for event in frames[0]["events"]["spawn"] if event[1] in mobile_types]
+            if not spawns:
+                continue
+            board = dict(frames[0])
+            for key in ["p1Units", "p2Units"]:
+                board[key] = [[] if index in mobile_types else units for index, units in enumerate(frames[0][key])]
+            yield config, json.dumps(board), spawns, frames
+
+def describe_board(game_map):
+    """Gets the units on every location as plain tuples, for comparing boards
+    """
+    board = {}
+    for x in range(28):
+        for y in range(28):
+            if game_map.in_arena_bounds([x, y]):
+                board[x, y] = [(unit.unit_type, unit.player_index, unit.health, unit.max_health, unit.upgraded, unit.pending_removal,
+                                unit.damage_i, unit.attackRange, unit.shieldPerUnit) for unit in game_map._peek(x, y)]
+    return board
 
 class BasicTests(unittest.TestCase):
 
@@ -215,6 +283,91 @@ class BasicTests(unittest.TestCase):
         self.assertEqual([("DF", 13, 6)], game._build_stack, "Build queue is wrong!")
         self.assertEqual([("SI", 13, 0), ("SI", 13, 0), ("SI", 13, 0)], game._deploy_stack, "Deploy queue is wrong!")
 
+    def test_bulk_spawning(self):
+        game = self.make_turn_0_map()
+        self.assertEqual(5, game.attempt_spawn("PI", [14, 0], 20), "Only the affordable scouts should be spawned")
+        self.assertEqual(0, game.get_resource(game.MP))
+        self.assertEqual(5, len(game.game_map[14, 0]))
+        self.assertEqual([("PI", 14, 0)] * 5, game._deploy_stack)
+        self.assertEqual(1, game.attempt_spawn("FF", (13, 3), 3), "Structures should be spawned once per location")
+        self.assertEqual([("FF", 13, 3)], game._build_stack)
+
+        old_edges = game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT) + game.game_map.get_edge_locations(game.game_map.BOTTOM_RIGHT)
+        self.assertEqual(game.game_map.get_edges()[2], old_edges[:14])
+        for x in range(28):
+            for y in range(28):
+                in_arena = game.game_map.in_arena_bounds([x, y])
+                self.assertEqual([x, y] in old_edges, game.game_map.on_deploy_edge([x, y]))
+                self.assertEqual(in_arena and y < 14, game.game_map.in_territory([x, y], 0))
+                self.assertEqual(in_arena and y >= 14, game.game_map.in_territory([x, y], 1))
+                self.assertEqual(game.game_map.on_deploy_edge([x, 27 - y], 1), game.game_map.on_deploy_edge([x, y], 0))
+
+    def test_build_plan(self):
+        game = self.make_turn_0_map()
+        expected = self.make_turn_0_map()
+        expected.suppress_warnings(True)
+        walls = [[x, 13] for x in range(28) if game.game_map.in_arena_bounds([x, 13])]
+        held = game.get_resources()
+
+        plan = BuildPlan()
+        plan.spawn("FF", walls)
+        plan.upgrade([[3, 12], [3, 13]])
+        plan.remove([[3, 13], [3, 13], [3, 12]])
+        plan.spawn("DF", [[3, 12], [3, 13], [13, 20]], priority=1)
+        plan.upgrade([3, 12], priority=1)
+        plan.spawn("PI", [14, 0], 20)
+        report = game.execute_plan(plan)
+
+        expected.attempt_spawn("DF", [[3, 12], [3, 13], [13, 20]])
+        expected.attempt_upgrade([3, 12])
+        expected.attempt_spawn("FF", walls)
+        expected.attempt_upgrade([[3, 12], [3, 13]])
+        expected.attempt_remove([[3, 13], [3, 12]])
+        expected.attempt_spawn("PI", [14, 0], 20)
+        self.assertEqual(expected._build_stack, game._build_stack, "A plan should build like the same attempts in priority order")
+        self.assertEqual(expected._deploy_stack, game._deploy_stack)
+        self.assertEqual(expected.get_resources(), game.get_resources())
+        self.assertEqual(expected.get_resources(), [held[0] - report.spent[0], held[1] - report.spent[1]])
+
+        self.assertEqual([[3, 12]], report.upgraded)
+        self.assertEqual([[3, 13], [3, 12]], report.removed)
+        self.assertEqual(5, report.spawned_at([14, 0]))
+        reasons = [(skipped.action, skipped.location, skipped.reason) for skipped in report.skipped]
+        self.assertIn(("spawn", [13, 20], ENEMY_TERRITORY), reasons)
+        self.assertIn(("spawn", [3, 13], BLOCKED), reasons)
+        self.assertIn(("upgrade", [3, 12], ALREADY_UPGRADED), reasons)
+        self.assertIn(("remove", [3, 13], ALREADY_REMOVED), reasons)
+        self.assertIn(("spawn", [14, 0], NOT_AFFORDABLE), reasons)
+        self.assertIn(("upgrade", [3, 13], NOT_AFFORDABLE), reasons)
+        self.assertEqual([], [skipped for skipped in report.skipped if skipped.reason == NO_STRUCTURE])
+
+    def test_unit_catalog(self):
+        game = self.make_turn_0_map()
+        catalog = game.unit_catalog
+        self.assertIs(catalog, get_unit_catalog(game.config))
+        self.assertIs(catalog, GameState(game.config, game.serialized_string).unit_catalog, "GameStates of the same config should share a catalog")
+        with self.assertRaises(AttributeError):
+            catalog.WALL = "DF"
+        with self.assertRaises(TypeError):
+            catalog.costs["FF", False] = (0, 0)
+
+        for index, type_config in enumerate(game.config["unitInformation"][:6]):
+            unit_type = type_config["shorthand"]
+            self.assertEqual(index, catalog.type_index[unit_type])
+            base_cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
+            upgrade = type_config.get("upgrade", {})
+            self.assertEqual(base_cost, game.type_cost(unit_type))
+            self.assertEqual([upgrade.get("cost1", base_cost[0]), upgrade.get("cost2", base_cost[1])], game.type_cost(unit_type, True))
+            self.assertEqual("upgrade" in type_config, unit_type in catalog.upgradable)
+            self.assertEqual(type_config.get("unitCategory") == 0, catalog.is_stationary(unit_type))
+            self.assertEqual(unit_type, catalog.types[index])
+            self.assertEqual((type_config.get("selfDestructStepsRequired", 0), type_config.get("selfDestructRange", 0),
+                              type_config.get("selfDestructDamageTower", 0), type_config.get("selfDestructDamageWalker", 0)),
+                             tuple(catalog.self_destruct[unit_type]))
+            self.assertEqual(type_config.get("playerBreachDamage", 1), catalog.breach_damage[unit_type])
+        self.assertEqual(("FF", "EF", "DF"), catalog.structure_types)
+        self.assertEqual(max(type_config.get("attackRange", 0) for type_config in game.config["unitInformation"]), catalog.max_attack_range)
+
     def test_trivial_functions(self):
         game = self.make_turn_0_map()
 
@@ -235,11 +388,67 @@ class BasicTests(unittest.TestCase):
             game.game_map.add_unit("FF", [13,13])
         self.assertEqual(1, len(game.game_map[13,13]), "Towers seem to be stacking")
         
+    def test_structure_occupancy(self):
+        game = self.make_turn_0_map()
+        occupancy = game.game_map.structure_occupancy
+        game.game_map.add_unit("EI", [13,13])
+        self.assertEqual(0, occupancy[13 * 28 + 13], "Mobile units should not block")
+        game.game_map.add_unit("FF", [13,13])
+        self.assertEqual(1, occupancy[13 * 28 + 13], "Walls should block")
+        game.game_map.remove_unit([13,13])
+        self.assertEqual(0, occupancy[13 * 28 + 13], "Removed walls should not block")
+        game.game_map[12,12] = [GameUnit("DF", game.config, 0, None, 12, 12)]
+        self.assertEqual(1, occupancy[12 * 28 + 12], "Assigned structures should block")
+        self.assertEqual(1, sum(occupancy), "Only one location should be blocked")
+
+    def test_unit_templates(self):
+        game = self.make_turn_0_map()
+        turret_config = game.config["unitInformation"][2]
+        turret = GameUnit("DF", game.config, 0, None, 3, 12)
+        self.assertFalse(hasattr(turret, "__dict__"), "GameUnit should use __slots__")
+        self.assertEqual(turret_config["attackDamageWalker"], turret.damage_i)
+        turret.upgrade()
+        upgrade_config = turret_config["upgrade"]
+        self.assertTrue(turret.upgraded)
+        self.assertEqual(upgrade_config.get("attackDamageWalker", turret_config["attackDamageWalker"]), turret.damage_i)
+        self.assertEqual(upgrade_config.get("attackRange", turret_config["attackRange"]), turret.attackRange)
+        self.assertEqual([turret_config.get("cost1", 0) + upgrade_config.get("cost1", 0), turret_config.get("cost2", 0) + upgrade_config.get("cost2", 0)], turret.cost)
+        self.assertIs(game.unit_templates, GameState(game.config, game.serialized_string).unit_templates, "Templates should be built once per config")
+
+    def test_path_cache(self):
+        game = self.make_turn_0_map()
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual((0, 1), (game.path_cache.hits, game.path_cache.misses), "The first query should miss")
+        self.assertEqual(path, game.find_path_to_edge([13, 0]), "Cached path differs")
+        self.assertEqual(1, game.path_cache.hits, "The second query should hit")
+
+        game.game_map.add_unit("FF", [14, 1])
+        blocked_path = game.find_path_to_edge([13, 0])
+        self.assertEqual(2, game.path_cache.misses, "Adding a wall should invalidate the cached path")
+        self.assertNotIn([14, 1], blocked_path, "Path goes through a wall")
+        game.game_map.remove_unit([14, 1])
+        self.assertEqual(path, game.find_path_to_edge([13, 0]), "Removing the wall should restore the first path")
+        self.assertEqual(2, game.path_cache.hits, "The original layout should hit again")
+        self.assertEqual([path], game.find_paths_to_edges([[13, 0]]), "Batch queries should use the cache")
+
     def test_get_units_in_range(self):
         game = self.make_turn_0_map()
         self.assertEqual(1, len(game.game_map.get_locations_in_range([13,13], 0)), "We should be in 0 range of ourself")
         self.assertEqual(37, len(game.game_map.get_locations_in_range([13,13], 3.5)), "Wrong number of tiles in range")
 
+    def test_range_offsets_match_scan(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        for radius in [0, 1.5, 3.5, 4.5]:
+            for x in range(-2, 30):
+                for y in range(-2, 30):
+                    expected = []
+                    for i in range(x - 5, x + 6):
+                        for j in range(y - 5, y + 6):
+                            if game_map.in_arena_bounds([i, j]) and game_map.distance_between_locations([x, y], [i, j]) < radius + 0.01:
+                                expected.append([i, j])
+                    self.assertEqual(expected, game_map.get_locations_in_range([x, y], radius), "Wrong locations in range {} of {}".format(radius, [x, y]))
+
     def _test_get_attackers(self):
         game = self.make_turn_0_map()
         
@@ -275,3 +484,671 @@ class BasicTests(unittest.TestCase):
         actual = game.project_future_MP(turns)
         self.assertAlmostEqual(actual, expected, 0, "Expected {} MP {} turns from now, got {}".format(expected, turns, actual))
 
+    def test_time_budget(self):
+        game = self.make_turn_0_map()
+        self.assertAlmostEqual(game.time_limit - game.time_margin, game.time_remaining(), 1)
+        late = GameState(game.config, game.serialized_string, start_time=time.perf_counter() - game.time_limit)
+        self.assertLess(late.time_remaining(), 0)
+        self.assertTrue(late.time_budget().expired())
+
+        # A search cut short by check() keeps its best candidate, queues it and still submits the turn
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            with game.time_budget(seconds=0.01, submit=True, apply=lambda x: game.attempt_spawn("FF", [x, 13])) as budget:
+                for score in itertools.count():
+                    budget.offer(score % 28, score)
+                    budget.check()
+                self.fail("check() should end the search")
+        self.assertTrue(budget.exceeded)
+        self.assertGreater(budget.best_score, 0)
+        self.assertEqual([json.dumps([["FF", budget.best, 13]]), "[]"], output.getvalue().split("\n")[:2])
+
+        applied = []
+        with game.time_budget(apply=applied.append) as budget:
+            budget.offer("plan", 1)
+        self.assertEqual(["plan"], applied)
+        with self.assertRaises(ValueError):
+            with game.time_budget(apply=applied.append) as budget:
+                budget.offer("other plan", 1)
+                raise ValueError()
+        self.assertEqual(["plan"], applied, "Only searches that ran out of time or finished should be applied")
+
+        with game.time_budget(seconds=0) as budget:
+            self.assertEqual([], list(budget.iterate(range(10))))
+        self.assertTrue(budget.exceeded)
+
+        algo = AlgoCore()
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            algo.record_turn_time(3, 0.1)
+            algo.record_turn_time(4, algo.time_limit * 0.9)
+        self.assertEqual([(3, 0.1), (4, algo.time_limit * 0.9)], algo.turn_times)
+        self.assertEqual(1, len(errors.getvalue().splitlines()), "Only slow turns should be reported")
+
+    def test_logging(self):
+        self.addCleanup(set_log_level, DEBUG)
+        self.addCleanup(set_log_buffering, False)
+        formatted = []
+        class Location:
+            def __format__(self, spec):
+                formatted.append(spec)
+                return "[13, 0]"
+
+        game = self.make_turn_0_map()
+        game.suppress_warnings(False)
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            set_log_level(WARNING)
+            debug_write("dropped")
+            log(INFO, "dropped {}", Location())
+            game.warn("Kept {}", Location())
+            set_log_level(SILENT)
+            game.warn("dropped {}", Location())
+            set_log_level(DEBUG)
+            game.suppress_warnings(True)
+            game.warn("dropped {}", Location())
+        self.assertEqual("Kept [13, 0]\n", errors.getvalue())
+        self.assertEqual(1, len(formatted), "Messages that are not printed should not be formatted")
+
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            set_log_buffering(True)
+            debug_write("first")
+            log(WARNING, "second {}", 2)
+            self.assertEqual("", errors.getvalue(), "Buffered messages should wait for flush_log")
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                game.submit_turn()
+            self.assertEqual("first\nsecond 2\n", errors.getvalue(), "Submitting the turn should flush the buffer")
+            flush_log()
+            self.assertEqual("first\nsecond 2\n", errors.getvalue())
+
+    def test_background_tasks(self):
+        tasks = BackgroundTasks()
+        release = threading.Event()
+        tasks.submit("slow", release.wait, 5)
+        tasks.submit("queued", sum, [1, 2])
+        tasks.submit("queued", sum, [3, 4])
+        self.assertEqual({}, tasks.collect(), "Unfinished tasks should not be waited for without a timeout")
+        release.set()
+
+        game = self.make_turn_0_map()
+        tasks.submit("paths", game.snapshot().find_paths_to_edges, [[13, 0], [14, 0]])
+        tasks.submit("replaced", sum, [1, 2])
+        tasks.submit("replaced", sum, [3, 4])
+        tasks.submit("failing", int, "not a number")
+        with contextlib.redirect_stderr(io.StringIO()):
+            results = tasks.collect(timeout=5)
+        self.assertEqual(game.find_paths_to_edges([[13, 0], [14, 0]]), results["paths"])
+        self.assertEqual(7, results["replaced"])
+        self.assertNotIn("failing", results)
+        self.assertEqual(1, tasks.failures)
+        self.assertEqual(0, tasks.pending())
+        tasks.shutdown()
+
+
+
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class PathingParityTests(unittest.TestCase):
+
+    def assert_same_paths(self, game, starts):
+        for start in starts:
+            if game.contains_stationary_unit(start):
+                continue
+            game.use_legacy_pathfinder(True)
+            game.path_cache.clear()
+            expected = game.find_path_to_edge(start)
+            game.use_legacy_pathfinder(False)
+            game.path_cache.clear()
+            got = game.find_path_to_edge(start)
+            self.assertEqual(expected, got, "Flat pathfinder disagrees with the original from {}".format(start))
+
+    def test_replay_parity(self):
+        for config, state_string in replay_states(step=10):
+            game = GameState(config, state_string)
+            game.suppress_warnings(True)
+            edges = game.game_map.get_edges()
+            self.assert_same_paths(game, edges[game.game_map.BOTTOM_LEFT] + edges[game.game_map.BOTTOM_RIGHT] + edges[game.game_map.TOP_LEFT])
+
+    def test_batch_parity(self):
+        rng = random.Random(99)
+        for config, state_string in replay_states(step=12):
+            game = GameState(config, state_string)
+            game.suppress_warnings(True)
+            arena = [[x, y] for x in range(28) for y in range(28) if game.game_map.in_arena_bounds([x, y])]
+            for location in rng.sample(arena, 60):
+                game.game_map.add_unit("FF", location, 0)
+            starts = rng.sample(arena, 60)
+            expected = [None if game.contains_stationary_unit(start) else game.find_path_to_edge(start) for start in starts]
+            game.path_cache.clear()
+            self.assertEqual(expected, game.find_paths_to_edges(starts))
+
+    def test_random_board_parity(self):
+        rng = random.Random(1234)
+        for config, state_string in replay_states(step=40):
+            game = GameState(config, state_string)
+            game.suppress_warnings(True)
+            arena = [[x, y] for x in range(28) for y in range(28) if game.game_map.in_arena_bounds([x, y])]
+            # Dense random walls leave plenty of sealed pockets, so self destruct paths get covered too
+            for location in rng.sample(arena, 160):
+                game.game_map.add_unit("FF", location, rng.randint(0, 1))
+            self.assert_same_paths(game, rng.sample(arena, 40))
+
+
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class LazyParseTests(unittest.TestCase):
+
+    def test_matches_eager_parse(self):
+        for config, state_string in replay_states(step=5, state_types=(0, 1)):
+            eager = GameState(config, state_string)
+            lazy = GameState(config, state_string, lazy=True)
+            self.assertEqual(eager.game_map.structure_occupancy, lazy.game_map.structure_occupancy)
+            self.assertEqual(eager.game_map.structure_hash, lazy.game_map.structure_hash)
+            self.assertEqual(describe_board(eager.game_map), describe_board(lazy.game_map))
+
+    def test_pathing_before_units_are_built(self):
+        config, state_string = list(replay_states(step=20))[1]
+        eager = GameState(config, state_string)
+        lazy = GameState(config, state_string, lazy=True)
+        edges = eager.game_map.get_edges()
+        for start in edges[eager.game_map.BOTTOM_LEFT] + edges[eager.game_map.BOTTOM_RIGHT]:
+            if not eager.contains_stationary_unit(start):
+                self.assertEqual(eager.find_path_to_edge(start), lazy.find_path_to_edge(start))
+
+    def test_removed_tiles_stay_empty(self):
+        config, state_string = list(replay_states(step=20))[1]
+        lazy = GameState(config, state_string, lazy=True)
+        locations = [[x, y] for x in range(28) for y in range(28) if lazy.game_map.structure_occupancy[y * 28 + x]]
+        lazy.game_map.remove_unit(locations[0])
+        self.assertEqual(lazy.game_map[locations[0]], [])
+        self.assertFalse(lazy.contains_stationary_unit(locations[0]))
+
+
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class UnitRegistryTests(unittest.TestCase):
+
+    def assert_matches_map(self, game):
+        scanned = {}
+        for y in range(28):
+            for x in range(28):
+                if game.game_map.in_arena_bounds([x, y]):
+                    for unit in game.game_map[x, y]:
+                        scanned.setdefault((unit.player_index, unit.unit_type), []).append(unit)
+        for player_index in (0, 1):
+            for unit_type in ("FF", "EF", "DF", "PI", "EI", "SI"):
+                expected = [(unit.x, unit.y, unit.health, unit.upgraded) for unit in scanned.get((player_index, unit_type), [])]
+                found = [(unit.x, unit.y, unit.health, unit.upgraded) for unit in game.units(player_index, unit_type)]
+                self.assertEqual(expected, found)
+            damaged = [[unit.x, unit.y] for unit_type in ("FF", "EF", "DF") for unit in scanned.get((player_index, unit_type), [])
+                       if unit.health < unit.max_health * 0.75 and not unit.pending_removal]
+            self.assertEqual(sorted(damaged, key=lambda location: (location[1], location[0])),
+                             [[unit.x, unit.y] for unit in game.damaged_structures(0.75, player_index)])
+
+    def test_matches_map(self):
+        for config, state_string in replay_states(step=25, state_types=(0, 1)):
+            lazy = GameState(config, state_string, lazy=True)
+            self.assertEqual(len(lazy.units(1, "DF")), lazy.get_unit_registry().count(1, "DF"))
+            structures = lazy.units(0, "FF") + lazy.units(0, "EF") + lazy.units(0, "DF")
+            self.assertEqual(sorted(structures, key=lambda unit: (unit.y, unit.x)), [unit for unit in lazy.units(0) if unit.stationary])
+            self.assert_matches_map(lazy)
+            self.assert_matches_map(GameState(config, state_string))
+
+    def test_follows_changes(self):
+        config, state_string = list(replay_states(step=20))[1]
+        game = GameState(config, state_string, lazy=True)
+        game.suppress_warnings(True)
+        checkpoint = game.checkpoint()
+        game.attempt_spawn("DF", [[13, 10], [14, 10], [5, 10]])
+        game.attempt_upgrade([13, 10])
+        game.attempt_spawn("PI", [13, 0], 3)
+        game.game_map.add_unit("EF", [14, 16], 1)
+        structures = game.get_unit_registry().locations(0, "FF")
+        game.game_map.remove_unit(structures[0])
+        self.assert_matches_map(game)
+        snapshot = game.snapshot()
+        snapshot.game_map.remove_unit(structures[1])
+        self.assert_matches_map(snapshot)
+        game.rollback(checkpoint)
+        self.assert_matches_map(game)
+
+
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class SnapshotTests(unittest.TestCase):
+
+    def make_changes(self, game):
+        game.suppress_warnings(True)
+        structures = [[x, y] for x in range(28) for y in range(14) if game.game_map.structure_occupancy[y * 28 + x]]
+        game.attempt_spawn("DF", [[13, 10], [14, 10], [5, 10]])
+        game.attempt_upgrade([13, 10])
+        game.attempt_spawn("PI", [13, 0], 3)
+        game.game_map.add_unit("EF", [14, 16], 1)
+        for location in structures[:3]:
+            game.game_map[location][0].health -= 1
+        if structures:
+            game.game_map.remove_unit(structures[-1])
+
+    def test_snapshot_is_independent(self):
+        for config, state_string in list(replay_states(step=25))[1:]:
+            game = GameState(config, state_string)
+            before = describe_board(game.game_map)
+            occupancy = bytearray(game.game_map.structure_occupancy)
+            resources = game.get_resources()
+            snapshot = game.snapshot()
+            self.make_changes(snapshot)
+            self.assertEqual(before, describe_board(game.game_map), "Changing a snapshot changed the original")
+            self.assertEqual(occupancy, game.game_map.structure_occupancy)
+            self.assertEqual(resources, game.get_resources())
+            self.assertEqual([], game._build_stack)
+
+            expected = describe_board(snapshot.game_map)
+            self.make_changes(game)
+            self.assertEqual(expected, describe_board(snapshot.game_map), "Changing the original changed a snapshot")
+
+    def test_rollback(self):
+        for config, state_string in list(replay_states(step=25))[1:]:
+            game = GameState(config, state_string)
+            threat_map = game.get_threat_map()
+            before = describe_board(game.game_map)
+            occupancy = bytearray(game.game_map.structure_occupancy)
+            layout_hash = game.game_map.structure_hash
+            resources = game.get_resources()
+            damage = [list(player_damage) for player_damage in threat_map.damage]
+
+            checkpoint = game.checkpoint()
+            self.make_changes(game)
+            inner = game.checkpoint()
+            game.game_map.add_unit("FF", [13, 13], 0)
+            game.rollback(inner)
+            self.assertFalse(game.contains_stationary_unit([13, 13]), "Inner rollback should undo the wall")
+            self.assertNotEqual(before, describe_board(game.game_map))
+            game.rollback(checkpoint)
+
+            self.assertEqual(before, describe_board(game.game_map))
+            self.assertEqual(occupancy, game.game_map.structure_occupancy)
+            self.assertEqual(layout_hash, game.game_map.structure_hash)
+            self.assertEqual(resources, game.get_resources())
+            self.assertEqual([], game._build_stack)
+            self.assertEqual(damage, threat_map.damage, "The threat map should follow a rollback")
+
+
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class SimulatorTests(unittest.TestCase):
+
+    def test_matches_replays(self):
+        phases = 0
+        matching = 0
+        for config, board, spawns, frames in replay_action_phases():
+            game = GameState(config, board)
+            before = describe_board(game.game_map)
+            result = Simulator(game).simulate(spawns)
+            self.assertEqual(before, describe_board(game.game_map), "Simulating should not change the GameState")
+            breaches = [0, 0]
+            for frame in frames:
+                for breach in frame["events"]["breach"]:
+                    breaches[breach[4] - 1] += 1
+            phases += 1
+            matching += breaches == result.breaches
+        self.assertGreater(phases, 50)
+        self.assertGreaterEqual(matching / phases, 0.95, "Only {} of {} simulated action phases scored like the engine".format(matching, phases))
+
+    def test_open_board(self):
+        config, state_string = next(replay_states())
+        game = GameState(config, state_string)
+        result = Simulator(game).simulate([("PI", [13, 0], 5)], record_frames=True)
+        self.assertEqual([5, 0], result.breaches)
+        self.assertEqual([0, 0], result.units_lost)
+        # Scouts move every frame and score on the first frame they cannot move any further
+        self.assertEqual(len(game.find_path_to_edge([13, 0])), result.frames)
+        self.assertEqual(result.frames, len(result.timeline))
+        self.assertEqual([5, 0], result.timeline[-1].breaches)
+
+    def test_frame_timelines(self):
+        config, state_string = next(replay_states())
+        game = GameState(config, state_string)
+        paths = game.find_paths_to_edges([[13, 0], [14, 0], [3, 10]])
+        for unit_type in ["PI", "EI", "SI"]:
+            timelines = game.frame_timelines(paths, unit_type)
+            self.assertIs(timelines[0], game.frame_timelines([list(paths[0])], unit_type)[0])
+            self.assertEqual(tuple(tuple(location) for location in paths[0]), timelines[0].path)
+            for path, timeline in zip(paths, timelines):
+                expanded = [tuple(location) for location, frames in zip(path, timeline.frames) for _ in range(frames)]
+                self.assertEqual(expanded, list(timeline.locations))
+                # The units leave the board on the frame after the last one they are attacked on
+                result = Simulator(game).simulate([(unit_type, path[0], 1)])
+                self.assertEqual(len(timeline.locations) + 1, result.frames)
+        self.assertEqual((0, 1, 1), game.frame_timelines([paths[0][:3]], "PI")[0].frames)
+        self.assertEqual((1, 2, 2), game.frame_timelines([paths[0][:3]], "EI")[0].frames)
+
+    def test_self_destruct(self):
+        config, state_string = next(replay_states())
+        game = GameState(config, state_string)
+        for x in range(28):
+            if game.game_map.in_arena_bounds([x, 14]):
+                game.game_map.add_unit("FF", [x, 14], 1)
+        result = Simulator(game).simulate([("PI", [13, 0], 3)])
+        self.assertEqual([0, 0], result.breaches)
+        self.assertEqual([3, 0], result.self_destructs)
+        self.assertGreater(result.structure_damage[0], 0, "Scouts that walked far enough should damage walls when they self destruct")
+
+    def test_turrets_and_supports(self):
+        config, state_string = next(replay_states())
+        game = GameState(config, state_string)
+        path = game.find_path_to_edge([13, 0])
+        for x, y in path:
+            if y == 10:
+                game.game_map.add_unit("DF", [x - 1, y + 1], 1)
+                game.game_map.add_unit("DF", [x + 2, y], 1)
+                break
+        unshielded = Simulator(game).simulate([("PI", [13, 0], 5)])
+        self.assertGreater(unshielded.units_lost[0], 0)
+        self.assertAlmostEqual(unshielded.hp_lost[0], unshielded.mobile_damage[1])
+        game.game_map.add_unit("EF", [13, 2], 0)
+        game.game_map.add_unit("EF", [14, 2], 0)
+        shielded = Simulator(game).simulate([("PI", [13, 0], 5)])
+        self.assertLess(shielded.units_lost[0], unshielded.units_lost[0], "Shields should keep more scouts alive")
+
+
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class EvaluatorTests(unittest.TestCase):
+
+    def test_open_board(self):
+        config, state_string = next(replay_states())
+        game = GameState(config, state_string)
+        estimate, = AttackEvaluator(game).evaluate([([13, 0], "PI", 5)])
+        self.assertEqual(5, estimate.breaches)
+        self.assertEqual(0, estimate.hp_lost)
+        self.assertEqual(game.find_path_to_edge([13, 0]), estimate.path)
+
+    def test_batch_matches_single_options(self):
+        config, state_string = list(replay_states(step=20))[1]
+        game = GameState(config, state_string)
+        game.suppress_warnings(True)
+        edges = game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT) + game.game_map.get_edge_locations(game.game_map.BOTTOM_RIGHT)
+        options = [(location, unit_type, count) for location in edges for unit_type in ["PI", "EI", "SI"] for count in [1, 6]]
+        batch = AttackEvaluator(game).evaluate(options)
+        self.assertEqual(len(options), len(batch))
+        for option, estimate in zip(options, batch):
+            self.assertEqual(estimate, AttackEvaluator(game).evaluate([option])[0])
+            if game.contains_stationary_unit(option[0]):
+                self.assertIsNone(estimate.path)
+
+    def test_agrees_with_simulator(self):
+        options = 0
+        matching = 0
+        for config, board, spawns, frames in list(replay_action_phases())[::4]:
+            game = GameState(config, board)
+            game.suppress_warnings(True)
+            evaluator = AttackEvaluator(game)
+            candidates = [(location, unit_type, 5) for location in [[13, 0], [14, 0], [3, 10], [24, 10]] for unit_type in ["PI", "EI"]]
+            for estimate, exact in zip(evaluator.evaluate(candidates), evaluator.evaluate(candidates, exact=True)):
+                if estimate.path is not None:
+                    options += 1
+                    matching += estimate.breaches == exact.breaches
+        self.assertGreater(options, 50)
+        self.assertGreaterEqual(matching / options, 0.8, "Only {} of {} estimates scored like the Simulator".format(matching, options))
+
+
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class ActionFrameTests(unittest.TestCase):
+
+    def test_decode_sections(self):
+        for _, frame in replay_states(step=25, state_types=(0, 1)):
+            parsed = json.loads(frame)
+            sections = decode_sections(frame, ["turnInfo", "events", "p1Units", "missing"])
+            self.assertEqual({key: parsed[key] for key in ["turnInfo", "events", "p1Units"]}, sections)
+
+    def test_decode_json(self):
+        calls = []
+        for _, frame in replay_states(step=50, state_types=(0, 1)):
+            self.assertEqual(json.loads(frame), decode_json(frame))
+            set_json_decoder(lambda message: calls.append(message) or json.loads(message))
+            self.assertEqual(json.loads(frame), decode_json(frame))
+            set_json_decoder()
+        self.assertGreater(len(calls), 0, "decode_json should use the decoder it is given")
+
+    def test_decode_action_frame(self):
+        _, frame = next(replay_states(state_types=(1,)))
+        algo = AlgoCore()
+        self.assertIs(frame, algo.decode_action_frame(frame), "Frames are passed as strings unless parsing is asked for")
+        algo.parse_action_frames = True
+        self.assertEqual(json.loads(frame), algo.decode_action_frame(frame))
+        algo.action_frame_sections = ["events"]
+        parsed = json.loads(frame)
+        self.assertEqual({"turnInfo": parsed["turnInfo"], "events": parsed["events"]}, algo.decode_action_frame(frame))
+
+
+def chained_get_target(game, attacking_unit):
+    """The comparison chain get_target used before targeting keys, kept as the reference
+    """
+    target = None
+    target_stationary = True
+    target_distance = float("inf")
+    target_health = float("inf")
+    target_y = game.ARENA_SIZE
+    target_x_distance = 0
+    for location in game.game_map.get_locations_in_range([attacking_unit.x, attacking_unit.y], attacking_unit.attackRange):
+        for unit in game.game_map[location]:
+            if unit.player_index == attacking_unit.player_index or (attacking_unit.damage_f == 0 and unit.stationary) or (attacking_unit.damage_i == 0 and not unit.stationary):
+                continue
+            new_target = False
+            unit_distance = game.game_map.distance_between_locations(location, [attacking_unit.x, attacking_unit.y])
+            unit_x_distance = abs(game.HALF_ARENA - 0.5 - unit.x)
+            if target_stationary and not unit.stationary:
+                new_target = True
+            elif not target_stationary and unit.stationary:
+                continue
+            if target_distance > unit_distance:
+                new_target = True
+            elif target_distance < unit_distance and not new_target:
+                continue
+            if target_health > unit.health:
+                new_target = True
+            elif target_health < unit.health and not new_target:
+                continue
+            if attacking_unit.player_index == 0:
+                if target_y > unit.y:
+                    new_target = True
+                elif target_y < unit.y and not new_target:
+                    continue
+            else:
+                if target_y < unit.y:
+                    new_target = True
+                elif target_y > unit.y and not new_target:
+                    continue
+            if target_x_distance < unit_x_distance:
+                new_target = True
+            if new_target:
+                target = unit
+                target_stationary = unit.stationary
+                target_distance = unit_distance
+                target_health = unit.health
+                target_y = unit.y
+                target_x_distance = unit_x_distance
+    return target
+
+
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class TargetingTests(unittest.TestCase):
+
+    def test_matches_comparison_chain(self):
+        checked = 0
+        for config, state_string in replay_states(step=8, state_types=(1,)):
+            game = GameState(config, state_string)
+            for x, y in game.game_map:
+                for unit in game.game_map[x, y]:
+                    if unit.damage_f + unit.damage_i > 0:
+                        self.assertIs(chained_get_target(game, unit), game.get_target(unit))
+                        checked += 1
+        self.assertGreater(checked, 1000)
+
+    def test_ties_go_to_the_first_candidate(self):
+        rows = [(False, 1.0, 20.0, 3, 2.5), (False, 1.0, 20.0, 3, 2.5), (True, 0.0, 1.0, 0, 13.5), (False, 1.0, 20.0, 3, 1.5)]
+        columns = [list(column) for column in zip(*rows)]
+        self.assertEqual(0, pick_target(*columns, 0))
+        self.assertEqual(0, pick_target(*columns, 1))
+        self.assertIsNone(pick_target([], [], [], [], [], 0))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_arrays_match_lists(self):
+        generator = random.Random(5)
+        for _ in range(200):
+            count = generator.randint(1, 12)
+            columns = [[generator.random() < 0.5 for _ in range(count)], [generator.choice([1.0, 1.5, 2.0]) for _ in range(count)],
+                       [generator.choice([5.0, 10.0]) for _ in range(count)], [generator.randint(0, 3) for _ in range(count)],
+                       [generator.choice([0.5, 1.5]) for _ in range(count)]]
+            player_index = generator.randint(0, 1)
+            self.assertEqual(pick_target(*columns, player_index), pick_target(*[np.array(column) for column in columns], player_index))
+
+
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class ThreatMapTests(unittest.TestCase):
+
+    def assert_matches_get_attackers(self, game, threat_map):
+        for x in range(28):
+            for y in range(28):
+                if not game.game_map.in_arena_bounds([x, y]):
+                    continue
+                for player_index in [0, 1]:
+                    attackers = game.get_attackers([x, y], player_index)
+                    self.assertEqual(len(attackers), threat_map.attackers_at([x, y], player_index), "Wrong attacker count at {}".format([x, y]))
+                    self.assertAlmostEqual(sum(unit.damage_i for unit in attackers), threat_map.damage_at([x, y], player_index))
+                    self.assertEqual(sorted((unit.x, unit.y) for unit in attackers),
+                                     sorted((index % 28, index // 28) for index in threat_map.coverage[player_index].get(y * 28 + x, [])))
+
+    def test_matches_get_attackers(self):
+        for config, state_string in replay_states(step=30):
+            game = GameState(config, state_string)
+            self.assert_matches_get_attackers(game, game.get_threat_map())
+
+    def test_incremental_updates(self):
+        config, state_string = next(replay_states(step=20))
+        game = GameState(config, state_string)
+        game.suppress_warnings(True)
+        threat_map = game.get_threat_map()
+        game.attempt_spawn("DF", [[13, 10], [14, 10], [5, 10]])
+        game.attempt_upgrade([13, 10])
+        game.game_map.add_unit("DF", [14, 18], 1)
+        game.game_map.remove_unit([14, 10])
+        self.assert_matches_get_attackers(game, threat_map)
+        self.assertEqual(ThreatMap(game.game_map).damage, threat_map.damage, "Incremental updates differ from a rebuild")
+
+    def test_path_exposure(self):
+        exposed = 0
+        for config, state_string in replay_states(step=9):
+            game = GameState(config, state_string)
+            for start in [[13, 0], [5, 8], [22, 8]]:
+                path = game.find_path_to_edge(start)
+                if not path:
+                    continue
+                exposure = game.path_exposure(path, 0)
+                contributors = {}
+                for step, location in enumerate(path):
+                    attackers = game.get_attackers(location, 0)
+                    for unit in attackers:
+                        contributors[unit.x, unit.y] = contributors.get((unit.x, unit.y), 0) + unit.damage_i
+                    self.assertEqual(len(attackers), exposure.attackers[step])
+                self.assertEqual(sum(len(game.get_attackers(location, 0)) for location in path), exposure.total_attackers)
+                self.assertAlmostEqual(game.get_threat_map().path_damage(path, 0), exposure.total_damage)
+                self.assertEqual(contributors, exposure.contributors)
+                exposed += len(contributors)
+                timeline = game.frame_timelines([path], "EI")[0]
+                frame_exposure = game.path_exposure(path, 0, "EI")
+                self.assertEqual(exposure.damage, frame_exposure.damage)
+                self.assertAlmostEqual(game.get_threat_map().path_damage(timeline.locations, 0), frame_exposure.total_damage)
+        self.assertGreater(exposed, 0)
+
+
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class ShieldMapTests(unittest.TestCase):
+
+    def supports_reaching(self, game):
+        """Maps (location index, player index) to the supports whose shieldRange reaches it, from get_locations_in_range"""
+        reaching = {}
+        for player_index in [0, 1]:
+            for support in game.units(player_index, "EF"):
+                for x, y in game.game_map.get_locations_in_range([support.x, support.y], support.shieldRange):
+                    reaching.setdefault((y * 28 + x, player_index), []).append(support)
+        return reaching
+
+    def assert_matches_supports(self, game, shield_map):
+        reaching = self.supports_reaching(game)
+        for x in range(28):
+            for y in range(28):
+                if not game.game_map.in_arena_bounds([x, y]):
+                    continue
+                for player_index in [0, 1]:
+                    supports = reaching.get((y * 28 + x, player_index), [])
+                    self.assertAlmostEqual(sum(support.shield_amount() for support in supports), shield_map.shield_at([x, y], player_index))
+                    self.assertEqual(sorted(y * 28 + x for x, y in ((support.x, support.y) for support in supports)),
+                                     sorted(shield_map.coverage[player_index].get(y * 28 + x, [])))
+
+    def test_matches_supports(self):
+        shielded = 0
+        for config, state_string in replay_states(step=30):
+            game = GameState(config, state_string)
+            self.assert_matches_supports(game, game.get_shield_map())
+            for start in [[13, 0], [5, 8], [22, 8]]:
+                path = game.find_path_to_edge(start)
+                if not path:
+                    continue
+                reaching = self.supports_reaching(game)
+                supports = {}
+                for x, y in path:
+                    for support in reaching.get((y * 28 + x, 0), []):
+                        supports[support.x, support.y] = support.shield_amount()
+                path_shield = game.path_shield(path)
+                self.assertEqual(supports, path_shield.supports)
+                self.assertAlmostEqual(sum(supports.values()), path_shield.total)
+                self.assertEqual(len(path), len(path_shield.gained))
+                shielded += len(supports)
+        self.assertGreater(shielded, 0)
+
+    def test_incremental_updates(self):
+        config, state_string = next(replay_states(step=20))
+        game = GameState(config, state_string)
+        game.suppress_warnings(True)
+        shield_map = game.get_shield_map()
+        path = game.find_path_to_edge([13, 0])
+        before = game.path_shield(path).total
+        game.attempt_spawn("EF", [[13, 2], [14, 2], [5, 10]])
+        game.attempt_upgrade([13, 2])
+        game.game_map.add_unit("EF", [14, 18], 1)
+        game.game_map.remove_unit([14, 2])
+        self.assert_matches_supports(game, shield_map)
+        rebuilt = ShieldMap(game.game_map)
+        self.assertEqual([[round(shield, 6) for shield in shields] for shields in rebuilt.shield],
+                         [[round(shield, 6) for shield in shields] for shields in shield_map.shield], "Incremental updates differ from a rebuild")
+        self.assertAlmostEqual(before + game.contains_stationary_unit([13, 2]).shield_amount(), game.path_shield(path).total)
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+@unittest.skipUnless(glob.glob(os.path.join(REPLAY_DIR, "*", "*.replay")), "No replays found")
+class BoardArraysTests(unittest.TestCase):
+
+    def assert_matches_map(self, game, arrays):
+        for x in range(28):
+            for y in range(28):
+                if not game.game_map.in_arena_bounds([x, y]):
+                    continue
+                structure = game.contains_stationary_unit([x, y])
+                if structure:
+                    self.assertEqual(structure.player_index, arrays.owner[x, y])
+                    self.assertEqual(structure.health, arrays.health[x, y])
+                    self.assertEqual(structure.upgraded, arrays.upgraded[x, y])
+                    self.assertEqual(structure.unit_type, game.config["unitInformation"][arrays.unit_type[x, y]]["shorthand"])
+                else:
+                    self.assertEqual(-1, arrays.unit_type[x, y], "Found a structure on an empty location {}".format([x, y]))
+
+    def test_arrays_follow_map(self):
+        config, state_string = next(replay_states(step=20))
+        game = GameState(config, state_string)
+        game.suppress_warnings(True)
+        arrays = game.game_map.get_arrays()
+        self.assert_matches_map(game, arrays)
+        game.attempt_spawn("DF", [[13, 10], [14, 10]])
+        game.attempt_upgrade([13, 10])
+        game.game_map.remove_unit([14, 10])
+        game.game_map.add_unit("FF", [14, 18], 1)
+        self.assert_matches_map(game, arrays)
+
+        my_structures = [unit for x in range(28) for y in range(14) if game.game_map.in_arena_bounds([x, y]) for unit in game.game_map[x, y] if unit.stationary]
+        self.assertEqual(len(my_structures), arrays.count(0))
+        self.assertAlmostEqual(sum(unit.health for unit in my_structures), arrays.total_health(0))
+        self.assertEqual(len([unit for unit in my_structures if unit.unit_type == "DF"]), arrays.count(0, "DF"))
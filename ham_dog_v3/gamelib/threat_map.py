@@ -0,0 +1,193 @@
+import math
+from collections import namedtuple
+
+# What a mobile unit walking a path is exposed to. attackers and damage are per location of the path,
+# contributors maps the (x, y) of every enemy structure in range of the path to the damage it deals over the whole path
+PathExposure = namedtuple("PathExposure", ["attackers", "damage", "total_attackers", "total_damage", "contributors"])
+
+# Offsets within attack range, keyed by (radius, hit radius). Attackers use distance <= range, like GameState.get_attackers
+_ATTACK_OFFSETS = {}
+
+
+class ThreatMap:
+    """Holds the damage per frame the structures on a GameMap deal to mobile units on each location.
+
+    It is built once from the map and then kept up to date as structures are spawned, upgraded or removed
+    through the GameMap, so lookups stay valid inside build loops. Locations are indexed y * ARENA_SIZE + x.
+
+    Attributes :
+        * game_map (:obj: GameMap): The map the threat is computed from
+        * ARENA_SIZE (int): The size of the arena
+        * damage (list): damage[player_index][index] is the damage per frame enemy structures deal to a mobile unit of player_index at index
+        * attackers (list): attackers[player_index][index] is the number of enemy structures able to attack a mobile unit of player_index at index
+        * coverage (list): coverage[player_index] maps an index to the indexes of the enemy structures able to attack a mobile unit of player_index there
+
+    """
+    def __init__(self, game_map):
+        """Rasterizes every structure on the map and starts listening for changes
+
+        Args:
+            game_map: The GameMap to compute threat for
+
+        """
+        self.game_map = game_map
+        self.ARENA_SIZE = game_map.ARENA_SIZE
+        cells = self.ARENA_SIZE * self.ARENA_SIZE
+        self.damage = [[0.0] * cells, [0.0] * cells]
+        self.attackers = [[0] * cells, [0] * cells]
+        self.coverage = [{}, {}]
+        self._contributions = {}
+        for index in range(cells):
+            x, y = index % self.ARENA_SIZE, index // self.ARENA_SIZE
+            if game_map.structure_occupancy[index]:
+                self._add_contribution(x, y)
+        game_map.add_listener(self.refresh)
+
+    def _attack_offsets(self, radius):
+        key = (radius, self.game_map._hit_radius)
+        offsets = _ATTACK_OFFSETS.get(key)
+        if offsets is None:
+            offsets = tuple((dx, dy) for dx, dy in self.game_map.get_range_offsets(radius) if math.sqrt(dx ** 2 + dy ** 2) <= radius)
+            _ATTACK_OFFSETS[key] = offsets
+        return offsets
+
+    def _add_contribution(self, x, y):
+        """Adds the structure at a location to the rasters, remembering exactly what it added
+        """
+        for unit in self.game_map._peek(x, y):
+            if not unit.stationary or unit.damage_i + unit.damage_f <= 0:
+                continue
+            size = self.ARENA_SIZE
+            mask = self.game_map._arena_mask
+            indexes = []
+            for dx, dy in self._attack_offsets(unit.attackRange):
+                i = x + dx
+                j = y + dy
+                if 0 <= i < size and 0 <= j < size and mask[j * size + i]:
+                    indexes.append(j * size + i)
+            defender = 1 - unit.player_index
+            damage = self.damage[defender]
+            attackers = self.attackers[defender]
+            coverage = self.coverage[defender]
+            structure_index = y * size + x
+            for index in indexes:
+                damage[index] += unit.damage_i
+                attackers[index] += 1
+                coverage.setdefault(index, []).append(structure_index)
+            self._contributions[structure_index] = (defender, unit.damage_i, indexes)
+            break
+
+    def _remove_contribution(self, x, y):
+        structure_index = y * self.ARENA_SIZE + x
+        contribution = self._contributions.pop(structure_index, None)
+        if contribution is None:
+            return
+        defender, unit_damage, indexes = contribution
+        damage = self.damage[defender]
+        attackers = self.attackers[defender]
+        coverage = self.coverage[defender]
+        for index in indexes:
+            damage[index] -= unit_damage
+            attackers[index] -= 1
+            coverage[index].remove(structure_index)
+
+    def refresh(self, x, y):
+        """Recomputes the contribution of a single location. Called by the GameMap whenever a location changes.
+
+        Args:
+            x: The x coordinate of the changed location
+            y: The y coordinate of the changed location
+
+        """
+        self._remove_contribution(x, y)
+        self._add_contribution(x, y)
+
+    def detach(self):
+        """Stops following changes to the GameMap
+        """
+        self.game_map.remove_listener(self.refresh)
+
+    def damage_at(self, location, player_index):
+        """Gets the damage per frame a mobile unit would take at a location
+
+        Args:
+            location: The location of a hypothetical mobile unit
+            player_index: The player controlling the mobile unit, 0 for you 1 for the enemy
+
+        Returns:
+            The summed damage per frame of the enemy structures in range
+
+        """
+        return self.damage[player_index][location[1] * self.ARENA_SIZE + location[0]]
+
+    def attackers_at(self, location, player_index):
+        """Gets the number of enemy structures able to attack a mobile unit at a location, like len(GameState.get_attackers)
+
+        Args:
+            location: The location of a hypothetical mobile unit
+            player_index: The player controlling the mobile unit, 0 for you 1 for the enemy
+
+        Returns:
+            The number of enemy structures in range
+
+        """
+        return self.attackers[player_index][location[1] * self.ARENA_SIZE + location[0]]
+
+    def path_damage(self, path, player_index):
+        """Sums the damage per frame over every location of a path
+
+        Args:
+            path: A list of locations, for example from GameState.find_path_to_edge
+            player_index: The player controlling the mobile unit walking the path
+
+        Returns:
+            The total damage, counting one frame per location
+
+        """
+        size = self.ARENA_SIZE
+        damage = self.damage[player_index]
+        return sum(damage[y * size + x] for x, y in path)
+
+    def path_attackers(self, path, player_index):
+        """Sums the number of attackers over every location of a path
+        """
+        size = self.ARENA_SIZE
+        attackers = self.attackers[player_index]
+        return sum(attackers[y * size + x] for x, y in path)
+
+    def path_exposure(self, path, player_index, frames=None):
+        """Gets what a mobile unit walking a path is exposed to, from the coverage index rather than by scanning around each location
+
+        Args:
+            path: A list of locations, for example from GameState.find_path_to_edge
+            player_index: The player controlling the mobile unit walking the path
+            frames: The number of frames the unit spends on each location, see FrameTimeline.frames. One frame per location if None.
+
+        Returns:
+            A PathExposure. Damage is the damage_i per frame of the current, possibly upgraded, structures.
+            The totals and contributors are summed over frames, counting one frame per location like path_damage if frames is None.
+
+        """
+        size = self.ARENA_SIZE
+        damage = self.damage[player_index]
+        attackers = self.attackers[player_index]
+        coverage = self.coverage[player_index]
+        contributions = self._contributions
+        path_attackers = []
+        path_damage = []
+        contributors = {}
+        total_attackers = 0
+        total_damage = 0
+        for step, (x, y) in enumerate(path):
+            index = y * size + x
+            weight = 1 if frames is None else frames[step]
+            path_attackers.append(attackers[index])
+            path_damage.append(damage[index])
+            total_attackers += attackers[index] * weight
+            total_damage += damage[index] * weight
+            if not weight:
+                continue
+            for structure_index in coverage.get(index, ()):
+                location = (structure_index % size, structure_index // size)
+                contributors[location] = contributors.get(location, 0) + contributions[structure_index][1] * weight
+        return PathExposure(path_attackers, path_damage, total_attackers, total_damage, contributors)
@@ -0,0 +1,98 @@
+import time
+
+
+class TimeBudgetExceeded(Exception):
+    """Raised by TimeBudget.check once its deadline has passed. The with block of the budget stops it.
+    """
+    pass
+
+
+class TimeBudget:
+    """A deadline for anytime search: try candidates until time runs out, keeping the best one found so far.
+
+    Use it as a context manager around a search. Calling check() anywhere inside the search jumps out of the with
+    block once the deadline has passed, and the exception is swallowed there. Code after the search inside the
+    block is then skipped, so pass apply to act on the best candidate whichever way the block ends. Made by
+    GameState.time_budget, which can also submit the turn when the block ends.
+
+    Attributes :
+        * deadline (float): The time.perf_counter() value at which the budget runs out
+        * best: The best candidate offered so far, None if there is none
+        * best_score: The score of best
+        * exceeded (bool): If the search was cut short by check()
+
+    """
+    def __init__(self, deadline, on_exit=None, apply=None):
+        """Starts a budget
+
+        Args:
+            deadline: The time.perf_counter() value at which the budget runs out
+            on_exit: Called with the budget when the with block ends, however it ends
+            apply: Called with best when the with block ends, unless there is no best or the block raised an exception
+                other than TimeBudgetExceeded. Runs before on_exit.
+
+        """
+        self.deadline = deadline
+        self.best = None
+        self.best_score = None
+        self.exceeded = False
+        self._on_exit = on_exit
+        self._apply = apply
+
+    def remaining(self):
+        """Gets the time left before the deadline, in seconds. Never negative.
+        """
+        return max(0.0, self.deadline - time.perf_counter())
+
+    def expired(self):
+        """Returns True once the deadline has passed
+        """
+        return time.perf_counter() >= self.deadline
+
+    def check(self):
+        """Raises TimeBudgetExceeded once the deadline has passed, ending the search
+        """
+        if time.perf_counter() >= self.deadline:
+            raise TimeBudgetExceeded()
+
+    def offer(self, candidate, score):
+        """Keeps a candidate if it beats the best one so far
+
+        Args:
+            candidate: Any result of the search, for example a list of spawns
+            score: The score of the candidate, higher is better
+
+        Returns:
+            True if the candidate is the new best
+
+        """
+        if self.best_score is None or score > self.best_score:
+            self.best = candidate
+            self.best_score = score
+            return True
+        return False
+
+    def iterate(self, candidates):
+        """Yields candidates until they run out or the deadline passes
+
+        Args:
+            candidates: Any iterable, for example the options of a search ordered from most to least promising
+
+        """
+        for candidate in candidates:
+            if self.expired():
+                self.exceeded = True
+                return
+            yield candidate
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is TimeBudgetExceeded:
+            self.exceeded = True
+        if self._apply is not None and self.best_score is not None and exc_type in (None, TimeBudgetExceeded):
+            self._apply(self.best)
+        if self._on_exit is not None:
+            self._on_exit(self)
+        return exc_type is TimeBudgetExceeded
@@ -0,0 +1,57 @@
+from collections import namedtuple
+
+# Where a mobile unit walking a path is on every frame. Timelines are shared through a cache, so path holds (x, y) tuples.
+# frames[i] is the number of frames the unit is attacked on path[i], arrivals[i] the first of those frames and
+# locations[frame] the location the unit is attacked on during each frame
+FrameTimeline = namedtuple("FrameTimeline", ["path", "speed", "frames", "arrivals", "locations"])
+
+# Timelines keyed by (path as a tuple of (x, y), speed). They only depend on the path, so they are kept across turns
+_TIMELINE_CACHE = {}
+_TIMELINE_CACHE_LIMIT = 4096
+
+
+def get_frame_timeline(path, speed):
+    """Expands a path into the frames a unit with a given speed spends on each of its locations.
+
+    Follows the movement rule of the Simulator: the unit moves on every frame in which int((frame + 1) * speed)
+    grows, before units attack, and leaves the board on the first move frame after reaching the end of its path.
+    A unit with speed 1 is therefore attacked once on every location but the first, and a unit with speed 0.5
+    once on the first location and twice on every later one.
+
+    Args:
+        path: A list of locations, for example from GameState.find_path_to_edge
+        speed: The speed of the unit, see GameUnit.speed
+
+    Returns:
+        A FrameTimeline, shared with every other caller asking for the same path and speed so it must not be modified.
+        None if the path is empty or the unit can not move.
+
+    """
+    if not path or speed <= 0:
+        return None
+    key = (tuple((location[0], location[1]) for location in path), speed)
+    timeline = _TIMELINE_CACHE.get(key)
+    if timeline is not None:
+        return timeline
+
+    steps = key[0]
+    frames = [0] * len(steps)
+    arrivals = [0] * len(steps)
+    locations = []
+    step = 0
+    frame = 0
+    while True:
+        if int((frame + 1) * speed) > int(frame * speed):
+            if step + 1 == len(steps):
+                break
+            step += 1
+            arrivals[step] = frame
+        frames[step] += 1
+        locations.append(steps[step])
+        frame += 1
+
+    timeline = FrameTimeline(steps, speed, tuple(frames), tuple(arrivals), tuple(locations))
+    if len(_TIMELINE_CACHE) >= _TIMELINE_CACHE_LIMIT:
+        _TIMELINE_CACHE.clear()
+    _TIMELINE_CACHE[key] = timeline
+    return timeline
@@ -1,3 +1,7 @@
+from collections import namedtuple
+from types import MappingProxyType
+
+
 def is_stationary(unit_type, structure_types):
     """
         Args:
@@ -9,6 +13,173 @@ def is_stationary(unit_type, structure_types):
     return unit_type in structure_types
 
 
+# The starting stats of a unit type, before or after upgrading. Shared by every unit of that type, so never modified.
+UnitTemplate = namedtuple("UnitTemplate", ["stationary", "speed", "damage_f", "damage_i", "attackRange",
+                                           "shieldRange", "max_health", "shieldPerUnit", "cost"])
+
+# What a mobile unit does when it can not move any further without reaching an edge. damage_f is dealt to
+# structures and damage_i to mobile units within radius, once the unit has moved steps_required times
+SelfDestruct = namedtuple("SelfDestruct", ["steps_required", "radius", "damage_f", "damage_i"])
+
+# The config keys holding a range
+_RANGE_KEYS = ["attackRange", "shieldRange", "selfDestructRange"]
+
+# Catalogs per config, keyed by id(config). The config is kept alongside so a reused id is never mistaken for it
+_CATALOG_CACHE = {}
+
+
+class UnitCatalog:
+    """The unit types of a config and their costs and stats, compiled once so lookups never walk config["unitInformation"].
+
+    Built by get_unit_catalog, which returns the same catalog for the same config object, so AlgoCore builds it once per
+    game and every GameState and GameUnit of that game shares it. A catalog is never modified.
+
+    Attributes :
+        * WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE (str): The shorthand of each unit type
+        * type_index (mapping): Maps a unit type to its index in config["unitInformation"]
+        * types (tuple): The unit type at each index of config["unitInformation"]
+        * structure_types (tuple): The structure types, WALL, SUPPORT and TURRET
+        * all_units (tuple): The types that can be spawned, the mobile types first
+        * templates (mapping): Maps (unit_type, upgraded) to the UnitTemplate holding that unit's starting stats
+        * costs (mapping): Maps (unit_type, upgrade) to the [SP, MP] cost of spawning, or of upgrading if upgrade is True
+        * upgradable (frozenset): The types that can be upgraded
+        * shield_bonus_per_y (mapping): Maps (unit_type, upgraded) to the extra shield a support gives per row towards the enemy
+        * self_destruct (mapping): Maps a unit type to its SelfDestruct
+        * breach_damage (mapping): Maps a unit type to the health a player loses when a unit of that type breaches
+        * max_attack_range (float): The longest attackRange of any unit type, before upgrading
+        * ranges (frozenset): Every distinct range in the config, including upgraded ranges
+        * hit_radius (float): getHitRadius of the config
+
+    """
+    __slots__ = ("config", "WALL", "SUPPORT", "TURRET", "SCOUT", "DEMOLISHER", "INTERCEPTOR", "REMOVE", "UPGRADE",
+                 "type_index", "types", "structure_types", "all_units", "templates", "costs", "upgradable", "shield_bonus_per_y",
+                 "self_destruct", "breach_damage",
+                 "max_attack_range", "ranges", "hit_radius")
+
+    def __init__(self, config):
+        """Compiles the unit information of a config
+
+        Args:
+            config: A json object containing information about the game
+
+        """
+        unit_information = config["unitInformation"]
+        names = ("WALL", "SUPPORT", "TURRET", "SCOUT", "DEMOLISHER", "INTERCEPTOR", "REMOVE", "UPGRADE")
+        for index, name in enumerate(names):
+            object.__setattr__(self, name, unit_information[index]["shorthand"])
+
+        type_index = {}
+        templates = {}
+        costs = {}
+        shield_bonus_per_y = {}
+        self_destruct = {}
+        breach_damage = {}
+        upgradable = set()
+        ranges = set()
+        max_attack_range = 0
+        for index, type_config in enumerate(unit_information):
+            shorthand = type_config.get("shorthand")
+            type_index[shorthand] = index
+            base = UnitTemplate(
+                type_config.get("unitCategory") == 0,
+                type_config.get("speed", 0),
+                type_config.get("attackDamageTower", 0),
+                type_config.get("attackDamageWalker", 0),
+                type_config.get("attackRange", 0),
+                type_config.get("shieldRange", 0),
+                type_config.get("startHealth", 0),
+                type_config.get("shieldPerUnit", 0),
+                (type_config.get("cost1", 0), type_config.get("cost2", 0)))
+            upgrade = type_config.get("upgrade", {})
+            upgraded = base._replace(
+                speed=upgrade.get("speed", base.speed),
+                damage_f=upgrade.get("attackDamageTower", base.damage_f),
+                damage_i=upgrade.get("attackDamageWalker", base.damage_i),
+                attackRange=upgrade.get("attackRange", base.attackRange),
+                shieldRange=upgrade.get("shieldRange", base.shieldRange),
+                max_health=upgrade.get("startHealth", base.max_health),
+                shieldPerUnit=upgrade.get("shieldPerUnit", base.shieldPerUnit),
+                cost=(upgrade.get("cost1", 0) + base.cost[0], upgrade.get("cost2", 0) + base.cost[1]))
+            templates[shorthand, False] = base
+            templates[shorthand, True] = upgraded
+            costs[shorthand, False] = base.cost
+            costs[shorthand, True] = (upgrade.get("cost1", base.cost[0]), upgrade.get("cost2", base.cost[1]))
+            shield_bonus_per_y[shorthand, False] = type_config.get("shieldBonusPerY", 0)
+            shield_bonus_per_y[shorthand, True] = upgrade.get("shieldBonusPerY", shield_bonus_per_y[shorthand, False])
+            self_destruct[shorthand] = SelfDestruct(
+                type_config.get("selfDestructStepsRequired", 0),
+                type_config.get("selfDestructRange", 0),
+                type_config.get("selfDestructDamageTower", 0),
+                type_config.get("selfDestructDamageWalker", 0))
+            breach_damage[shorthand] = type_config.get("playerBreachDamage", 1)
+            if type_config.get("upgrade", None) is not None:
+                upgradable.add(shorthand)
+            max_attack_range = max(max_attack_range, type_config.get("attackRange", 0))
+            for information in [type_config, upgrade]:
+                for key in _RANGE_KEYS:
+                    if key in information:
+                        ranges.add(information[key])
+
+        object.__setattr__(self, "config", config)
+        object.__setattr__(self, "type_index", MappingProxyType(type_index))
+        object.__setattr__(self, "types", tuple(type_config.get("shorthand") for type_config in unit_information))
+        object.__setattr__(self, "structure_types", (self.WALL, self.SUPPORT, self.TURRET))
+        object.__setattr__(self, "all_units", (self.SCOUT, self.DEMOLISHER, self.INTERCEPTOR, self.WALL, self.SUPPORT, self.TURRET))
+        object.__setattr__(self, "templates", MappingProxyType(templates))
+        object.__setattr__(self, "costs", MappingProxyType(costs))
+        object.__setattr__(self, "upgradable", frozenset(upgradable))
+        object.__setattr__(self, "shield_bonus_per_y", MappingProxyType(shield_bonus_per_y))
+        object.__setattr__(self, "self_destruct", MappingProxyType(self_destruct))
+        object.__setattr__(self, "breach_damage", MappingProxyType(breach_damage))
+        object.__setattr__(self, "max_attack_range", max_attack_range)
+        object.__setattr__(self, "ranges", frozenset(ranges))
+        object.__setattr__(self, "hit_radius", unit_information[0].get("getHitRadius", 0))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("UnitCatalog is immutable")
+
+    def is_stationary(self, unit_type):
+        """Returns True if the unit type is a structure
+        """
+        return unit_type in self.structure_types
+
+    def cost(self, unit_type, upgrade=False):
+        """Gets the [SP, MP] cost of spawning a unit type, or of upgrading it if upgrade is True
+        """
+        return list(self.costs[unit_type, upgrade])
+
+
+def get_unit_catalog(config):
+    """Gets the UnitCatalog of a config, building it the first time the config is seen
+
+        Args:
+            config: A json object containing information about the game
+
+        Returns:
+            The UnitCatalog shared by everything built from this config
+    """
+    cached = _CATALOG_CACHE.get(id(config))
+    if cached is not None and cached[0] is config:
+        return cached[1]
+    catalog = UnitCatalog(config)
+    if len(_CATALOG_CACHE) > 8:
+        _CATALOG_CACHE.clear()
+    _CATALOG_CACHE[id(config)] = (config, catalog)
+    return catalog
+
+
+def get_unit_templates(config):
+    """Gets the stats of every unit type in a config, see UnitCatalog.templates
+
+        Args:
+            config: A json object containing information about the game
+
+        Returns:
+            A mapping from (unit_type, upgraded) to a UnitTemplate
+    """
+    return get_unit_catalog(config).templates
+
+
 class GameUnit:
     """Holds information about a Unit. 
 
@@ -32,6 +203,10 @@ class GameUnit:
         * upgraded (boolean): If this unit is upgraded
 
     """
+    __slots__ = ("unit_type", "config", "player_index", "x", "y", "stationary", "speed", "damage_f", "damage_i",
+                 "attackRange", "shieldRange", "max_health", "health", "cost", "shieldPerUnit", "pending_removal",
+                 "upgraded")
+
     def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1):
         """ Initialize unit variables using args passed
 
@@ -43,36 +218,40 @@ class GameUnit:
         self.upgraded = False
         self.x = x
         self.y = y
-        self.__serialize_type()
+        self.__apply_template(get_unit_catalog(config).templates[unit_type, False])
         self.health = self.max_health if not health else health
 
-    def __serialize_type(self):
-        from .game_state import STRUCTURE_TYPES, UNIT_TYPE_TO_INDEX, SUPPORT
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        self.stationary = type_config["unitCategory"] == 0
-        self.speed = type_config.get("speed", 0)
-        self.damage_f = type_config.get("attackDamageTower", 0)
-        self.damage_i = type_config.get("attackDamageWalker", 0)
-        self.attackRange = type_config.get("attackRange", 0)
-        self.shieldRange = type_config.get("shieldRange", 0)
-        self.max_health = type_config.get("startHealth", 0)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
-        self.cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
+    def __apply_template(self, template):
+        (self.stationary, self.speed, self.damage_f, self.damage_i, self.attackRange,
+            self.shieldRange, self.max_health, self.shieldPerUnit, cost) = template
+        self.cost = list(cost)
 
+    def clone(self):
+        """Makes a copy of this unit, sharing the config and nothing else
+        """
+        unit = GameUnit.__new__(GameUnit)
+        for name in GameUnit.__slots__:
+            setattr(unit, name, getattr(self, name))
+        unit.cost = list(self.cost)
+        return unit
 
     def upgrade(self):
-        from .game_state import UNIT_TYPE_TO_INDEX
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]].get("upgrade", {})
-        self.speed = type_config.get("speed", self.speed)
-        self.damage_f = type_config.get("attackDamageTower", self.damage_f)
-        self.damage_i = type_config.get("attackDamageWalker", self.damage_i)
-        self.attackRange = type_config.get("attackRange", self.attackRange)
-        self.shieldRange = type_config.get("shieldRange", self.shieldRange)
-        self.max_health = type_config.get("startHealth", self.max_health)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", self.shieldPerUnit)
-        self.cost = [type_config.get("cost1", 0) + self.cost[0], type_config.get("cost2", 0) + self.cost[1]]
+        self.__apply_template(get_unit_catalog(self.config).templates[self.unit_type, True])
         self.upgraded = True
 
+    def shield_amount(self, arena_size=28):
+        """Gets the shield this support gives each friendly mobile unit it reaches
+
+        Args:
+            arena_size: The size of the arena, supports closer to the enemy give more shield
+
+        Returns:
+            shieldPerUnit plus shieldBonusPerY for every row between this unit and its owner's side of the arena
+
+        """
+        bonus_per_y = get_unit_catalog(self.config).shield_bonus_per_y[self.unit_type, self.upgraded]
+        height = self.y if self.player_index == 0 else arena_size - 1 - self.y
+        return self.shieldPerUnit + bonus_per_y * height
 
     def __toString(self):
         owner = "Friendly" if self.player_index == 0 else "Enemy"
@@ -0,0 +1,115 @@
+class UnitRegistry:
+    """Indexes the locations of the units on a GameMap by player and unit type.
+
+    GameState fills it in while parsing the turn, without creating the units of a lazily parsed map, and it is then
+    kept up to date as units are spawned, upgraded or removed through the GameMap, like ThreatMap. Queries only visit
+    the locations holding the units asked for instead of scanning the whole map. Locations are indexed y * ARENA_SIZE + x.
+
+    Attributes :
+        * game_map (:obj: GameMap): The map the units are indexed from
+        * ARENA_SIZE (int): The size of the arena
+
+    """
+    def __init__(self, game_map, scan=True):
+        """Starts listening for changes to the map
+
+        Args:
+            game_map: The GameMap to index
+            scan: Index the units already on the map. GameState passes False and adds the units as it parses them.
+
+        """
+        self.game_map = game_map
+        self.ARENA_SIZE = game_map.ARENA_SIZE
+        # _locations[player_index][unit_type] is the set of location indexes holding such units, _keys the (player_index, unit_type)
+        # pairs indexed for each location
+        self._locations = [{}, {}]
+        self._keys = {}
+        if scan:
+            size = self.ARENA_SIZE
+            mask = game_map._arena_mask
+            for index in range(size * size):
+                if mask[index]:
+                    self.refresh(index % size, index // size)
+        game_map.add_listener(self.refresh)
+
+    def add(self, x, y, unit_type, player_index):
+        """Indexes a unit at a location, used while parsing before the unit is created
+
+        Args:
+            x: The x coordinate of the unit
+            y: The y coordinate of the unit
+            unit_type: The type of the unit
+            player_index: The player controlling the unit, 0 for you 1 for the enemy
+
+        """
+        index = y * self.ARENA_SIZE + x
+        self._locations[player_index].setdefault(unit_type, set()).add(index)
+        self._keys.setdefault(index, set()).add((player_index, unit_type))
+
+    def refresh(self, x, y):
+        """Re-indexes the units at a single location. Called by the GameMap whenever a location changes.
+
+        Args:
+            x: The x coordinate of the changed location
+            y: The y coordinate of the changed location
+
+        """
+        index = y * self.ARENA_SIZE + x
+        for player_index, unit_type in self._keys.pop(index, ()):
+            self._locations[player_index][unit_type].discard(index)
+        for unit in self.game_map._peek(x, y):
+            self.add(x, y, unit.unit_type, unit.player_index)
+
+    def detach(self):
+        """Stops following changes to the GameMap
+        """
+        self.game_map.remove_listener(self.refresh)
+
+    def locations(self, player_index, unit_type=None):
+        """Gets the locations holding units of a player
+
+        Args:
+            player_index: The player controlling the units, 0 for you 1 for the enemy
+            unit_type: Only include units of this type, any type if None
+
+        Returns:
+            A list of [x, y] locations ordered by y, then x
+
+        """
+        if unit_type is None:
+            indexes = set()
+            for type_indexes in self._locations[player_index].values():
+                indexes |= type_indexes
+        else:
+            indexes = self._locations[player_index].get(unit_type, ())
+        size = self.ARENA_SIZE
+        return [[index % size, index // size] for index in sorted(indexes)]
+
+    def units(self, player_index, unit_type=None):
+        """Gets the units of a player
+
+        Args:
+            player_index: The player controlling the units, 0 for you 1 for the enemy
+            unit_type: Only return units of this type, any type if None
+
+        Returns:
+            A list of GameUnits ordered by location, for reading only. Change units through game_map[x, y].
+
+        """
+        units = []
+        game_map = self.game_map
+        for x, y in self.locations(player_index, unit_type):
+            for unit in game_map._peek(x, y):
+                if unit.player_index == player_index and (unit_type is None or unit.unit_type == unit_type):
+                    units.append(unit)
+        return units
+
+    def count(self, player_index, unit_type):
+        """Gets the number of locations holding units of a type, the number of units for structures
+
+        Args:
+            player_index: The player controlling the units, 0 for you 1 for the enemy
+            unit_type: The type of unit to count
+
+        """
+        return len(self._locations[player_index].get(unit_type, ()))
@@ -1,13 +1,35 @@
 import sys
+import json
+import atexit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
 
+_DECODER = json.JSONDecoder()
+# The function decode_json parses with, orjson when it is installed
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# Log levels, messages below the current level are dropped before they are formatted
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+SILENT = 100
+_log_level = DEBUG
+_log_buffer = None
+
 
 def get_command():
     """Gets input from stdin
 
     """
+    # The algo is idle until the engine answers, a good time to write out buffered messages
+    flush_log()
     try:
         ret = sys.stdin.readline()
     except EOFError:
@@ -30,12 +52,118 @@ def send_command(cmd):
     sys.stdout.flush()
 
 def debug_write(*msg):
-    """Prints a message to the games debug output
+    """Prints a message to the games debug output, at the INFO level
 
     Args:
         msg: The message to output
 
     """
-    #Printing to STDERR is okay and printed out by the game but doesn't effect turns.
-    sys.stderr.write(", ".join(map(str, msg)).strip() + "\n")
-    sys.stderr.flush()
+    if _log_level > INFO:
+        return
+    _write_log(", ".join(map(str, msg)).strip())
+
+def log(level, message, *args):
+    """Prints a message to the games debug output if its level is enabled
+
+    Args:
+        level: DEBUG, INFO, WARNING or ERROR
+        message: The message, or a format string for args. It is only formatted if the level is enabled.
+        args: Values for the placeholders of message
+
+    """
+    if level < _log_level:
+        return
+    _write_log(message.format(*args) if args else str(message))
+
+def log_enabled(level):
+    """Returns True if messages of a level are printed. Check it before building expensive messages.
+    """
+    return level >= _log_level
+
+def set_log_level(level):
+    """Sets the lowest level printed by log and debug_write. SILENT disables every message.
+    """
+    global _log_level
+    _log_level = level
+
+def set_log_buffering(buffered):
+    """Chooses if messages are written as they come, or kept until flush_log.
+    Buffered messages are flushed when the algo waits for the engine in get_command, when a turn is submitted and at exit.
+
+    Args:
+        buffered: If True, keep messages until flush_log. If False, flush and write every message right away.
+
+    """
+    global _log_buffer
+    flush_log()
+    _log_buffer = [] if buffered else None
+
+def flush_log():
+    """Writes the buffered messages to stderr in one go
+    """
+    global _log_buffer
+    if _log_buffer:
+        # Swap the buffer first, background tasks may log while it is written
+        messages = _log_buffer
+        _log_buffer = []
+        sys.stderr.write("\n".join(messages) + "\n")
+        sys.stderr.flush()
+
+def _write_log(text):
+    if _log_buffer is not None:
+        _log_buffer.append(text)
+    else:
+        #Printing to STDERR is okay and printed out by the game but doesn't effect turns.
+        sys.stderr.write(text + "\n")
+        sys.stderr.flush()
+
+def decode_json(message):
+    """Parses a json message from the game engine, with orjson when it is installed and the json module otherwise
+
+    Args:
+        message: A config, game state or action frame string
+
+    Returns:
+        The parsed message
+
+    """
+    return _json_loads(message)
+
+def set_json_decoder(loads=None):
+    """Chooses the function decode_json parses with
+
+    Args:
+        loads: A function taking a string and returning the parsed json, like json.loads.
+            The fastest installed parser is used if None.
+
+    """
+    global _json_loads
+    if loads is None:
+        loads = orjson.loads if orjson is not None else json.loads
+    _json_loads = loads
+
+def decode_sections(message, keys):
+    """Decodes only some top level sections of a json object sent by the game engine, skipping the rest of the string.
+    Sections are decoded with the json module whatever decode_json uses, since orjson cannot stop at the end of a value.
+    Relies on the engine never repeating a top level key inside nested values, which holds for game states and action frames.
+
+    Args:
+        message: A game state or action frame string
+        keys: The top level keys to decode, for example ["turnInfo", "events"]
+
+    Returns:
+        A dict with the decoded value of each key found in the message
+
+    """
+    sections = {}
+    for key in keys:
+        start = message.find('"{}":'.format(key))
+        if start < 0:
+            continue
+        start += len(key) + 3
+        while message[start] in " \t\r\n":
+            start += 1
+        sections[key] = _DECODER.raw_decode(message, start)[0]
+    return sections
+
+atexit.register(flush_log)
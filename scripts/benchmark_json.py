@@ -0,0 +1,46 @@
+import glob
+import json
+import os
+import sys
+import time
+
+# Times parsing every message of the shipped replays with the json module and with gamelib's decoder,
+# which uses orjson when it is installed. Run from anywhere: python scripts/benchmark_json.py [algo directory]
+
+file_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.abspath(os.path.join(file_dir, os.pardir))
+algo_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(parent_dir, "ham_dog_v3")
+sys.path.insert(0, algo_dir)
+
+from gamelib import util
+
+
+def best_time(function, lines, repeats=3):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for line in lines:
+            function(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+lines = []
+for replay_file in sorted(glob.glob(os.path.join(parent_dir, "replays", "*", "*.replay"))):
+    with open(replay_file) as replay:
+        lines += [line for line in replay if line.strip()]
+frames = [line for line in lines if '"turnInfo":[1' in line]
+megabytes = sum(len(line) for line in lines) / 1e6
+print("{} messages ({:.1f} MB), {} of them action frames".format(len(lines), megabytes, len(frames)))
+print("orjson installed: {}".format(util.orjson is not None))
+
+baseline = best_time(json.loads, lines)
+decoder = best_time(util.decode_json, lines)
+print("json.loads:          {:.3f}s".format(baseline))
+print("util.decode_json:    {:.3f}s ({:.1f}x)".format(decoder, baseline / decoder))
+
+frame_baseline = best_time(json.loads, frames)
+sections = best_time(lambda line: util.decode_sections(line, ["turnInfo", "events"]), frames)
+print("action frames, json.loads:                  {:.3f}s".format(frame_baseline))
+print("action frames, turnInfo and events sections: {:.3f}s ({:.1f}x)".format(sections, frame_baseline / sections))
@@ -171,7 +171,6 @@ plt_installed = False
 try:
 	import os
 	import sys
-	import json
 	import glob
 	import math
 	import argparse
@@ -179,6 +178,10 @@ except ImportError as e:
 	sys.stderr.write("WARNING: Module not found, full error:\n\n")
 	sys.stderr.write(e)
 
+# Replays are parsed with the algo's decoder, which uses orjson when it is installed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, "ham_dog_v3"))
+from gamelib.util import decode_json
+
 try:
 	import matplotlib.pyplot as plt
 	plt_installed = True
@@ -467,7 +470,7 @@ class Replay:
 				line = line.replace("\t", "")
 
 				if (line != ''):
-					data = json.loads(line)
+					data = decode_json(line)
 
 					try:
 						data['debug']
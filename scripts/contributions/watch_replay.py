@@ -190,7 +190,6 @@ try:
 	import os
 	import sys
 	import time
-	import json
 	import glob
 	import random
 	import warnings
@@ -201,6 +200,10 @@ except ImportError as e:
 	sys.stderr.write("WARNING: Module not found, full error:\n\n")
 	sys.stderr.write(e)
 
+# Replays are parsed with the algo's decoder, which uses orjson when it is installed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, "ham_dog_v3"))
+from gamelib.util import decode_json
+
 try:
 	import matplotlib.pyplot as plt
 	import matplotlib.animation as animation
@@ -1170,7 +1173,7 @@ class Replay:
 				line = line.replace("\t", "")
 
 				if (line != ''):
-					data = json.loads(line)
+					data = decode_json(line)
 
 					try:
 						data['debug']